@@ -0,0 +1,135 @@
+"""
+Request-scoped access context: the role and location a request is scoped to.
+
+The permission classes, viewsets and dashboards all need the same facts about the
+user: their role, the location an admin manages (or a client's home location),
+and from those the tasks, reports and users they may see. get_access(request)
+resolves them once and keeps the AccessContext on the request, so every consumer
+of the request shares it.
+
+An admin's location comes from their AdminLocation. CachedTokenAuthentication and
+StatelessJWTAuthentication put it on the user, so resolving it is free; otherwise
+it costs one query. Location codes come from the location registry, so scoping a
+request takes at most one query.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+
+from .locations import location_registry
+from .models import User, AdminLocation
+from tasks.models import Task, TaskReport
+
+
+class AccessContext:
+    """What the user of one request is scoped to, with the querysets they may see"""
+
+    def __init__(self, user):
+        self.user = user
+        self.user_id = user.pk
+        self.role = getattr(user, 'role', None) if user.is_authenticated else None
+        if self.is_admin():
+            self.location_id = self._admin_location_id()
+        elif self.is_client():
+            self.location_id = user.home_location_id
+        else:
+            self.location_id = None
+
+    def _admin_location_id(self):
+        if User.assigned_location.is_cached(self.user):
+            try:
+                return self.user.assigned_location.location_id
+            except AdminLocation.DoesNotExist:
+                return None
+        return AdminLocation.objects.filter(admin_id=self.user_id).values_list('location_id', flat=True).first()
+
+    def is_superadmin(self):
+        return self.role == User.Role.SUPERADMIN
+
+    def is_admin(self):
+        return self.role == User.Role.ADMIN
+
+    def is_client(self):
+        return self.role == User.Role.CLIENT
+
+    def is_manager(self):
+        """Admins and SuperAdmins, who may manage tasks and review reports"""
+        return self.is_admin() or self.is_superadmin()
+
+    @property
+    def location_code(self):
+        """Location.name (a StateName code) of location_id, or None"""
+        return location_registry.code(self.location_id)
+
+    def task_filter(self):
+        """Q over Task of what the user can see, or None when they can see nothing"""
+        if self.is_superadmin():
+            return Q()
+        if self.is_admin():
+            return Q(location_id=self.location_id) if self.location_id is not None else None
+        if self.is_client():
+            return Q(assigned_to_id=self.user_id)
+        return None
+
+    def report_filter(self):
+        """Q over TaskReport of what the user can see, or None when they can see nothing"""
+        if self.is_superadmin():
+            return Q()
+        if self.is_admin():
+            return Q(task__location_id=self.location_id) if self.location_id is not None else None
+        if self.is_client():
+            return Q(submitted_by_id=self.user_id)
+        return None
+
+    def user_filter(self):
+        """Q over User of what the user can see, or None when they can see nothing"""
+        if self.is_superadmin():
+            return Q()
+        if self.is_admin():
+            return self.client_filter()
+        if self.is_client():
+            return Q(id=self.user_id)
+        return None
+
+    def client_filter(self):
+        """Q over User of the clients the user can assign tasks to, or None"""
+        if self.is_superadmin():
+            return Q(role=User.Role.CLIENT)
+        if self.is_admin() and self.location_id is not None:
+            return Q(role=User.Role.CLIENT, home_location_id=self.location_id)
+        return None
+
+    def tasks(self):
+        return scoped(Task.objects.all(), self.task_filter())
+
+    def reports(self):
+        return scoped(TaskReport.objects.all(), self.report_filter())
+
+    def users(self):
+        return scoped(User.objects.all(), self.user_filter())
+
+    def clients(self):
+        return scoped(User.objects.all(), self.client_filter())
+
+
+def scoped(queryset, condition):
+    return queryset.none() if condition is None else queryset.filter(condition)
+
+
+def get_access(request):
+    """The AccessContext of request.user, resolved once per request"""
+    http_request = getattr(request, '_request', request)
+    user = request.user
+    access = getattr(http_request, '_access_context', None)
+    if access is None or access.user is not user:
+        access = AccessContext(user)
+        http_request._access_context = access
+    return access
+
+
+async def aget_access(request):
+    """get_access for async views; resolving a new context may query, so it runs in a thread"""
+    http_request = getattr(request, '_request', request)
+    access = getattr(http_request, '_access_context', None)
+    if access is not None and access.user is request.user:
+        return access
+    return await sync_to_async(get_access)(request)
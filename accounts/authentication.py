@@ -0,0 +1,237 @@
+"""
+Request authentication: DB tokens with a per-process cache, and stateless JWTs.
+
+DRF's TokenAuthentication looks up Token JOIN User on every request, which for
+the polling mobile clients is the most frequent query. CachedTokenAuthentication
+instead keeps a record for each token in a bounded LRU cache with a TTL. The
+record holds the user's row plus the admin's AdminLocation ids. On a hit, a fresh
+User is built from the record with assigned_location already set, so the role
+and location checks in get_queryset run without a query.
+
+Signal receivers (accounts.signals) drop a user's record when their token is
+deleted, their user row is saved (deactivation, role or location change) or
+their AdminLocation changes. Those receivers only reach the process that made
+the write. Other workers, and writes that bypass signals such as
+QuerySet.update, are caught up by the TTL (AUTH_TOKEN_CACHE_TTL seconds).
+
+StatelessJWTAuthentication reads the user from the claims of a signed access
+token (user_id, role, home and assigned location ids) and never queries the
+database. Access tokens are short-lived. A role or location change, or a
+deactivation, takes effect when the token is refreshed: JWTRefreshView reloads
+the user, reissues the claims and denylists the old refresh token.
+AUTH_SCHEME in settings picks the scheme(s) in use.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User, AdminLocation
+
+USER_FIELDS = tuple(field.attname for field in User._meta.concrete_fields)
+
+
+class TokenCache:
+    """Bounded LRU of token key -> record, with a TTL and hit/miss counters"""
+
+    def __init__(self, max_size=None, ttl=None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_user = {}
+        # Bumped by every invalidation, so a record read before one is not cached after it
+        self.generation = 0
+        self.reset_stats()
+
+    @property
+    def max_size(self):
+        return self._max_size or getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, record, generation):
+        """Cache a record loaded while token_cache.generation was `generation`"""
+        user_id = record['user_id']
+        with self.lock:
+            if generation != self.generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, record)
+            self.keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Drop the records of every token of a user"""
+        with self.lock:
+            self.generation += 1
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_key(self, key):
+        with self.lock:
+            self.generation += 1
+            if key in self.entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        _, record = self.entries.pop(key)
+        user_id = record['user_id']
+        keys = self.keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_user[user_id]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+    def reset_stats(self):
+        with self.lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+token_cache = TokenCache()
+
+
+def load_record(key):
+    """The token's record from one Token JOIN User LEFT JOIN AdminLocation query, or None"""
+    row = (
+        Token.objects.filter(key=key)
+        .values_list(
+            'created', 'user__assigned_location__location_id',
+            *(f'user__{name}' for name in USER_FIELDS),
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    created, location_id, *user = row
+    return {
+        'user_id': user[USER_FIELDS.index('id')],
+        'created': created,
+        'location_id': location_id,
+        'user': tuple(user),
+    }
+
+
+def build_user(values, location_id):
+    """
+    A new User for this request from {attname: value} (other fields are deferred), with
+    assigned_location set from the admin's location id, or cached as missing, so that
+    reading it needs no query
+    """
+    # from_db takes the values in concrete field order
+    field_names = [name for name in USER_FIELDS if name in values]
+    user = User.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+    if location_id is not None:
+        user.assigned_location = AdminLocation.from_db(
+            DEFAULT_DB_ALIAS, ['admin_id', 'location_id'], [user.id, location_id],
+        )
+    else:
+        User.assigned_location.related.set_cached_value(user, None)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that serves repeat tokens from token_cache"""
+
+    def authenticate_credentials(self, key):
+        record = token_cache.get(key)
+        if record is None:
+            generation = token_cache.generation
+            record = load_record(key)
+            if record is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(key, record, generation)
+
+        user = build_user(dict(zip(USER_FIELDS, record['user'])), record['location_id'])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        token = Token(key=key, user=user, created=record['created'])
+        return (user, token)
+
+
+def jwt_claims(user):
+    """Claims that let StatelessJWTAuthentication rebuild the user without a query"""
+    try:
+        location_id = user.assigned_location.location_id
+    except AdminLocation.DoesNotExist:
+        location_id = None
+    return {
+        'username': user.username,
+        'role': user.role,
+        'home_location_id': user.home_location_id,
+        'location_id': location_id,
+    }
+
+
+def issue_jwt(user):
+    """A new refresh token (recorded for the denylist) and its access token"""
+    refresh = RefreshToken.for_user(user)
+    for claim, value in jwt_claims(user).items():
+        refresh[claim] = value
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWT access token authentication with the user built from the claims"""
+
+    def get_user(self, validated_token):
+        try:
+            values = {
+                'id': validated_token['user_id'],
+                'username': validated_token['username'],
+                'role': validated_token['role'],
+                'home_location_id': validated_token['home_location_id'],
+                # Tokens are only issued to active users; deactivation takes effect at refresh
+                'is_active': True,
+            }
+            location_id = validated_token['location_id']
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        return build_user(values, location_id)
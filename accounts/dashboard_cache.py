@@ -0,0 +1,123 @@
+"""
+Versioned response cache for the dashboard endpoints.
+
+Cached payloads are keyed on (view, role, location or user id, data version). The data
+version is a single counter in the shared cache that signal receivers bump
+whenever a Task, TaskReport, User or AdminLocation is written, so a stale payload
+is never looked up again and no explicit key deletion is needed. With the
+local-memory backend each worker keeps its own version; point
+DASHBOARD_CACHE_ALIAS at a file-based (or other shared) cache when running
+several workers so a write in one worker invalidates all of them.
+"""
+import functools
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .access import get_access
+
+DATA_VERSION_KEY = 'dashboard:data-version'
+HITS_KEY = 'dashboard:hits'
+MISSES_KEY = 'dashboard:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'default')]
+
+
+def _incr(cache, key, start=0):
+    """Increment a counter in the cache, starting it at `start` if it is missing"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing or evicted: add() keeps whichever worker created it first
+        cache.add(key, start + 1, timeout=None)
+        return cache.get(key, start + 1)
+
+
+def get_data_version():
+    cache = get_cache()
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        # Start from the clock so payloads cached under an evicted version are never reused
+        cache.add(DATA_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(DATA_VERSION_KEY)
+    return version
+
+
+def bump_data_version():
+    """Invalidate every cached dashboard payload"""
+    return _incr(get_cache(), DATA_VERSION_KEY, start=time.time_ns())
+
+
+def get_scope(access):
+    """Return the part of the cache key that decides who shares a payload"""
+    if access.is_superadmin():
+        return 'all'
+    elif access.is_admin():
+        return f'location:{access.location_id}'
+    return f'user:{access.user_id}'
+
+
+def get_stats():
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else 0,
+        'data_version': cache.get(DATA_VERSION_KEY),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def lookup(view, request):
+    """(cache key, cached payload or None) of a dashboard request, counting the hit or miss"""
+    cache = get_cache()
+    access = get_access(request)
+    key = f'dashboard:{type(view).__name__}:{access.role}:{get_scope(access)}:{get_data_version()}'
+    payload = cache.get(key)
+    _incr(cache, HITS_KEY if payload is not None else MISSES_KEY)
+    return key, payload
+
+
+def store(key, response):
+    if response.status_code == 200:
+        timeout = getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+        get_cache().set(key, response.data, timeout=timeout)
+
+
+def cached_dashboard(view_method):
+    """
+    Cache the payload of a dashboard view's successful GET responses.
+    The role check in the view still runs on a miss, and only 200 responses are stored.
+    Async view methods are wrapped too, with the cache calls run in a thread.
+    """
+    if iscoroutinefunction(view_method):
+        @functools.wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            key, payload = await sync_to_async(lookup)(self, request)
+            if payload is not None:
+                return Response(payload)
+            response = await view_method(self, request, *args, **kwargs)
+            await sync_to_async(store)(key, response)
+            return response
+        return async_wrapper
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key, payload = lookup(self, request)
+        if payload is not None:
+            return Response(payload)
+        response = view_method(self, request, *args, **kwargs)
+        store(key, response)
+        return response
+    return wrapper
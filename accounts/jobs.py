@@ -0,0 +1,79 @@
+"""
+Background jobs of the accounts app, run by manage.py run_workers (see tasks.jobqueue).
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from tasks.jobqueue import job, LOW
+from .models import User
+
+# Formats make_thumbnail writes; other files get no thumbnail
+THUMBNAIL_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def make_thumbnail(field_file, max_size):
+    """
+    A copy of the stored image of field_file downscaled to fit max_size x max_size, as
+    bytes in its own format, or None when it is not an image handled here
+    """
+    try:
+        with field_file.open('rb'):
+            image = Image.open(field_file)
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        return None
+    image_format = image.format
+    if image_format not in THUMBNAIL_FORMATS or getattr(image, 'is_animated', False):
+        return None
+
+    # Phone photos carry their orientation in EXIF, which the re-encoded copy drops
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    options = {'quality': 85, 'optimize': True} if image_format == 'JPEG' else {'optimize': True}
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def save_thumbnail(queryset, field_name, thumbnail_field_name, max_size, **updates):
+    """
+    Store a thumbnail of the file in field_name of the object in queryset, which should
+    select it by that file's current name, in thumbnail_field_name. The uploaded file is
+    only read. The previous thumbnail is deleted once the row points at the new one (or at
+    none, when the file is not an image); if the row has moved on to another file
+    meanwhile, the new thumbnail is deleted instead. True when the row was updated.
+    """
+    instance = queryset.only('pk', field_name, thumbnail_field_name).first()
+    if instance is None:
+        return False
+    field_file = getattr(instance, field_name)
+    thumbnail = getattr(instance, thumbnail_field_name)
+    previous_name = thumbnail.name
+    new_name = None
+    content = make_thumbnail(field_file, max_size)
+    if content is not None:
+        name = thumbnail.field.generate_filename(instance, os.path.basename(field_file.name))
+        new_name = thumbnail.storage.save(name, ContentFile(content))
+    if not new_name and not previous_name:
+        return False
+    if queryset.update(**{thumbnail_field_name: new_name}, **updates):
+        if previous_name:
+            thumbnail.storage.delete(previous_name)
+        return True
+    if new_name:
+        thumbnail.storage.delete(new_name)
+    return False
+
+
+@job(priority=LOW)
+def make_profile_picture_thumbnail(user_id, name):
+    """Store a PROFILE_PICTURE_THUMBNAIL_SIZE thumbnail of an uploaded profile picture"""
+    # Matching on the name skips users that are gone or have uploaded another picture
+    save_thumbnail(
+        User.objects.filter(pk=user_id, profile_picture=name), 'profile_picture', 'profile_picture_thumbnail',
+        settings.PROFILE_PICTURE_THUMBNAIL_SIZE,
+    )
@@ -0,0 +1,162 @@
+"""
+Process-local registry of Location reference data.
+
+There are only a few dozen Location rows and they change only when a SuperAdmin
+edits them, but views, serializers and metrics resolve them by id, code
+(Location.name) or display name on most requests. location_registry loads every
+row with one query on first use and answers those lookups from memory, handing
+out a fresh Location instance each time so callers never share one.
+
+Signal receivers (accounts.signals) drop the loaded rows when a Location is
+saved or deleted, and bump a version counter in the shared cache
+(LOCATION_REGISTRY_CACHE_ALIAS). Other workers compare their loaded version with
+it at most every LOCATION_REGISTRY_CHECK_INTERVAL seconds and reload when it has
+moved; that only reaches them when the cache is shared between processes. A
+lookup that misses reads the row from the database and merges it into the loaded
+rows, so a Location created by another worker is found even without a shared cache.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Location
+
+VERSION_KEY = 'locations:version'
+
+LOCATION_FIELDS = tuple(field.attname for field in Location._meta.concrete_fields)
+ID, CODE = LOCATION_FIELDS.index('id'), LOCATION_FIELDS.index('name')
+
+
+class LocationRegistry:
+    """Every Location row, indexed by id and by code"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+        self.rows = None
+        self.reloads = 0
+        # Bumped by every invalidation, so rows read before one are not kept after it
+        self.generation = 0
+
+    def get_cache(self):
+        return caches[getattr(settings, 'LOCATION_REGISTRY_CACHE_ALIAS', 'default')]
+
+    def shared_version(self):
+        cache = self.get_cache()
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # Start from the clock so a worker never matches a version from before an eviction
+            cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _load(self):
+        """The loaded rows, reloading them if this worker or another has written a Location"""
+        now = time.monotonic()
+        interval = getattr(settings, 'LOCATION_REGISTRY_CHECK_INTERVAL', 5)
+        rows = self.rows
+        if rows is not None and now - self.checked_at < interval:
+            return rows
+        version = self.shared_version()
+        with self.lock:
+            self.checked_at = now
+            if self.rows is not None and version == self.version:
+                return self.rows
+            generation = self.generation
+        values = list(Location.objects.order_by('name').values_list(*LOCATION_FIELDS))
+        rows = {
+            'by_id': {row[ID]: row for row in values},
+            'by_code': {row[CODE]: row for row in values},
+        }
+        with self.lock:
+            if generation == self.generation:
+                self.rows = rows
+                self.version = version
+            self.reloads += 1
+        return rows
+
+    def _fetch(self, field, keys):
+        """Read the rows with field in keys from the database and merge them into the loaded rows"""
+        try:
+            values = list(Location.objects.filter(**{f'{field}__in': keys}).values_list(*LOCATION_FIELDS))
+        except (TypeError, ValueError):
+            # Not a valid id, so not a row either
+            return []
+        if values:
+            with self.lock:
+                if self.rows is not None:
+                    by_id = {**self.rows['by_id'], **{row[ID]: row for row in values}}
+                    by_id = dict(sorted(by_id.items(), key=lambda item: item[1][CODE]))
+                    self.rows = {'by_id': by_id, 'by_code': {row[CODE]: row for row in by_id.values()}}
+        return values
+
+    def _find(self, index, key):
+        row = self._load()[index].get(key)
+        if row is None:
+            # It may have been created by another worker, whose invalidation may not reach this one
+            field, position = ('id', ID) if index == 'by_id' else ('name', CODE)
+            row = next((row for row in self._fetch(field, [key]) if row[position] == key), None)
+        return row
+
+    def invalidate(self):
+        """Drop the loaded rows here and make every other worker reload on its next check"""
+        with self.lock:
+            self.rows = None
+            self.generation += 1
+        cache = self.get_cache()
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+    def get(self, location_id):
+        """A new Location for an id, or None"""
+        if location_id is None:
+            return None
+        return instance(self._find('by_id', location_id))
+
+    def by_code(self, code):
+        """A new Location for a code such as 'TAMIL_NADU', or None"""
+        return instance(self._find('by_code', code))
+
+    def resolve(self, value):
+        """A new Location for a code or display name such as "Tamil Nadu", in any case, or None"""
+        code = Location.code_for(value)
+        return self.by_code(code) if code else None
+
+    def in_bulk(self, location_ids):
+        """{id: Location} of the ids that exist"""
+        rows = self._load()['by_id']
+        missing = [location_id for location_id in location_ids if location_id not in rows]
+        if missing:
+            rows = {**rows, **{row[ID]: row for row in self._fetch('id', missing)}}
+        return {location_id: instance(rows[location_id]) for location_id in location_ids if location_id in rows}
+
+    def all(self):
+        """Every Location, ordered by code"""
+        return [instance(row) for row in self._load()['by_id'].values()]
+
+    def code(self, location_id):
+        """The code (Location.name) of a location id, or None"""
+        row = self._find('by_id', location_id) if location_id is not None else None
+        return row[CODE] if row else None
+
+    def display_name(self, location_id):
+        """The display name of a location id, such as "Tamil Nadu", or None"""
+        location = self.get(location_id)
+        return location.get_name_display() if location else None
+
+    def codes(self):
+        """{id: code} of every location"""
+        return {location_id: row[CODE] for location_id, row in self._load()['by_id'].items()}
+
+
+def instance(row):
+    return Location.from_db(DEFAULT_DB_ALIAS, LOCATION_FIELDS, row) if row else None
+
+
+location_registry = LocationRegistry()
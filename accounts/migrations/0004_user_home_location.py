@@ -0,0 +1,56 @@
+# Generated by Django 5.0.2 on 2026-10-17 04:22
+
+import logging
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_home_location(apps, schema_editor):
+    """Point home_location at the Location named by the legacy location string"""
+    User = apps.get_model('accounts', 'User')
+    Location = apps.get_model('accounts', 'Location')
+    
+    codes = {}
+    for code, display_name in Location._meta.get_field('name').choices:
+        codes[code.lower()] = code
+        codes[str(display_name).lower()] = code
+    locations = {location.name: location.id for location in Location.objects.all()}
+    
+    unmatched = {}
+    for value in User.objects.exclude(location__isnull=True).exclude(location='').values_list('location', flat=True).distinct():
+        location_id = locations.get(codes.get(value.strip().lower()))
+        if location_id:
+            User.objects.filter(location=value).update(home_location_id=location_id)
+        else:
+            unmatched[value] = User.objects.filter(location=value).count()
+    
+    for value, count in sorted(unmatched.items()):
+        logger.warning("Unmatched User.location %r on %d user(s), home_location left empty", value, count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_hot_query_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='user_role_location_idx',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='home_location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='users', to='accounts.location'),
+        ),
+        migrations.RunPython(backfill_home_location, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'home_location'], name='user_role_home_location_idx'),
+        ),
+    ]
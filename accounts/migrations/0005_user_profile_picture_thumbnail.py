@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-17 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_home_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_picture_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='profile_pics/thumbnails/'),
+        ),
+    ]
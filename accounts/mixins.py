@@ -0,0 +1,79 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+
+class EagerLoadingMixin:
+    """
+    Apply the select_related / prefetch_related declared per action on a viewset.
+
+    `eager_loading` maps an action name (or 'default' for every other action) to a
+    dict with optional 'select_related' and 'prefetch_related' sequences, so each
+    action loads exactly the relations its serializer reads.
+    """
+    eager_loading = {}
+
+    def get_eager_loading(self):
+        return self.eager_loading.get(self.action) or self.eager_loading.get('default', {})
+
+    def apply_eager_loading(self, queryset):
+        loading = self.get_eager_loading()
+        if loading.get('select_related'):
+            queryset = queryset.select_related(*loading['select_related'])
+        if loading.get('prefetch_related'):
+            queryset = queryset.prefetch_related(*loading['prefetch_related'])
+        return queryset
+
+    def filter_queryset(self, queryset):
+        return self.apply_eager_loading(super().filter_queryset(queryset))
+
+
+class AsyncDispatchMixin:
+    """
+    Serve an APIView or viewset from an async view under ASGI (see adminportal.urls_asgi).
+
+    as_async_view() returns a coroutine view. Authentication, permissions and
+    throttling run in a thread, since they may query the database. The handler for the
+    method then runs natively when it is a coroutine function (an `aget` next to `get`,
+    or an `alist` next to a viewset's `list` action), and in a thread otherwise.
+    as_view() is unchanged, so WSGI keeps serving the sync handlers.
+    """
+    asynchronous = False
+
+    @classmethod
+    def as_async_view(cls, *args, **initkwargs):
+        return markcoroutinefunction(cls.as_view(*args, asynchronous=True, **initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.asynchronous:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch with an awaited handler"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            method = request.method.lower()
+            if method in self.http_method_names:
+                # A viewset action such as list is served by its async twin, alist, when there is one
+                action = getattr(self, 'action', None)
+                handler = (
+                    (action and getattr(self, f'a{action}', None))
+                    or getattr(self, f'a{method}', None)
+                    or getattr(self, method, self.http_method_not_allowed)
+                )
+            else:
+                handler = self.http_method_not_allowed
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
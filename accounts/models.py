@@ -17,9 +17,52 @@ class User(AbstractUser):
     )
     
     # Additional fields
+    # Legacy display name of the user's state (e.g. "Tamil Nadu"), kept in step with home_location
     location = models.CharField(max_length=100, blank=True, null=True)
+    home_location = models.ForeignKey(
+        'Location',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='users'
+    )
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Downscaled copy of profile_picture, written by a background job (accounts.jobs)
+    profile_picture_thumbnail = models.ImageField(upload_to='profile_pics/thumbnails/', blank=True, null=True)
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Clients per location for admin scoping and dashboard counts
+            models.Index(fields=['role', 'home_location'], name='user_role_home_location_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = (
+            instance.__dict__.get('location'),
+            instance.__dict__.get('home_location_id'),
+        )
+        return instance
+    
+    def save(self, *args, **kwargs):
+        self.sync_home_location()
+        super().save(*args, **kwargs)
+        self._loaded_location = (self.location, self.home_location_id)
+    
+    def sync_home_location(self):
+        """Keep the legacy location string and home_location pointing at the same state"""
+        from .locations import location_registry
+        
+        loaded_location, loaded_home_location_id = getattr(self, '_loaded_location', (None, None))
+        location_changed = self.location != loaded_location
+        home_location_changed = self.home_location_id != loaded_home_location_id
+        
+        if location_changed and not home_location_changed:
+            self.home_location = location_registry.resolve(self.location)
+        elif self.home_location_id and (home_location_changed or not self.location):
+            self.location = location_registry.display_name(self.home_location_id)
     
     def is_superadmin(self):
         return self.role == self.Role.SUPERADMIN
@@ -48,6 +91,17 @@ class Location(models.Model):
     
     def __str__(self):
         return self.get_name_display()
+    
+    @classmethod
+    def code_for(cls, value):
+        """Return the state code for a code or display name such as "Tamil Nadu", or None"""
+        if not value:
+            return None
+        value = value.strip().lower()
+        for code, display_name in cls.StateName.choices:
+            if value in (code.lower(), str(display_name).lower()):
+                return code
+        return None
         
 class AdminLocation(models.Model):
     """Model for mapping admins to their managed locations"""
@@ -1,39 +1,58 @@
 from rest_framework import serializers
+from adminportal.instrumentation import TimedSerializerMixin
 from django.contrib.auth import get_user_model
+from tasks.jobqueue import enqueue_on_commit
+from .jobs import make_profile_picture_thumbnail
 from .models import Location, AdminLocation
 
 User = get_user_model()
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for User model"""
     password = serializers.CharField(write_only=True)
     
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'password', 
-                  'role', 'location', 'phone_number', 'profile_picture']
+                  'role', 'location', 'home_location', 'phone_number', 'profile_picture',
+                  'profile_picture_thumbnail']
         extra_kwargs = {'password': {'write_only': True}}
+        read_only_fields = ['profile_picture_thumbnail']
     
     def create(self, validated_data):
         password = validated_data.pop('password')
         user = User(**validated_data)
         user.set_password(password)
         user.save()
+        self.thumbnail_uploaded_picture(user, validated_data)
         return user
     
     def update(self, instance, validated_data):
         if 'password' in validated_data:
             password = validated_data.pop('password')
             instance.set_password(password)
-        return super().update(instance, validated_data)
+        user = super().update(instance, validated_data)
+        self.thumbnail_uploaded_picture(user, validated_data)
+        return user
+    
+    @staticmethod
+    def thumbnail_uploaded_picture(user, validated_data):
+        """Queue the thumbnail of a newly uploaded profile picture, after the user's write commits"""
+        if validated_data.get('profile_picture'):
+            name = user.profile_picture.name
+            enqueue_on_commit(
+                make_profile_picture_thumbnail,
+                {'user_id': user.pk, 'name': name},
+                idempotency_key=f'profile-picture-thumbnail:{user.pk}:{name}',
+            )
 
-class LocationSerializer(serializers.ModelSerializer):
+class LocationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Location model"""
     class Meta:
         model = Location
         fields = ['id', 'name', 'description', 'created_at']
 
-class AdminLocationSerializer(serializers.ModelSerializer):
+class AdminLocationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for AdminLocation model"""
     admin_username = serializers.CharField(source='admin.username', read_only=True)
     location_name = serializers.CharField(source='location.name', read_only=True)
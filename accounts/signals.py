@@ -0,0 +1,56 @@
+import functools
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from rest_framework.authtoken.models import Token
+from .models import User, Location, AdminLocation
+from .authentication import token_cache
+from .dashboard_cache import bump_data_version
+from .locations import location_registry
+from tasks.models import Task, TaskReport
+from tasks.signals import tasks_bulk_changed
+
+# Models whose writes can change what the dashboards return
+DASHBOARD_SOURCES = (Task, TaskReport, User, Location, AdminLocation)
+
+
+def invalidate_dashboards(sender, **kwargs):
+    """Bump the dashboard data version once the write commits, so cached payloads are recomputed"""
+    # Bumping inside the transaction would let a concurrent request cache the data (and the
+    # task stats counters, updated after post_save) from before the commit under the new version
+    transaction.on_commit(bump_data_version)
+
+
+for model in DASHBOARD_SOURCES:
+    post_save.connect(invalidate_dashboards, sender=model, dispatch_uid=f'dashboard-save-{model.__name__}')
+    post_delete.connect(invalidate_dashboards, sender=model, dispatch_uid=f'dashboard-delete-{model.__name__}')
+tasks_bulk_changed.connect(invalidate_dashboards, dispatch_uid='dashboard-bulk-tasks')
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Drop cached token records after a user or their AdminLocation changes, and again once the write commits"""
+    # A request that reads the row before the commit can cache it again in between
+    user_id = instance.admin_id if sender is AdminLocation else instance.pk
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(functools.partial(token_cache.invalidate_user, user_id))
+
+
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate_key(instance.key)
+    transaction.on_commit(functools.partial(token_cache.invalidate_key, instance.key))
+
+
+for model in (User, AdminLocation):
+    post_save.connect(invalidate_user_tokens, sender=model, dispatch_uid=f'token-cache-save-{model.__name__}')
+    post_delete.connect(invalidate_user_tokens, sender=model, dispatch_uid=f'token-cache-delete-{model.__name__}')
+post_delete.connect(invalidate_token, sender=Token, dispatch_uid='token-cache-delete-token')
+
+
+def invalidate_locations(sender, **kwargs):
+    """Drop the location registry now, and again once the write commits"""
+    location_registry.invalidate()
+    transaction.on_commit(location_registry.invalidate)
+
+
+post_save.connect(invalidate_locations, sender=Location, dispatch_uid='location-registry-save')
+post_delete.connect(invalidate_locations, sender=Location, dispatch_uid='location-registry-delete')
@@ -1,3 +1,826 @@
-from django.test import TestCase
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .authentication import TokenCache, token_cache
+from .locations import LocationRegistry, location_registry
+from .models import User, Location, AdminLocation
+from adminportal.instrumentation import RequestMetrics, route_stats
+from adminportal.metrics import MetricsRegistry
+from adminportal.middleware import track_queries
+from . import dashboard_cache
+from tasks import jobqueue
+from tasks.models import Task, TaskReport, Job
+
+
+def setUpModule():
+    # Keep the line logged per request out of the test output (assertLogs still captures it)
+    logger = logging.getLogger('adminportal.middleware')
+    handlers, logger.handlers = logger.handlers, [logging.NullHandler()]
+    unittest.addModuleCleanup(setattr, logger, 'handlers', handlers)
+
+
+class SuperAdminDashboardQueryCountTest(TestCase):
+    """The SuperAdmin dashboard must issue a fixed number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        cls.locations = [
+            Location.objects.create(name=code) for code, _ in Location.StateName.choices
+        ]
+        for index, location in enumerate(cls.locations):
+            admin = User.objects.create(username=f'admin{index}', role=User.Role.ADMIN)
+            AdminLocation.objects.create(admin=admin, location=location)
+            client = User.objects.create(
+                username=f'client{index}',
+                role=User.Role.CLIENT,
+                location=location.get_name_display(),
+            )
+            for task_status in (Task.Status.PENDING, Task.Status.COMPLETED):
+                task = Task.objects.create(
+                    title=f'Task {index}',
+                    description='Test task',
+                    location=location,
+                    assigned_by=admin,
+                    assigned_to=client,
+                    deadline=timezone.now() + timedelta(days=3),
+                    status=task_status,
+                )
+            TaskReport.objects.create(task=task, submitted_by=client, report_text='Done')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.superadmin)
+
+    def get_dashboard(self):
+        dashboard_cache.bump_data_version()  # Measure the uncached path
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/dashboard/superadmin/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_location_stats(self):
+        response, _ = self.get_dashboard()
+        self.assertEqual(response.data['total_admins'], 4)
+        self.assertEqual(response.data['total_clients'], 4)
+        self.assertEqual(response.data['active_tasks'], 4)
+        self.assertEqual(response.data['completed_tasks'], 4)
+        stats = {stat['code']: stat for stat in response.data['locations']}
+        self.assertEqual(stats['TAMIL_NADU']['admin_count'], 1)
+        self.assertEqual(stats['TAMIL_NADU']['client_count'], 1)
+        self.assertEqual(stats['TAMIL_NADU']['task_count'], 2)
+        self.assertEqual(stats['TAMIL_NADU']['performance'], 0.5)
+        self.assertEqual(len(response.data['recent_activities']), 5)
+
+    def test_query_count_is_constant_in_number_of_admins(self):
+        _, baseline = self.get_dashboard()
+
+        User.objects.bulk_create(
+            User(username=f'extra-admin{index}', role=User.Role.ADMIN)
+            for index in range(3996)
+        )
+        response, queries = self.get_dashboard()
+
+        self.assertEqual(response.data['total_admins'], 4000)
+        self.assertEqual(len(response.data['admin_users']), 4000)
+        self.assertEqual(queries, baseline)
+
+
+class DashboardCacheTest(TestCase):
+    """Dashboard payloads are served from cache until relevant data changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name=Location.StateName.TELANGANA)
+        cls.admin = User.objects.create(username='tsadmin', role=User.Role.ADMIN, location='Telangana')
+        AdminLocation.objects.create(admin=cls.admin, location=cls.location)
+        cls.client_user = User.objects.create(username='tsclient1', role=User.Role.CLIENT, location='Telangana')
+
+    def setUp(self):
+        dashboard_cache.get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.client_user)
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/dashboard/client/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/dashboard/client/')
+        self.assertEqual(first.data, second.data)
+        stats = dashboard_cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_task_write_invalidates_cache(self):
+        self.assertEqual(self.client.get('/api/dashboard/client/').data['assigned_tasks'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(
+                title='New task',
+                description='Test task',
+                location=self.location,
+                assigned_by=self.admin,
+                assigned_to=self.client_user,
+                deadline=timezone.now() + timedelta(days=1),
+            )
+        self.assertEqual(self.client.get('/api/dashboard/client/').data['assigned_tasks'], 1)
+
+    def test_version_moves_only_when_the_write_commits(self):
+        version = dashboard_cache.get_data_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client_user.save()
+            # A request now would cache data from before the commit
+            self.assertEqual(dashboard_cache.get_data_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(dashboard_cache.get_data_version(), version)
+
+    def test_payloads_are_not_shared_between_views_or_roles(self):
+        self.client.get('/api/dashboard/client/')
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/dashboard/client/').status_code, 403)
+        self.assertIn('total_clients', self.client.get('/api/dashboard/admin/').data)
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            file_cache = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir}
+            with override_settings(CACHES={'default': file_cache}):
+                self.client.get('/api/dashboard/client/')
+                with self.assertNumQueries(0):
+                    self.client.get('/api/dashboard/client/')
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client_user.save()
+                self.client.get('/api/dashboard/client/')
+                self.assertEqual(dashboard_cache.get_stats()['misses'], 2)
+
+
+class AsyncDashboardTest(TestCase):
+    """Under ASGI the dashboards are served by async views with the same payloads"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name=Location.StateName.TELANGANA)
+        cls.superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        cls.admin = User.objects.create(username='tsadmin', role=User.Role.ADMIN, location='Telangana')
+        AdminLocation.objects.create(admin=cls.admin, location=cls.location)
+        cls.client_user = User.objects.create(username='tsclient1', role=User.Role.CLIENT, location='Telangana')
+        task = Task.objects.create(
+            title='Inspect site', description='Test task', location=cls.location, assigned_by=cls.admin,
+            assigned_to=cls.client_user, deadline=timezone.now() + timedelta(days=1),
+        )
+        TaskReport.objects.create(task=task, submitted_by=cls.client_user, report_text='Done')
+        cls.tokens = {user.role: Token.objects.create(user=user).key for user in (cls.superadmin, cls.admin, cls.client_user)}
+
+    async def get_both(self, path, role):
+        """The responses of the sync and the async view, both computed uncached"""
+        headers = {'Authorization': f'Token {self.tokens[role]}'}
+        await sync_to_async(dashboard_cache.bump_data_version)()
+        sync_response = await sync_to_async(self.client.get)(path, headers=headers)
+        await sync_to_async(dashboard_cache.bump_data_version)()
+        with self.settings(ROOT_URLCONF='adminportal.urls_asgi'):
+            async_response = await self.async_client.get(path, headers=headers)
+        return sync_response, async_response
+
+    def test_dashboard_routes_are_async(self):
+        for path in ('/api/dashboard/superadmin/', '/api/dashboard/admin/', '/api/dashboard/client/'):
+            self.assertTrue(iscoroutinefunction(resolve(path, urlconf='adminportal.urls_asgi').func))
+            self.assertFalse(iscoroutinefunction(resolve(path).func))
+
+    async def test_payloads_match_the_sync_views(self):
+        for path, role in (
+            ('/api/dashboard/superadmin/', User.Role.SUPERADMIN),
+            ('/api/dashboard/admin/', User.Role.ADMIN),
+            ('/api/dashboard/client/', User.Role.CLIENT),
+        ):
+            sync_response, async_response = await self.get_both(path, role)
+            self.assertEqual(async_response.status_code, 200)
+            sync_data, async_data = sync_response.json(), async_response.json()
+            for data in (sync_data, async_data):
+                # Random until the deadline analytics are real
+                for deadline in data.get('upcoming_deadlines', []):
+                    deadline.pop('days_left'), deadline.pop('is_urgent')
+            self.assertEqual(async_data, sync_data)
+        self.assertEqual(async_data['assigned_tasks'], 1)
+
+    async def test_roles_are_checked_and_payloads_cached(self):
+        _, response = await self.get_both('/api/dashboard/admin/', User.Role.CLIENT)
+        self.assertEqual(response.status_code, 403)
+        headers = {'Authorization': f'Token {self.tokens[User.Role.CLIENT]}'}
+        with self.settings(ROOT_URLCONF='adminportal.urls_asgi'):
+            await self.async_client.get('/api/dashboard/client/', headers=headers)
+            stats = await sync_to_async(dashboard_cache.get_stats)()
+            await self.async_client.get('/api/dashboard/client/', headers=headers)
+        self.assertEqual((await sync_to_async(dashboard_cache.get_stats)())['hits'], stats['hits'] + 1)
+
+
+class HomeLocationTest(TestCase):
+    """User.home_location and the legacy location string stay in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tamil_nadu = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.odisha = Location.objects.create(name=Location.StateName.ODISHA)
+
+    def test_location_string_sets_home_location(self):
+        user = User.objects.create(username='tnclient1', location='Tamil Nadu')
+        self.assertEqual(user.home_location, self.tamil_nadu)
+
+        user = User.objects.get(pk=user.pk)
+        user.location = 'ODISHA'
+        user.save()
+        self.assertEqual(user.home_location, self.odisha)
+
+    def test_home_location_sets_location_string(self):
+        user = User.objects.create(username='odclient1', home_location=self.odisha)
+        self.assertEqual(user.location, 'Odisha')
+
+        user = User.objects.get(pk=user.pk)
+        user.home_location = self.tamil_nadu
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).location, 'Tamil Nadu')
+
+    def test_unknown_location_string_is_kept(self):
+        user = User.objects.create(username='elsewhere', location='Kerala')
+        self.assertEqual(user.location, 'Kerala')
+        self.assertIsNone(user.home_location)
+
+    def test_backfill_logs_unmatched_location_strings(self):
+        User.objects.create(username='elsewhere', location='Kerala')
+        migration = importlib.import_module('accounts.migrations.0004_user_home_location')
+        with self.assertLogs(migration.logger.name, 'WARNING') as logs:
+            migration.backfill_home_location(apps, None)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("'Kerala' on 1 user(s)", logs.output[0])
+
+    def test_admin_sees_clients_by_home_location(self):
+        admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN)
+        AdminLocation.objects.create(admin=admin, location=self.tamil_nadu)
+        client = User.objects.create(username='tnclient1', location='Tamil Nadu')
+        User.objects.create(username='odclient1', location='Odisha')
+
+        api = APIClient()
+        api.force_authenticate(admin)
+        response = api.get('/api/users/clients/')
+        self.assertEqual([user['id'] for user in response.data], [client.id])
+        self.assertEqual(response.data[0]['location'], 'Tamil Nadu')
+        self.assertEqual(response.data[0]['home_location'], self.tamil_nadu.id)
+
+    def test_new_admin_is_written_once(self):
+        superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        api = APIClient()
+        api.force_authenticate(superadmin)
+        with CaptureQueriesContext(connection) as queries:
+            response = api.post('/api/users/', {
+                'username': 'tnadmin', 'password': 'secret-123', 'role': 'ADMIN', 'location_code': 'TAMIL_NADU',
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['home_location'], response.data['location']), (self.tamil_nadu.id, 'Tamil Nadu'))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "accounts_user"')])
+        self.assertTrue(AdminLocation.objects.filter(admin__username='tnadmin', location=self.tamil_nadu).exists())
+
+
+class ProfilePictureTest(TestCase):
+    """A background job makes the thumbnail of an uploaded profile picture once the request commits"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PROFILE_PICTURE_THUMBNAIL_SIZE=64)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='tnclient1')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def upload(self, size, image_format='PNG'):
+        image = BytesIO()
+        Image.new('RGB', size, 'blue').save(image, format=image_format)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.api.patch(f'/api/users/{self.user.id}/', {
+                'profile_picture': SimpleUploadedFile(f'me.{image_format.lower()}', image.getvalue()),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        return self.user.profile_picture.name
+
+    def image_size(self, field_file):
+        with field_file.open('rb'), Image.open(field_file) as image:
+            return image.size
+
+    def test_thumbnail_of_the_kept_upload(self):
+        original = self.upload((300, 150))
+        job = Job.objects.get()
+        self.assertEqual(
+            (job.name, job.kwargs), ('accounts.make_profile_picture_thumbnail', {'user_id': self.user.id, 'name': original}),
+        )
+
+        self.assertEqual(jobqueue.work(until_empty=True), (1, 0))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture.name, original)
+        self.assertEqual(self.image_size(self.user.profile_picture), (300, 150))
+        self.assertTrue(self.user.profile_picture_thumbnail.name.startswith('profile_pics/thumbnails/'))
+        self.assertEqual(self.image_size(self.user.profile_picture_thumbnail), (64, 32))
+        self.assertEqual(
+            self.api.get(f'/api/users/{self.user.id}/').data['profile_picture_thumbnail'],
+            f'http://testserver/media/{self.user.profile_picture_thumbnail.name}',
+        )
+
+    def test_new_upload_replaces_only_the_thumbnail(self):
+        first = self.upload((300, 300))
+        jobqueue.work(until_empty=True)
+        self.user.refresh_from_db()
+        first_thumbnail = self.user.profile_picture_thumbnail.name
+
+        replaced = self.upload((200, 200))
+        current = self.upload((100, 50), 'JPEG')
+        self.assertEqual(jobqueue.work(until_empty=True), (2, 0))
+        self.user.refresh_from_db()
+        storage = self.user.profile_picture.storage
+        # Uploads are never deleted, earlier thumbnails are; the replaced picture's job did nothing
+        self.assertTrue(all(storage.exists(name) for name in (first, replaced, current)))
+        self.assertFalse(storage.exists(first_thumbnail))
+        self.assertEqual(self.image_size(self.user.profile_picture_thumbnail), (64, 32))
+        self.assertEqual(len(os.listdir(os.path.dirname(self.user.profile_picture_thumbnail.path))), 1)
+
+
+class CachedTokenAuthenticationTest(TestCase):
+    """Token lookups are cached per process and dropped when the user or token changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tamil_nadu = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.odisha = Location.objects.create(name=Location.StateName.ODISHA)
+        cls.admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, home_location=cls.tamil_nadu)
+        AdminLocation.objects.create(admin=cls.admin, location=cls.tamil_nadu)
+        cls.tn_client = User.objects.create(username='tnclient1', home_location=cls.tamil_nadu)
+        cls.od_client = User.objects.create(username='odclient1', home_location=cls.odisha)
+        cls.token = Token.objects.create(user=cls.admin)
+
+    def setUp(self):
+        token_cache.clear()
+        token_cache.reset_stats()
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def client_ids(self):
+        response = self.api.get('/api/users/clients/')
+        return response.status_code, [user['id'] for user in response.data] if response.status_code == 200 else None
+
+    def test_repeat_requests_skip_the_token_query(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client_ids(), (200, [self.tn_client.id]))
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client_ids(), (200, [self.tn_client.id]))
+        # The token lookup, and the admin's location lookup in get_queryset, come from the cache
+        self.assertEqual(len(first), 1 + 1)
+        self.assertEqual(len(second), 1)
+        self.assertIn('authtoken_token', first[0]['sql'])
+        stats = token_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['size']), (1, 1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_admin_without_location_needs_no_query(self):
+        AdminLocation.objects.filter(admin=self.admin).delete()
+        token_cache.clear()
+        self.client_ids()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client_ids(), (200, []))
+        self.assertEqual(len(queries), 0)
+
+    def test_token_delete(self):
+        self.client_ids()
+        Token.objects.filter(key=self.token.key).first().delete()
+        self.assertEqual(self.client_ids()[0], 401)
+
+    def test_deactivation(self):
+        self.client_ids()
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertEqual(self.client_ids()[0], 401)
+
+    def test_record_cached_again_before_the_commit_is_dropped(self):
+        self.client_ids()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.admin.is_active = False
+            self.admin.save()
+            # A concurrent request still reading the active row from before the commit
+            token_cache.set(self.token.key, {'user_id': self.admin.id}, token_cache.generation)
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.client_ids()[0], 401)
+
+    def test_role_change(self):
+        self.client_ids()
+        self.admin.role = User.Role.CLIENT
+        self.admin.save()
+        self.assertEqual(self.client_ids()[0], 403)
+
+    def test_admin_location_change(self):
+        self.client_ids()
+        admin_location = AdminLocation.objects.get(admin=self.admin)
+        admin_location.location = self.odisha
+        admin_location.save()
+        self.assertEqual(self.client_ids(), (200, [self.od_client.id]))
+
+    def test_lru_and_ttl(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        for index in range(3):
+            cache.set(f'key{index}', {'user_id': index}, cache.generation)
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual(cache.get('key2'), {'user_id': 2})
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+        expired = TokenCache(ttl=0)
+        expired.set('key', {'user_id': 1}, expired.generation)
+        self.assertIsNone(expired.get('key'))
+
+    def test_record_loaded_before_an_invalidation_is_not_cached(self):
+        generation = token_cache.generation
+        token_cache.invalidate_user(self.admin.id)
+        token_cache.set(self.token.key, {'user_id': self.admin.id}, generation)
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_stats_endpoint(self):
+        superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        api = APIClient()
+        api.force_authenticate(superadmin)
+        self.client_ids()
+        self.assertEqual(api.get('/api/token-cache-stats/').data['size'], 1)
+        self.assertEqual(api.delete('/api/token-cache-stats/').status_code, 204)
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+
+class JWTAuthenticationTest(TestCase):
+    """JWT access tokens authenticate without queries; refresh tokens rotate and can be revoked"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tamil_nadu = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.odisha = Location.objects.create(name=Location.StateName.ODISHA)
+        cls.admin = User.objects.create_user(
+            username='admin-jwt', password='secret-pass', role=User.Role.ADMIN, home_location=cls.tamil_nadu,
+        )
+        AdminLocation.objects.create(admin=cls.admin, location=cls.tamil_nadu)
+        cls.tn_client = User.objects.create(username='tnclient1', home_location=cls.tamil_nadu)
+        User.objects.create(username='odclient1', home_location=cls.odisha)
+
+    def login(self):
+        response = APIClient().post('/api/login/', {'username': 'admin-jwt', 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def refresh(self, refresh):
+        return APIClient().post('/api/token/refresh/', {'refresh': refresh}, format='json')
+
+    def client_ids(self, access):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = api.get('/api/users/clients/')
+        return response.status_code, [user['id'] for user in response.data] if response.status_code == 200 else None
+
+    def test_login_issues_both_schemes_during_migration(self):
+        data = self.login()
+        self.assertIn('token', data)
+        self.assertIn('access', data)
+        self.assertIn('refresh', data)
+
+    @override_settings(AUTH_SCHEME='jwt')
+    def test_jwt_only_login(self):
+        data = self.login()
+        self.assertNotIn('token', data)
+        self.assertFalse(Token.objects.filter(user=self.admin).exists())
+
+    @override_settings(AUTH_SCHEME='token')
+    def test_token_only_login(self):
+        self.assertNotIn('access', self.login())
+
+    def test_access_token_needs_no_query(self):
+        access = self.login()['access']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client_ids(access), (200, [self.tn_client.id]))
+        # Only the clients query itself: no user, token or AdminLocation lookup
+        self.assertEqual(len(queries), 1)
+        self.assertIn('accounts_user', queries[0]['sql'])
+        self.assertIn('"role" = \'CLIENT\'', queries[0]['sql'].replace('"accounts_user".', ''))
+
+    def test_profile_loads_the_user_once(self):
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get('/api/users/me/')
+        self.assertEqual(response.data['username'], 'admin-jwt')
+        self.assertEqual(response.data['home_location'], self.tamil_nadu.id)
+        self.assertEqual(len(queries), 1)
+
+    def test_refresh_rotates_and_denylists(self):
+        refresh = self.login()['refresh']
+        response = self.refresh(refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client_ids(response.data['access'])[0], 200)
+        # The old refresh token was denylisted by the rotation
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_refresh_picks_up_changes(self):
+        refresh = self.login()['refresh']
+        admin_location = AdminLocation.objects.get(admin=self.admin)
+        admin_location.location = self.odisha
+        admin_location.save()
+        access = self.refresh(refresh).data['access']
+        self.assertEqual(self.client_ids(access)[1], [User.objects.get(username='odclient1').id])
+
+    def test_refresh_rejects_inactive_user(self):
+        refresh = self.login()['refresh']
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_logout(self):
+        refresh = self.login()['refresh']
+        response = APIClient().post('/api/token/logout/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.refresh(refresh).status_code, 401)
+
+    def test_invalid_tokens(self):
+        self.assertEqual(self.client_ids('not-a-jwt')[0], 401)
+        self.assertEqual(self.refresh(self.login()['access']).status_code, 401)
+        self.assertEqual(APIClient().post('/api/token/refresh/', {}, format='json').status_code, 400)
+
+
+class AccessContextTest(TestCase):
+    """Role and location scoping is resolved once per request and shared by its consumers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tamil_nadu = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.odisha = Location.objects.create(name=Location.StateName.ODISHA)
+        cls.admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, home_location=cls.tamil_nadu)
+        AdminLocation.objects.create(admin=cls.admin, location=cls.tamil_nadu)
+        cls.tn_client = User.objects.create(username='tnclient1', home_location=cls.tamil_nadu)
+        cls.od_client = User.objects.create(username='odclient1', home_location=cls.odisha)
+        for client in (cls.tn_client, cls.od_client):
+            Task.objects.create(
+                title='Task', description='Test task', location=client.home_location, assigned_by=cls.admin,
+                assigned_to=client, deadline=timezone.now() + timedelta(days=1),
+            )
+
+    def setUp(self):
+        dashboard_cache.get_cache().clear()
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.get(pk=self.admin.pk))
+
+    def scoping_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(path)
+        sql = [query['sql'] for query in queries.captured_queries]
+        return response, [query for query in sql if 'accounts_adminlocation' in query or 'FROM "accounts_location"' in query]
+
+    def test_task_list_resolves_the_location_once(self):
+        response, scoping = self.scoping_queries('/api/tasks/')
+        self.assertEqual([task['id'] for task in response.data['results']],
+                         list(Task.objects.filter(location=self.tamil_nadu).values_list('id', flat=True)))
+        self.assertEqual(len(scoping), 1)
+
+    def test_admin_dashboard_resolves_the_location_and_code_in_one_query(self):
+        response, scoping = self.scoping_queries('/api/dashboard/admin/')
+        self.assertEqual(response.data['total_clients'], 1)
+        self.assertEqual(response.data['active_tasks'], 1)
+        self.assertEqual(len(scoping), 1)
+
+    def test_cached_token_scoping_needs_no_query(self):
+        token = Token.objects.create(user=self.admin)
+        token_cache.clear()
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        api.get('/api/users/clients/')
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get('/api/users/clients/')
+        self.assertEqual([user['id'] for user in response.data], [self.tn_client.id])
+        self.assertEqual(len(queries), 1)
+
+    def test_admin_without_location_sees_nothing(self):
+        AdminLocation.objects.filter(admin=self.admin).delete()
+        self.assertEqual(self.api.get('/api/tasks/').data['results'], [])
+        self.assertEqual(self.api.get('/api/users/clients/').data, [])
+        response = self.api.post('/api/tasks/bulk/', [{'title': 'Task'}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous_requests_are_refused(self):
+        self.assertEqual(APIClient().get('/api/token-cache-stats/').status_code, 401)
+
+
+class LocationRegistryTest(TestCase):
+    """Locations are resolved from memory and reloaded after a write in any worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tamil_nadu = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+
+    def test_lookups_need_no_query_once_loaded(self):
+        location_registry.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(location_registry.get(self.tamil_nadu.id).name, Location.StateName.TAMIL_NADU)
+            self.assertEqual(location_registry.by_code('TAMIL_NADU').id, self.tamil_nadu.id)
+            self.assertEqual(location_registry.resolve('tamil nadu').id, self.tamil_nadu.id)
+            self.assertEqual(location_registry.code(self.tamil_nadu.id), 'TAMIL_NADU')
+            self.assertEqual(location_registry.display_name(self.tamil_nadu.id), 'Tamil Nadu')
+            self.assertIsNot(location_registry.get(self.tamil_nadu.id), location_registry.get(self.tamil_nadu.id))
+
+    def test_writes_reload_this_worker(self):
+        location_registry.all()
+        odisha = Location.objects.create(name=Location.StateName.ODISHA)
+        self.assertEqual(location_registry.code(odisha.id), 'ODISHA')
+        odisha.delete()
+        self.assertIsNone(location_registry.code(odisha.id))
+
+    def test_other_workers_reload_after_the_version_moves(self):
+        other_worker = LocationRegistry()
+        other_worker.all()
+        self.tamil_nadu.name = Location.StateName.TELANGANA
+        self.tamil_nadu.save()
+        with override_settings(LOCATION_REGISTRY_CHECK_INTERVAL=60):
+            self.assertEqual(other_worker.code(self.tamil_nadu.id), 'TAMIL_NADU')
+            # A lookup that misses reads the database straight away
+            self.assertEqual(other_worker.by_code('TELANGANA').id, self.tamil_nadu.id)
+        other_worker.checked_at = 0
+        self.assertEqual(other_worker.code(self.tamil_nadu.id), 'TELANGANA')
+
+    def test_misses_read_rows_the_version_never_announced(self):
+        # As in a worker whose cache is not shared with the one that created the row
+        other_worker = LocationRegistry()
+        other_worker.all()
+        (odisha,) = Location.objects.bulk_create([Location(name=Location.StateName.ODISHA)])
+        self.assertEqual(other_worker.by_code('ODISHA').id, odisha.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(other_worker.code(odisha.id), 'ODISHA')
+            self.assertEqual([location.name for location in other_worker.all()], ['ODISHA', 'TAMIL_NADU'])
+        (telangana,) = Location.objects.bulk_create([Location(name=Location.StateName.TELANGANA)])
+        self.assertEqual(set(other_worker.in_bulk([telangana.id, odisha.id, -1])), {telangana.id, odisha.id})
+        self.assertIsNone(other_worker.get('not an id'))
+
+    def test_create_admin_by_display_name(self):
+        api = APIClient()
+        api.force_authenticate(self.superadmin)
+        location_registry.all()
+        response = api.post('/api/create-admin/', {
+            'username': 'tnadmin', 'password': 'secret-123', 'location_code': 'Tamil Nadu',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        admin = User.objects.select_related('assigned_location').get(username='tnadmin')
+        self.assertEqual(admin.assigned_location.location_id, self.tamil_nadu.id)
+        self.assertEqual((admin.home_location_id, admin.location), (self.tamil_nadu.id, 'Tamil Nadu'))
+
+
+class RequestLoggingTest(TestCase):
+    """RequestLoggingMiddleware logs one structured line per request without secrets"""
+
+    def log_lines(self, method, url, data=None):
+        with self.assertLogs('adminportal.middleware', 'INFO') as logs:
+            getattr(APIClient(), method)(url, data, format='json')
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_one_line_per_request(self):
+        (entry,) = self.log_lines('get', '/api/tasks/')
+        self.assertEqual((entry['method'], entry['route'], entry['status']), ('GET', 'task-list', 401))
+        self.assertEqual(set(entry), {'method', 'route', 'status', 'duration_ms', 'db_queries', 'db_ms', 'response_bytes'})
+
+    def test_counts_queries_and_user(self):
+        User.objects.create(username='tnadmin', role=User.Role.ADMIN)
+        (entry,) = self.log_lines('post', '/api/login/', {'username': 'tnadmin', 'password': 'secret'})
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['db_queries'], 0)
+        self.assertNotIn('request_body', entry)
+
+    def test_json_posts_reach_the_views(self):
+        # The middleware must not depend on views reading request.body after request.data
+        api = APIClient()
+        api.force_authenticate(User.objects.create(username='superadmin', role=User.Role.SUPERADMIN))
+        with self.assertLogs('adminportal.middleware', 'INFO'):
+            response = api.post('/api/users/', {'username': 'tnclient1', 'password': 'secret-123'}, format='json')
+            self.assertEqual(response.status_code, 201)
+            response = api.post('/api/test-post/', {'ping': 1}, format='json')
+            self.assertEqual(response.data['received_data'], {'ping': 1})
+
+    @override_settings(REQUEST_LOG_BODY_SAMPLE_RATE=1.0)
+    def test_sampled_bodies_are_redacted(self):
+        User.objects.create(username='tnadmin', role=User.Role.ADMIN)
+        (entry,) = self.log_lines('post', '/api/login/', {'username': 'tnadmin', 'password': 'secret'})
+        self.assertEqual(entry['request_body'], {'username': 'tnadmin', 'password': '[REDACTED]'})
+        self.assertEqual(entry['response_body']['token'], '[REDACTED]')
+        self.assertNotIn('secret', json.dumps(entry))
+
+
+class PerformanceMetricsTest(TestCase):
+    """PerformanceMiddleware reports per-request timings and per-route percentiles"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        for index in range(3):
+            User.objects.create(username=f'tnclient{index}', role=User.Role.CLIENT, home_location=cls.location)
+
+    def setUp(self):
+        route_stats.reset()
+        self.api = APIClient()
+        self.api.force_authenticate(self.superadmin)
+
+    def test_server_timing_header(self):
+        response = self.api.get('/api/users/')
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertIn('2 queries', timing)  # Pagination COUNT and the page
+
+    def test_duplicate_queries_are_fingerprinted(self):
+        metrics = RequestMetrics()
+        with track_queries(metrics):
+            for user in User.objects.filter(role=User.Role.CLIENT):
+                user.home_location  # One query per user: the N+1 shape
+        (shape, count), = metrics.duplicate_queries().items()
+        self.assertEqual(count, 3)
+        self.assertIn('accounts_location', shape)
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.api.get('/api/users/')
+        routes = self.api.get('/api/metrics/').data['routes']
+        self.assertEqual(routes['user-list']['requests'], 3)
+        self.assertEqual(routes['user-list']['queries']['p50'], 2)
+        self.assertEqual(set(routes['user-list']['duration_ms']), {'p50', 'p95', 'p99', 'max'})
+
+        self.assertEqual(self.api.delete('/api/metrics/').status_code, 204)
+        self.assertNotIn('user-list', route_stats.snapshot()['routes'])
+
+    def test_metrics_endpoint_is_superadmin_only(self):
+        self.api.force_authenticate(User.objects.get(username='tnclient0'))
+        self.assertEqual(self.api.get('/api/metrics/').status_code, 403)
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    """The Prometheus registry sums the values written by every worker process"""
+
+    def make_registry(self):
+        test_registry = MetricsRegistry()
+        counter = test_registry.counter('jobs', 'Jobs done', ['kind'])
+        histogram = test_registry.histogram('job_seconds', 'Job time', ['kind'], buckets=(1, 10))
+        return test_registry, counter, histogram
+
+    def test_exposition(self):
+        test_registry, counter, histogram = self.make_registry()
+        counter.inc(kind='a "quoted" kind')
+        histogram.observe(0.5, kind='a')
+        histogram.observe(5, kind='a')
+        lines = test_registry.exposition().splitlines()
+        self.assertIn('# TYPE jobs_total counter', lines)
+        self.assertIn('jobs_total{kind="a \\"quoted\\" kind"} 1', lines)
+        self.assertIn('job_seconds_bucket{kind="a",le="1.0"} 1', lines)
+        self.assertIn('job_seconds_bucket{kind="a",le="+Inf"} 2', lines)
+        self.assertIn('job_seconds_sum{kind="a"} 5.5', lines)
+        self.assertIn('job_seconds_count{kind="a"} 2', lines)
+
+    def test_labels_are_checked(self):
+        _, counter, _ = self.make_registry()
+        with self.assertRaises(ValueError):
+            counter.inc(other='a')
+
+    def test_multiprocess_mode(self):
+        def work(count):
+            _, counter, histogram = worker_metrics
+            for _ in range(count):
+                counter.inc(kind='a')
+                histogram.observe(2, kind='a')
+            os._exit(0)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROCESS_DIR=directory):
+            worker_metrics = self.make_registry()
+            test_registry, counter, _ = worker_metrics
+            counter.inc(kind='a')
+            # Forked workers each write a file of their own
+            context = multiprocessing.get_context('fork')
+            workers = [context.Process(target=work, args=(count,)) for count in (100, 2000)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            self.assertEqual(len(os.listdir(directory)), 3)
+            lines = test_registry.exposition().splitlines()
+        self.assertIn('jobs_total{kind="a"} 2101', lines)
+        self.assertIn('job_seconds_count{kind="a"} 2100', lines)
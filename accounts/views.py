@@ -1,25 +1,38 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status, views, parsers
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
-from django.db.models import Count, Q
+from django.db.models import Count
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
 from .models import Location, AdminLocation, User
 from .serializers import UserSerializer, LocationSerializer, AdminLocationSerializer
-from tasks.models import Task, TaskReport
+from .mixins import EagerLoadingMixin, AsyncDispatchMixin
+from tasks.models import Task, TaskReport, LocationTaskStats, ClientTaskStats, LocationDailyTaskStats
+from . import dashboard_cache, dashboard_queries
+from .access import get_access, aget_access
+from .dashboard_queries import COUNT, FIRST, ROWS
+from .locations import location_registry
+from .authentication import token_cache, issue_jwt
+from adminportal.instrumentation import route_stats
 
 User = get_user_model()
 
 class IsSuperAdmin(permissions.BasePermission):
     """Permission for SuperAdmin access"""
     def has_permission(self, request, view):
-        return request.user and request.user.is_superadmin()
+        return get_access(request).is_superadmin()
 
 class IsAdminOrSuperAdmin(permissions.BasePermission):
     """Permission for Admin or SuperAdmin access"""
     def has_permission(self, request, view):
-        return request.user and (request.user.is_admin() or request.user.is_superadmin())
+        return get_access(request).is_manager()
 
 class UserViewSet(viewsets.ModelViewSet):
     """API viewset for managing users"""
@@ -46,29 +59,16 @@ class UserViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        """Filter queryset based on user role and assigned location"""
-        user = self.request.user
-        if user.is_superadmin():
-            return User.objects.all()
-        elif user.is_admin():
-            try:
-                # Admins can only see clients in their assigned location
-                admin_location = user.assigned_location
-                return User.objects.filter(
-                    role=User.Role.CLIENT,
-                    location=admin_location.location.get_name_display()
-                )
-            except:
-                # If admin has no assigned location, show no clients
-                return User.objects.none()
-        else:
-            # Clients can only see their own profile
-            return User.objects.filter(id=user.id)
+        """
+        SuperAdmins see everyone, admins the clients in their assigned location
+        (nobody without one), and clients only their own profile.
+        """
+        return get_access(self.request).users()
     
     def update(self, request, *args, **kwargs):
         """Check permissions for update"""
         user = self.get_object()
-        if not request.user.is_superadmin() and request.user.id != user.id:
+        if not get_access(request).is_superadmin() and request.user.id != user.id:
             return Response({"detail": "Not authorized to edit this user."}, 
                            status=status.HTTP_403_FORBIDDEN)
         return super().update(request, *args, **kwargs)
@@ -78,33 +78,26 @@ class UserViewSet(viewsets.ModelViewSet):
         # Debug request information
         print(f"Content-Type: {request.content_type}")
         print(f"Request data: {request.data}")
-        print(f"Request body: {request.body}")
         
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            # Create the user
-            user = serializer.save()
-            
             # If this is an admin user and location_code is provided, assign the location
-            if user.role == User.Role.ADMIN and 'location_code' in request.data:
+            location = None
+            if serializer.validated_data.get('role') == User.Role.ADMIN and 'location_code' in request.data:
                 location_code = request.data.get('location_code')
-                if location_code:
-                    try:
-                        # Get the location object
-                        location = Location.objects.get(name=location_code)
-                        
-                        # Create AdminLocation connection
-                        AdminLocation.objects.create(
-                            admin=user,
-                            location=location
-                        )
-                        
-                        # Also set the display name in the user's location field
-                        user.location = location.get_name_display()
-                        user.save()
-                    except Location.DoesNotExist:
-                        # Location not found, continue without error
-                        pass
+                # If the location is not found, continue without error
+                location = location_registry.by_code(location_code) if location_code else None
+            
+            if location is not None:
+                # Create the user with its home location (and its legacy display name) in one write
+                user = serializer.save(home_location=location)
+                # Create AdminLocation connection
+                AdminLocation.objects.create(
+                    admin=user,
+                    location=location
+                )
+            else:
+                user = serializer.save()
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -112,30 +105,23 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def clients(self, request):
         """Return only client users for task assignment, filtered by admin's location"""
-        if not (request.user.is_admin() or request.user.is_superadmin()):
+        access = get_access(request)
+        if not access.is_manager():
             return Response({"detail": "Not authorized."}, 
                            status=status.HTTP_403_FORBIDDEN)
         
-        if request.user.is_superadmin():
-            clients = User.objects.filter(role=User.Role.CLIENT)
-        else:
-            try:
-                # Filter clients by admin's location
-                admin_location = request.user.assigned_location
-                clients = User.objects.filter(
-                    role=User.Role.CLIENT, 
-                    location=admin_location.location.get_name_display()
-                )
-            except:
-                clients = User.objects.none()
-                
+        clients = access.clients()
         serializer = self.get_serializer(clients, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def me(self, request):
         """Return the current user's profile"""
-        serializer = self.get_serializer(request.user)
+        user = request.user
+        if user.get_deferred_fields():
+            # JWT users carry only their claims; load the row once instead of field by field
+            user = User.objects.get(pk=user.pk)
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
 class LocationViewSet(viewsets.ModelViewSet):
@@ -154,10 +140,15 @@ class LocationViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAdminOrSuperAdmin]
         return [permission() for permission in permission_classes]
 
-class AdminLocationViewSet(viewsets.ModelViewSet):
+class AdminLocationViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     """API viewset for managing admin-location mappings"""
     queryset = AdminLocation.objects.all()
     serializer_class = AdminLocationSerializer
+    eager_loading = {
+        'default': {
+            'select_related': ('admin', 'location'),
+        },
+    }
     permission_classes = [IsSuperAdmin]
 
 class LoginAPIView(views.APIView):
@@ -211,19 +202,7 @@ class LoginAPIView(views.APIView):
                     location=location
                 )
             
-            # Get or create token
-            token, created = Token.objects.get_or_create(user=user)
-            
-            return Response({
-                'token': token.key,
-                'user': {
-                    'id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'role': user.role,
-                    'location': user.location
-                }
-            })
+            return self.login_response(user)
         
         # For non-demo users, authenticate normally
         user = authenticate(username=username, password=password)
@@ -233,95 +212,214 @@ class LoginAPIView(views.APIView):
                 'detail': 'Invalid credentials'
             }, status=status.HTTP_401_UNAUTHORIZED)
         
-        token, created = Token.objects.get_or_create(user=user)
-        
-        return Response({
-            'token': token.key,
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'role': user.role,
-                'location': user.location
-            }
-        })
+        return self.login_response(user)
+    
+    def login_response(self, user):
+        """The DB token and/or the JWT pair, depending on AUTH_SCHEME, with the user's profile"""
+        data = {}
+        if settings.AUTH_SCHEME in ('token', 'both'):
+            token, created = Token.objects.get_or_create(user=user)
+            data['token'] = token.key
+        if settings.AUTH_SCHEME in ('jwt', 'both'):
+            data.update(issue_jwt(user))
+        data['user'] = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'location': user.location,
+            'home_location': user.home_location_id
+        }
+        return Response(data)
 
-class SuperAdminDashboardView(views.APIView):
+class JWTTokenView(views.APIView):
+    """Base for the refresh token endpoints, which take the token in the body"""
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    
+    def get_authenticate_header(self, request):
+        # Answer invalid tokens with 401 rather than 403
+        return 'Bearer realm="api"'
+
+class JWTRefreshView(JWTTokenView):
     """
-    API endpoint for SuperAdmin dashboard data
+    API endpoint that exchanges a refresh token for a new access and refresh token.
+    The user is reloaded so role, location and active status changes reach the new
+    claims, and the old refresh token is denylisted; presenting it again fails.
+    """
+    
+    def post(self, request):
+        refresh = parse_refresh_token(request.data.get('refresh'))
+        user = (
+            User.objects.select_related('assigned_location')
+            .filter(id=refresh['user_id'], is_active=True)
+            .first()
+        )
+        if user is None:
+            raise AuthenticationFailed('User inactive or deleted.')
+        blacklisted, created = refresh.blacklist()
+        if not created:
+            # Another request rotated this token first
+            raise InvalidToken('Token is blacklisted')
+        return Response(issue_jwt(user))
+
+class JWTLogoutView(JWTTokenView):
+    """
+    API endpoint that denylists a refresh token. Its access tokens stay valid
+    until they expire (SIMPLE_JWT ACCESS_TOKEN_LIFETIME).
+    """
+    
+    def post(self, request):
+        parse_refresh_token(request.data.get('refresh')).blacklist()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+def parse_refresh_token(raw_token):
+    """A valid, not denylisted RefreshToken, or InvalidToken (401)"""
+    if not raw_token:
+        raise ValidationError({'refresh': ['This field is required.']})
+    try:
+        return RefreshToken(raw_token)
+    except TokenError as e:
+        raise InvalidToken(e.args[0])
+
+def forbidden():
+    return Response({
+        'detail': 'You do not have permission to access this data'
+    }, status=status.HTTP_403_FORBIDDEN)
+
+def today():
+    """The current date in TIME_ZONE, the calendar the daily task stats are kept in"""
+    return timezone.localdate(timezone=timezone.get_default_timezone())
+
+def task_action(task):
+    if task.status == 'COMPLETED':  # Use uppercase to match enum values
+        return 'Task completed'
+    elif task.status == 'APPROVED':
+        return 'Task approved'
+    elif task.status == 'IN_PROGRESS':
+        return 'Task started'
+    return 'Task assigned'
+
+class DashboardView(AsyncDispatchMixin, views.APIView):
+    """
+    Base of the dashboard endpoints. A dashboard declares its independent queries
+    (accounts.dashboard_queries) and builds the payload from their results; get
+    runs the queries in order, and aget, served under ASGI, runs them concurrently.
     """
     permission_classes = [permissions.IsAuthenticated]
     
+    def has_role(self, access):
+        raise NotImplementedError
+    
+    def get_queries(self, access):
+        """{name: (kind, queryset)} of the queries the payload is built from"""
+        raise NotImplementedError
+    
+    def build(self, access, data):
+        """The payload from the {name: result} of get_queries"""
+        raise NotImplementedError
+    
+    @dashboard_cache.cached_dashboard
     def get(self, request):
-        user = request.user
-        
+        access = get_access(request)
+        if not self.has_role(access):
+            return forbidden()
+        return Response(self.build(access, dashboard_queries.fetch(self.get_queries(access))))
+    
+    @dashboard_cache.cached_dashboard
+    async def aget(self, request):
+        access = await aget_access(request)
+        if not self.has_role(access):
+            return forbidden()
+        data = await dashboard_queries.afetch(self.get_queries(access))
+        # Location names come from the registry, which may have to reload
+        return Response(await sync_to_async(self.build)(access, data))
+
+class SuperAdminDashboardView(DashboardView):
+    """
+    API endpoint for SuperAdmin dashboard data
+    """
+    
+    def has_role(self, access):
         # Only SuperAdmin role can access this data
-        if user.role != 'SUPERADMIN':
-            return Response({
-                'detail': 'You do not have permission to access this data'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get counts
-        total_admins = User.objects.filter(role='ADMIN').count()
-        total_clients = User.objects.filter(role='CLIENT').count()
-        active_tasks = Task.objects.filter(status__in=['PENDING', 'IN_PROGRESS']).count()  # Use uppercase to match enum values
-        completed_tasks = Task.objects.filter(status__in=['COMPLETED', 'APPROVED']).count()  # Use uppercase to match enum values
+        return access.is_superadmin()
+    
+    def get_queries(self, access):
+        return {
+            # User counts per role and (for clients) per home location, in one grouped query
+            'user_rows': (ROWS, User.objects.filter(
+                role__in=['ADMIN', 'CLIENT']
+            ).values('role', 'home_location').annotate(count=Count('id')).order_by()),
+            # Location statistics, with task counts read from the materialized stats rows
+            'locations': (ROWS, Location.objects.annotate(
+                admin_count=Count('assigned_admins')
+            ).select_related('task_stats')),
+            # Admin users for the admin management page
+            'admins': (ROWS, User.objects.filter(role='ADMIN').select_related('assigned_location')),
+            # Overdue tasks per location, from the stored flag
+            'overdue_rows': (ROWS, Task.objects.filter(overdue=True).values('location').annotate(
+                count=Count('id')
+            ).order_by()),
+            # Tasks due and done per location in this week, month, quarter and year
+            'completion_rows': (ROWS, LocationDailyTaskStats.completion(today())),
+            # Recent activity
+            'recent_tasks': (ROWS, Task.objects.order_by('-updated_at')[:5]),
+            'recent_reports': (ROWS, TaskReport.objects.order_by('-submitted_at')[:5]),
+        }
+    
+    def build(self, access, data):
+        total_admins = 0
+        total_clients = 0
+        clients_by_location = {}
+        for row in data['user_rows']:
+            if row['role'] == 'ADMIN':
+                total_admins += row['count']
+            else:
+                total_clients += row['count']
+                clients_by_location[row['home_location']] = row['count']
         
-        # Get location statistics
-        locations = ['Tamil Nadu', 'Andhra Pradesh', 'Telangana', 'Odisha']
+        locations_by_code = {location.name: location for location in data['locations']}
+        overdue_by_location = {row['location']: row['count'] for row in data['overdue_rows']}
+        completion_by_location = {row['location_id']: row for row in data['completion_rows']}
         location_stats = []
+        active_tasks = 0
+        completed_tasks = 0
+        
+        for location_code, location_name in Location.StateName.choices:
+            location_obj = locations_by_code.get(location_code)
+            if location_obj is None:
+                # Handle the case where the location doesn't exist
+                continue
+            
+            try:
+                task_stats = location_obj.task_stats
+            except LocationTaskStats.DoesNotExist:
+                task_stats = LocationTaskStats(location=location_obj)
+            location_tasks = task_stats.total
+            active_tasks += task_stats.active
+            completed_tasks += task_stats.done
+            
+            # Calculate completion rate (defaults to 0 if no tasks)
+            completion_rate = 0
+            if location_tasks > 0:
+                completion_rate = task_stats.done / location_tasks
+            
+            location_stats.append({
+                'name': location_code,  # Code name used for API calls
+                'display_name': location_name,  # Human-readable name for display
+                'code': location_code,  # For backward compatibility
+                'admin_count': location_obj.admin_count,
+                'client_count': clients_by_location.get(location_obj.id, 0),
+                'task_count': location_tasks,
+                'overdue_count': overdue_by_location.get(location_obj.id, 0),
+                'task_completion': LocationDailyTaskStats.completion_rates(completion_by_location.get(location_obj.id)),
+                'performance': completion_rate
+            })
         
-        from django.db.models import Count
-        
-        # Process each location
-        for location_name in locations:
-            # Find location code from the name
-            for choice in Location.StateName.choices:
-                if choice[1] == location_name:
-                    location_code = choice[0]
-                    try:
-                        # Get location object
-                        location_obj = Location.objects.get(name=location_code)
-                        
-                        # Get admin and client counts for this location
-                        location_admins = AdminLocation.objects.filter(location=location_obj).count()
-                        location_clients = User.objects.filter(
-                            role='CLIENT',
-                            location=location_name
-                        ).count()
-                        
-                        # Get task counts and completion rate
-                        location_tasks = Task.objects.filter(location=location_obj).count()
-                        completed_location_tasks = Task.objects.filter(
-                            location=location_obj,
-                            status__in=['COMPLETED', 'APPROVED']
-                        ).count()
-                        
-                        # Calculate completion rate (defaults to 0 if no tasks)
-                        completion_rate = 0
-                        if location_tasks > 0:
-                            completion_rate = completed_location_tasks / location_tasks
-                        
-                        location_stats.append({
-                            'name': location_code,  # Code name used for API calls
-                            'display_name': location_name,  # Human-readable name for display
-                            'code': location_code,  # For backward compatibility
-                            'admin_count': location_admins,
-                            'client_count': location_clients,
-                            'task_count': location_tasks,
-                            'performance': completion_rate
-                        })
-                    except Location.DoesNotExist:
-                        # Handle the case where the location doesn't exist
-                        continue
-        
-        # Get admin users for the admin management page
         admin_users = []
-        for admin in User.objects.filter(role='ADMIN'):
+        for admin in data['admins']:
             try:
-                # Try to get the assigned location
-                admin_location = AdminLocation.objects.get(admin=admin)
-                location_name = admin_location.location.get_name_display()
+                location_name = location_registry.display_name(admin.assigned_location.location_id)
             except AdminLocation.DoesNotExist:
                 location_name = 'Not assigned'
             
@@ -334,33 +432,20 @@ class SuperAdminDashboardView(views.APIView):
                 'location': location_name
             })
         
-        # Get recent activity
-        recent_tasks = Task.objects.all().order_by('-updated_at')[:5]
-        recent_reports = TaskReport.objects.all().order_by('-submitted_at')[:5]
-        
         # Combine and sort activities
         recent_activity = []
         
-        for task in recent_tasks:
-            if task.status == 'COMPLETED':  # Use uppercase to match enum values
-                action = 'Task completed'
-            elif task.status == 'APPROVED':
-                action = 'Task approved'
-            elif task.status == 'IN_PROGRESS':
-                action = 'Task started'
-            else:
-                action = 'Task assigned'
-                
+        for task in data['recent_tasks']:
             recent_activity.append({
-                'action': action,
-                'details': f'Task #{task.id} in {task.location}',
+                'action': task_action(task),
+                'details': f'Task #{task.id} in {location_registry.display_name(task.location_id)}',
                 'time': task.updated_at.strftime('%Y-%m-%d %H:%M')
             })
         
-        for report in recent_reports:
+        for report in data['recent_reports']:
             recent_activity.append({
                 'action': 'Report submitted',
-                'details': f'Report for Task #{report.task.id}',
+                'details': f'Report for Task #{report.task_id}',
                 'time': report.submitted_at.strftime('%Y-%m-%d %H:%M')
             })
         
@@ -376,112 +461,70 @@ class SuperAdminDashboardView(views.APIView):
                 'time_ago': activity['time']
             })
         
-        # Return all data
-        return Response({
+        return {
             'total_admins': total_admins,
             'total_clients': total_clients,
             'active_tasks': active_tasks,
             'completed_tasks': completed_tasks,
+            'overdue_tasks': sum(overdue_by_location.values()),
             'locations': location_stats,
             'admin_users': admin_users,
             'recent_activities': formatted_activities
-        })
+        }
 
-class AdminDashboardView(views.APIView):
+class AdminDashboardView(DashboardView):
     """
     API endpoint for Admin dashboard data
     """
-    permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request):
-        user = request.user
-        
+    def has_role(self, access):
         # Only Admin role can access this data
-        if user.role != 'ADMIN':
-            return Response({
-                'detail': 'You do not have permission to access this data'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get counts for admin's location
-        location_name = user.location
-        
-        # Convert location name to location code
-        location_code = None
-        if location_name == 'Tamil Nadu':
-            location_code = 'TAMIL_NADU'
-        elif location_name == 'Andhra Pradesh':
-            location_code = 'ANDHRA_PRADESH'
-        elif location_name == 'Telangana':
-            location_code = 'TELANGANA'
-        elif location_name == 'Odisha':
-            location_code = 'ODISHA'
-        
-        # Find the location object instead of using the string
-        try:
-            location_obj = Location.objects.get(name=location_code) if location_code else None
-            
-            # Use the location object in the filters
-            total_clients = User.objects.filter(role='CLIENT', location=location_name).count()
-            
-            # Filter using the location object rather than the string name
-            active_tasks = Task.objects.filter(
-                status__in=['PENDING', 'IN_PROGRESS'],  # Use uppercase to match enum values
-                location=location_obj
-            ).count() if location_obj else 0
-            
-            pending_reports = TaskReport.objects.filter(
-                task__location=location_obj,
+        return access.is_admin()
+    
+    def get_queries(self, access):
+        # Counts and activity for the admin's assigned location
+        location_id = access.location_id
+        if not location_id:
+            return {}
+        return {
+            'total_clients': (COUNT, User.objects.filter(role='CLIENT', home_location_id=location_id)),
+            'task_stats': (FIRST, LocationTaskStats.objects.filter(location_id=location_id)),
+            'pending_reports': (COUNT, TaskReport.objects.filter(
+                task__location_id=location_id,
                 reviewed_at__isnull=True
-            ).count() if location_obj else 0
-        except Location.DoesNotExist:
-            # Handle the case where location doesn't exist
-            total_clients = 0
-            active_tasks = 0
-            pending_reports = 0
-        
-        # Task completion rates - we'll create mock data for this demo
-        task_completion = {
-            'this_week': 0.85 if location_name == 'Tamil Nadu' else 
-                         0.82 if location_name == 'Andhra Pradesh' else
-                         0.78 if location_name == 'Telangana' else 0.75,
-            'this_month': 0.75 if location_name == 'Tamil Nadu' else 
-                          0.72 if location_name == 'Andhra Pradesh' else
-                          0.68 if location_name == 'Telangana' else 0.65,
-            'this_quarter': 0.65 if location_name == 'Tamil Nadu' else 
-                            0.62 if location_name == 'Andhra Pradesh' else
-                            0.58 if location_name == 'Telangana' else 0.55,
-            'this_year': 0.80 if location_name == 'Tamil Nadu' else 
-                         0.77 if location_name == 'Andhra Pradesh' else
-                         0.73 if location_name == 'Telangana' else 0.70,
+            )),
+            # Overdue tasks per client of the location, from the stored flag
+            'overdue_rows': (ROWS, Task.objects.filter(location_id=location_id, overdue=True).values(
+                'assigned_to', 'assigned_to__username'
+            ).annotate(count=Count('id')).order_by('-count', 'assigned_to__username')),
+            # Tasks due and done in this week, month, quarter and year
+            'completion': (FIRST, LocationDailyTaskStats.completion(today()).filter(location_id=location_id).order_by('location_id')),
+            'recent_tasks': (ROWS, Task.objects.filter(
+                location_id=location_id
+            ).select_related('assigned_to').order_by('-updated_at')[:5]),
+            'recent_reports': (ROWS, TaskReport.objects.filter(
+                task__location_id=location_id
+            ).select_related('task__assigned_to').order_by('-submitted_at')[:5]),
         }
+    
+    def build(self, access, data):
+        task_stats = data.get('task_stats')
         
-        # Get recent activity - ensure we use the location object for filtering
-        recent_tasks = Task.objects.filter(location=location_obj).order_by('-updated_at')[:5] if location_obj else []
-        recent_reports = TaskReport.objects.filter(
-            task__location=location_obj
-        ).order_by('-submitted_at')[:5] if location_obj else []
+        # Share of the tasks due in each period that are done
+        task_completion = LocationDailyTaskStats.completion_rates(data.get('completion'))
         
         # Combine and sort activities
         recent_activity = []
         
-        for task in recent_tasks:
-            if task.status == 'COMPLETED':  # Use uppercase to match enum values
-                action = 'Task completed'
-            elif task.status == 'APPROVED':
-                action = 'Task approved'
-            elif task.status == 'IN_PROGRESS':
-                action = 'Task started'
-            else:
-                action = 'Task assigned'
-                
+        for task in data.get('recent_tasks', []):
             recent_activity.append({
-                'action': action,
+                'action': task_action(task),
                 'details': f'Task #{task.id}',
                 'client': task.assigned_to.username,
                 'time': task.updated_at.strftime('%Y-%m-%d %H:%M')
             })
         
-        for report in recent_reports:
+        for report in data.get('recent_reports', []):
             action = 'Report submitted'
             if report.reviewed_at:
                 action = 'Report reviewed'
@@ -500,55 +543,56 @@ class AdminDashboardView(views.APIView):
             reverse=True
         )[:5]
         
-        return Response({
-            'total_clients': total_clients,
-            'active_tasks': active_tasks,
-            'pending_reports': pending_reports,
+        overdue_by_client = [
+            {'client_id': row['assigned_to'], 'client': row['assigned_to__username'], 'overdue_count': row['count']}
+            for row in data.get('overdue_rows', [])
+        ]
+        
+        return {
+            'total_clients': data.get('total_clients', 0),
+            'active_tasks': task_stats.active if task_stats else 0,
+            'pending_reports': data.get('pending_reports', 0),
+            'overdue_tasks': sum(row['overdue_count'] for row in overdue_by_client),
+            'overdue_by_client': overdue_by_client,
             'task_completion': task_completion,
             'recent_activity': recent_activity
-        })
+        }
 
-class ClientDashboardView(views.APIView):
+class ClientDashboardView(DashboardView):
     """
     API endpoint for Client dashboard data
     """
-    permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request):
-        user = request.user
-        
+    def has_role(self, access):
         # Only Client role can access this data
-        if user.role != 'CLIENT':
-            return Response({
-                'detail': 'You do not have permission to access this data'
-            }, status=status.HTTP_403_FORBIDDEN)
-        
-        # Get task counts for this client
-        assigned_tasks = Task.objects.filter(assigned_to=user).count()
-        completed_tasks = Task.objects.filter(
-            assigned_to=user,
-            status__in=['COMPLETED', 'APPROVED']  # Use uppercase to match enum values
-        ).count()
-        pending_tasks = Task.objects.filter(
-            assigned_to=user,
-            status__in=['PENDING', 'IN_PROGRESS']  # Use uppercase to match enum values
-        ).count()
-        
-        # Get upcoming deadlines
-        import datetime
-        today = datetime.date.today()
-        
-        # For demo, create some upcoming deadlines
-        upcoming_tasks = Task.objects.filter(
-            assigned_to=user,
-            status__in=['PENDING', 'IN_PROGRESS']  # Use uppercase to match enum values
-        ).order_by('deadline')[:3]
+        return access.is_client()
+    
+    def get_queries(self, access):
+        user_id = access.user_id
+        return {
+            # Task counts for this client from the materialized stats row
+            'task_stats': (FIRST, ClientTaskStats.objects.filter(client_id=user_id)),
+            # Upcoming deadlines
+            'upcoming_tasks': (ROWS, Task.objects.filter(
+                assigned_to_id=user_id,
+                status__in=['PENDING', 'IN_PROGRESS']  # Use uppercase to match enum values
+            ).order_by('deadline')[:3]),
+            'overdue_tasks': (COUNT, Task.objects.filter(assigned_to_id=user_id, overdue=True)),
+            # Recent activity
+            'recent_tasks': (ROWS, Task.objects.filter(assigned_to_id=user_id).order_by('-updated_at')[:3]),
+            'recent_reports': (ROWS, TaskReport.objects.filter(
+                submitted_by_id=user_id
+            ).order_by('-submitted_at')[:3]),
+        }
+    
+    def build(self, access, data):
+        task_stats = data['task_stats'] or ClientTaskStats(client=access.user)
         
         upcoming_deadlines = []
-        for task in upcoming_tasks:
-            # Calculate days left (for demo, use random days)
-            import random
-            days_left = random.randint(1, 5)
+        current_day = today()
+        for task in data['upcoming_tasks']:
+            # Calendar days until the deadline day, negative once it has passed
+            days_left = (timezone.localdate(task.deadline, timezone.get_default_timezone()) - current_day).days
             
             upcoming_deadlines.append({
                 'task_id': task.id,
@@ -556,39 +600,24 @@ class ClientDashboardView(views.APIView):
                 'is_urgent': days_left <= 2
             })
         
-        # Get recent activity
-        recent_tasks = Task.objects.filter(assigned_to=user).order_by('-updated_at')[:3]
-        recent_reports = TaskReport.objects.filter(
-            submitted_by=user
-        ).order_by('-submitted_at')[:3]
-        
         # Combine and sort activities
         recent_activity = []
         
-        for task in recent_tasks:
-            if task.status == 'COMPLETED':  # Use uppercase to match enum values
-                action = 'Task completed'
-            elif task.status == 'APPROVED':
-                action = 'Task approved'
-            elif task.status == 'IN_PROGRESS':
-                action = 'Task started'
-            else:
-                action = 'Task assigned'
-                
+        for task in data['recent_tasks']:
             recent_activity.append({
-                'action': action,
+                'action': task_action(task),
                 'details': f'Task #{task.id}',
                 'time': task.updated_at.strftime('%Y-%m-%d %H:%M')
             })
         
-        for report in recent_reports:
+        for report in data['recent_reports']:
             action = 'Report submitted'
             if report.reviewed_at:
                 action = 'Report reviewed'
                 
             recent_activity.append({
                 'action': action,
-                'details': f'For Task #{report.task.id}',
+                'details': f'For Task #{report.task_id}',
                 'time': report.submitted_at.strftime('%Y-%m-%d %H:%M')
             })
         
@@ -599,13 +628,53 @@ class ClientDashboardView(views.APIView):
             reverse=True
         )[:5]
         
-        return Response({
-            'assigned_tasks': assigned_tasks,
-            'completed_tasks': completed_tasks,
-            'pending_tasks': pending_tasks,
+        return {
+            'assigned_tasks': task_stats.total,
+            'completed_tasks': task_stats.done,
+            'pending_tasks': task_stats.active,
+            'overdue_tasks': data['overdue_tasks'],
             'upcoming_deadlines': upcoming_deadlines,
             'recent_activity': recent_activity
-        })
+        }
+
+class DashboardCacheStatsView(views.APIView):
+    """
+    API endpoint for dashboard cache hit/miss counters
+    """
+    permission_classes = [IsSuperAdmin]
+    
+    def get(self, request):
+        return Response(dashboard_cache.get_stats())
+
+class TokenCacheStatsView(views.APIView):
+    """
+    API endpoint for the token authentication cache hit rate and size in this worker.
+    DELETE clears the cache and its counters.
+    """
+    permission_classes = [IsSuperAdmin]
+    
+    def get(self, request):
+        return Response(token_cache.stats())
+    
+    def delete(self, request):
+        token_cache.clear()
+        token_cache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class PerformanceMetricsView(views.APIView):
+    """
+    API endpoint for per-route request percentiles (duration, DB time, queries,
+    serialize and render time) and likely N+1 queries, as seen by this worker.
+    DELETE clears the windows.
+    """
+    permission_classes = [IsSuperAdmin]
+    
+    def get(self, request):
+        return Response(route_stats.snapshot())
+    
+    def delete(self, request):
+        route_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class TestPostView(views.APIView):
     """
@@ -620,7 +689,6 @@ class TestPostView(views.APIView):
         print(f"Content-Type: {request.content_type}")
         print(f"Request data type: {type(request.data)}")
         print(f"Request data: {request.data}")
-        print(f"Request body: {request.body}")
         
         return Response({
             'received_data': request.data,
@@ -648,45 +716,28 @@ class CreateAdminView(views.APIView):
         # Create the user with serializer
         serializer = UserSerializer(data=data)
         if serializer.is_valid():
-            # Create the user
-            user = serializer.save()
-            
             # If location_code is provided, assign the location
-            if 'location_code' in data:
-                location_code = data.get('location_code')
-                if location_code:
-                    print(f"Trying to find location with code: {location_code}")
-                    
-                    # Debug available locations
-                    all_locations = Location.objects.all()
-                    print(f"Available locations: {[(loc.name, loc.get_name_display()) for loc in all_locations]}")
-                    
-                    # First try direct name lookup
-                    try:
-                        location = Location.objects.get(name=location_code)
-                        print(f"Found location by code: {location.name}")
-                    except Location.DoesNotExist:
-                        # Try to match with display name instead
-                        location = None
-                        for loc in all_locations:
-                            if loc.get_name_display() == location_code:
-                                location = loc
-                                print(f"Found location by display name: {location.name}")
-                                break
-                    
-                    if location:
-                        # Create AdminLocation connection
-                        AdminLocation.objects.create(
-                            admin=user,
-                            location=location
-                        )
-                        
-                        # Also set the display name in the user's location field
-                        user.location = location.get_name_display()
-                        user.save()
-                        print(f"Successfully assigned location {location.get_name_display()} to user {user.username}")
-                    else:
-                        print(f"Could not find location with code or name: {location_code}")
+            location = None
+            location_code = data.get('location_code')
+            if location_code:
+                print(f"Trying to find location with code: {location_code}")
+                
+                # The code, or else the display name
+                location = location_registry.resolve(location_code)
+                if location is None:
+                    print(f"Could not find location with code or name: {location_code}")
+            
+            if location:
+                # Create the user with its home location (and its legacy display name) in one write
+                user = serializer.save(home_location=location)
+                # Create AdminLocation connection
+                AdminLocation.objects.create(
+                    admin=user,
+                    location=location
+                )
+                print(f"Successfully assigned location {location.get_name_display()} to user {user.username}")
+            else:
+                user = serializer.save()
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
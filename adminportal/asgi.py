@@ -2,6 +2,9 @@
 ASGI config for adminportal project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django, resolved against ASGI_URLCONF so the dashboards and
+task reads are served by async views; WebSocket connections go to the matching
+entry of websocket_routes.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +12,41 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'adminportal.settings')
 
-application = get_asgi_application() 
\ No newline at end of file
+django.setup(set_prefix=False)
+
+
+class AsyncRoutesASGIRequest(ASGIRequest):
+    # Django resolves a request with a urlconf attribute against it instead of ROOT_URLCONF
+    urlconf = getattr(settings, 'ASGI_URLCONF', settings.ROOT_URLCONF)
+
+
+class AsyncRoutesASGIHandler(ASGIHandler):
+    request_class = AsyncRoutesASGIRequest
+
+
+django_application = AsyncRoutesASGIHandler()
+
+# Imported once the apps are loaded
+from tasks.sockets import task_socket  # noqa: E402
+
+websocket_routes = {
+    '/ws/tasks/': task_socket,
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        route = websocket_routes.get(scope['path'])
+        if route is None:
+            # Refuse the handshake
+            await receive()
+            await send({'type': 'websocket.close'})
+            return
+        return await route(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,200 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware attaches a RequestMetrics to every request. It counts and
+times the SQL queries through a database execute wrapper, fingerprints them to
+spot N+1 patterns, and collects the time spent in serializers and renderers
+(TimedSerializerMixin, TimedJSONRenderer). The totals are sent back in a
+Server-Timing header and added to per-route rolling windows, which the
+SuperAdmin /api/metrics/ endpoint reports as percentiles. Request counts and
+latency histograms also go to the Prometheus registry served on /metrics.
+
+The windows live in process memory, so each worker reports its own requests.
+"""
+import functools
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import registry
+
+_current = ContextVar('request_metrics', default=None)
+
+HTTP_REQUESTS = registry.counter(
+    'http_requests', 'HTTP requests by route, method and status', ['route', 'method', 'status'],
+)
+HTTP_REQUEST_DURATION_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ['route', 'method'],
+)
+
+# Literals Django inlines in the SQL (LIMIT/OFFSET values) and variable-length IN lists
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_PLACEHOLDER_LIST_RE = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    """SQL with its values normalized away, so the same query shape gets the same fingerprint"""
+    sql = _PLACEHOLDER_LIST_RE.sub('(%s...)', sql)
+    return _NUMBER_RE.sub('N', sql)
+
+
+def current_metrics():
+    """The RequestMetrics of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+class RequestMetrics:
+    """Database execute wrapper plus named timing spans for one request"""
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.queries = Counter()
+        self.spans = Counter()
+        self._active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.query_count += 1
+            self.queries[sql] += 1
+
+    def timed(self, name, func, *args, **kwargs):
+        """Call func and add its duration to span `name`; nested calls are counted once"""
+        if name in self._active:
+            return func(*args, **kwargs)
+        self._active.add(name)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.spans[name] += time.perf_counter() - start
+            self._active.discard(name)
+
+    def duplicate_queries(self, threshold=None):
+        """{fingerprint: count} of query shapes run at least `threshold` times (likely N+1)"""
+        if threshold is None:
+            threshold = getattr(settings, 'PERF_DUPLICATE_QUERY_THRESHOLD', 3)
+        shapes = Counter()
+        for sql, count in self.queries.items():
+            shapes[fingerprint(sql)] += count
+        return {shape: count for shape, count in shapes.items() if count >= threshold}
+
+    def activate(self):
+        return _current.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current.reset(token)
+
+
+class RollingWindow:
+    """The last `size` samples of one measurement"""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {}
+
+        def pct(value):
+            return round(ordered[min(len(ordered) - 1, int(value / 100 * len(ordered)))], 3)
+
+        return {'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'max': round(ordered[-1], 3)}
+
+
+class RouteStats:
+    """Rolling windows of every measurement, per route"""
+    MEASUREMENTS = ('duration_ms', 'db_ms', 'queries', 'serialize_ms', 'render_ms')
+
+    def __init__(self, window_size=None):
+        self.window_size = window_size or getattr(settings, 'PERF_WINDOW_SIZE', 1024)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+    def record(self, route, values, duplicates):
+        with self.lock:
+            stats = self.routes.get(route)
+            if stats is None:
+                stats = self.routes[route] = {
+                    'requests': 0,
+                    'n_plus_one_requests': 0,
+                    'duplicate_queries': Counter(),
+                    'windows': {name: RollingWindow(self.window_size) for name in self.MEASUREMENTS},
+                }
+            stats['requests'] += 1
+            for name, value in values.items():
+                stats['windows'][name].add(value)
+            if duplicates:
+                stats['n_plus_one_requests'] += 1
+                stats['duplicate_queries'].update(duplicates)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'window_size': self.window_size,
+                'routes': {
+                    route: {
+                        'requests': stats['requests'],
+                        'n_plus_one_requests': stats['n_plus_one_requests'],
+                        **{name: window.summary() for name, window in stats['windows'].items()},
+                        'duplicate_queries': [
+                            {'sql': sql, 'count': count}
+                            for sql, count in stats['duplicate_queries'].most_common(5)
+                        ],
+                    }
+                    for route, stats in sorted(self.routes.items())
+                },
+            }
+
+
+route_stats = RouteStats()
+
+
+def server_timing(metrics, duration):
+    """Server-Timing header value for a finished request"""
+    parts = [
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.query_count} queries"',
+        f'serialize;dur={metrics.spans["serialize"] * 1000:.2f}',
+        f'render;dur={metrics.spans["render"] * 1000:.2f}',
+        f'total;dur={duration * 1000:.2f}',
+    ]
+    return ', '.join(parts)
+
+
+class TimedSerializerMixin:
+    """Serializer mixin that adds to_representation time to the request's serialize span"""
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None:
+            return super().to_representation(instance)
+        return metrics.timed('serialize', super().to_representation, instance)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that adds its time to the request's render span"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return metrics.timed('render', super().render, data, accepted_media_type, renderer_context)
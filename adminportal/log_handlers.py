@@ -0,0 +1,33 @@
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Logging handler that keeps disk and console I/O off the request thread.
+
+    Records are put on a bounded in-memory queue and written by a QueueListener
+    thread to a file (or stderr when no filename is given). When the queue is full
+    the record is dropped and counted in `dropped` instead of blocking the request.
+    """
+
+    def __init__(self, filename=None, queue_size=10000):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.dropped = 0
+        self.target = logging.FileHandler(filename) if filename else logging.StreamHandler()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() closes every handler at exit; flush what is queued first
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
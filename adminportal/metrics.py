@@ -0,0 +1,298 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters and histograms are updated from the request path and the task actions;
+gauges are computed by a callback when /metrics is scraped.
+
+Values are kept in process memory by default. Under several WSGI workers, set
+METRICS_MULTIPROCESS_DIR (and empty it when the server starts): every process then
+writes its values to its own mmap'd file in that directory, so updates need no
+locking between processes, and a scrape served by any worker sums all the files.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MemoryStore:
+    """Values of this process in a dict"""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, key, amount):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def collect(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class FileStore:
+    """
+    Values of this process in an mmap'd file that only this process writes.
+
+    Layout: an 8 byte header holding the number of bytes used, then one entry per key:
+    key length (4 bytes), the UTF-8 key padded to 8 bytes, and the value as a double.
+    """
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f'metrics_{os.getpid()}.db')
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a+b')
+        if os.path.getsize(self.path) == 0:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.mm = mmap.mmap(self.file.fileno(), os.path.getsize(self.path))
+        if self.used == 0:
+            self.used = 8
+        self.positions = {key: offset for key, _, offset in read_entries(self.mm)}
+
+    @property
+    def used(self):
+        return struct.unpack_from('q', self.mm, 0)[0]
+
+    @used.setter
+    def used(self, value):
+        struct.pack_into('q', self.mm, 0, value)
+
+    def inc(self, key, amount):
+        with self.lock:
+            offset = self.positions.get(key)
+            if offset is None:
+                offset = self.add(key)
+            value = struct.unpack_from('d', self.mm, offset)[0]
+            struct.pack_into('d', self.mm, offset, value + amount)
+
+    def add(self, key):
+        encoded = key.encode()
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        used = self.used
+        end = used + 4 + padded + 8
+        if end > len(self.mm):
+            size = len(self.mm)
+            while size < end:
+                size *= 2
+            self.mm.close()
+            self.file.truncate(size)
+            self.mm = mmap.mmap(self.file.fileno(), size)
+        struct.pack_into(f'i{padded}sd', self.mm, used, len(encoded), encoded, 0.0)
+        # Publish the entry only once it is complete, for readers in other processes
+        self.used = end
+        self.positions[key] = end - 8
+        return end - 8
+
+    def collect(self):
+        """Sum of the values in every process file of the directory"""
+        totals = {}
+        for name in os.listdir(self.directory):
+            if not (name.startswith('metrics_') and name.endswith('.db')):
+                continue
+            with open(os.path.join(self.directory, name), 'rb') as handle:
+                data = handle.read()
+            for key, value, _ in read_entries(data):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+def read_entries(data):
+    """Yield (key, value, value offset) from a FileStore buffer"""
+    if len(data) < 8:
+        return
+    used = min(struct.unpack_from('q', data, 0)[0], len(data))
+    position = 8
+    while position + 4 <= used:
+        length = struct.unpack_from('i', data, position)[0]
+        padded = length + (-(4 + length) % 8)
+        key = bytes(data[position + 4:position + 4 + length]).decode()
+        offset = position + 4 + padded
+        yield key, struct.unpack_from('d', data, offset)[0], offset
+        position = offset + 8
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+
+    @property
+    def family(self):
+        """Name used on the HELP and TYPE lines"""
+        return self.name
+
+    def key(self, suffix, labels):
+        """Store key of one sample; encoded once per label set, as this runs on every request"""
+        cache_key = (suffix, *labels.items())
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = self._keys[cache_key] = self.encode_key(suffix, labels)
+        return key
+
+    def encode_key(self, suffix, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return json.dumps([self.name, suffix, [[name, str(labels[name])] for name in self.labelnames]])
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    @property
+    def family(self):
+        return f'{self.name}_total'
+
+    def inc(self, amount=1, **labels):
+        self.registry.store().inc(self.key('_total', labels), amount)
+
+    def samples(self, values):
+        for suffix, labels, value in values:
+            yield f'{self.name}{suffix}', labels, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        store = self.registry.store()
+        bucket = next(bound for bound in self.buckets if value <= bound)
+        store.inc(self.key('_bucket', {**labels, 'le': bucket}), 1)
+        store.inc(self.key('_sum', labels), value)
+
+    def encode_key(self, suffix, labels):
+        if suffix != '_bucket':
+            return super().encode_key(suffix, labels)
+        labels = dict(labels)
+        le = format_bound(labels.pop('le'))
+        key = json.loads(super().encode_key(suffix, labels))
+        key[2].append(['le', le])
+        return json.dumps(key)
+
+    def samples(self, values):
+        series = {}
+        for suffix, labels, value in values:
+            le = labels.pop('le', None)
+            entry = series.setdefault(tuple(labels.items()), {'buckets': {}, 'sum': 0.0})
+            if suffix == '_bucket':
+                entry['buckets'][le] = value
+            else:
+                entry['sum'] = value
+        for labels, entry in series.items():
+            cumulative = 0.0
+            for bound in self.buckets:
+                le = format_bound(bound)
+                cumulative += entry['buckets'].get(le, 0.0)
+                yield f'{self.name}_bucket', {**dict(labels), 'le': le}, cumulative
+            yield f'{self.name}_sum', dict(labels), entry['sum']
+            yield f'{self.name}_count', dict(labels), cumulative
+
+
+class CallbackGauge(Metric):
+    """Gauge whose values come from `callback`, a function returning [(labels, value)]"""
+    type = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames, callback):
+        super().__init__(registry, name, documentation, labelnames)
+        self.callback = callback
+
+    def samples(self, values):
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+class MetricsRegistry:
+    """The metrics of the application and the store their values live in"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self._store = None
+        self._pid = None
+
+    def store(self):
+        # A forked worker gets a file of its own instead of writing its parent's
+        if self._store is None or self._pid != os.getpid():
+            with self.lock:
+                if self._store is None or self._pid != os.getpid():
+                    directory = getattr(settings, 'METRICS_MULTIPROCESS_DIR', None)
+                    self._store = FileStore(directory) if directory else MemoryStore()
+                    self._pid = os.getpid()
+        return self._store
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, labelnames, callback):
+        return self.register(CallbackGauge(self, name, documentation, labelnames, callback))
+
+    def reset(self):
+        """Drop the values of this process (tests)"""
+        with self.lock:
+            self._store = None
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        values = {}
+        for key, value in self.store().collect().items():
+            name, suffix, labels = json.loads(key)
+            values.setdefault(name, []).append((suffix, dict(labels), value))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {metric.family} {metric.documentation}')
+            lines.append(f'# TYPE {metric.family} {metric.type}')
+            for sample, labels, value in metric.samples(values.get(name, [])):
+                lines.append(f'{sample}{format_labels(labels)} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
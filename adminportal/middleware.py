@@ -1,63 +1,246 @@
-import time
-import logging
 import json
-from django.http import HttpResponse
-from django.utils.deprecation import MiddlewareMixin
+import logging
+import random
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .instrumentation import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION_SECONDS, RequestMetrics, route_stats, server_timing,
+)
 
 logger = logging.getLogger(__name__)
 
-class RequestLoggingMiddleware(MiddlewareMixin):
-    """Middleware to log details of all HTTP requests and responses."""
-    
-    def process_request(self, request):
-        """Log details of the request."""
-        request.start_time = time.time()
-        
-        # Log request details
-        logger.info(f"Request Method: {request.method}")
-        logger.info(f"Request Path: {request.path}")
-        logger.info(f"Request Content Type: {request.content_type}")
-        logger.info(f"Request Headers: {dict(request.headers)}")
-        
-        if request.body:
-            try:
-                # Try to decode body as JSON
-                body = json.loads(request.body)
-                logger.info(f"Request Body (JSON): {body}")
-            except json.JSONDecodeError:
-                # If not JSON, log as is
-                logger.info(f"Request Body (raw): {request.body}")
-        
-        return None
-    
-    def process_response(self, request, response):
-        """Log details of the response."""
-        # Calculate request duration
-        if hasattr(request, 'start_time'):
-            duration = time.time() - request.start_time
-            logger.info(f"Request duration: {duration:.2f}s")
-        
-        # Log response details
-        logger.info(f"Response Status: {response.status_code}")
-        logger.info(f"Response Content Type: {response.get('Content-Type', 'unknown')}")
-        
-        if hasattr(response, 'content'):
-            try:
-                # Try to decode content as JSON
-                content = json.loads(response.content)
-                logger.info(f"Response Content (JSON): {content}")
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                # If not JSON, log a summary
-                logger.info(f"Response Content (summary): {str(response.content)[:200]}...")
-        
+REDACTED = '[REDACTED]'
+
+
+def enter_tracking(stack, metrics):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(metrics))
+
+
+@contextmanager
+def track_queries(metrics):
+    """Route the queries of every database connection through metrics"""
+    with ExitStack() as stack:
+        enter_tracking(stack, metrics)
+        yield metrics
+
+
+@asynccontextmanager
+async def atrack_queries(metrics):
+    """
+    track_queries for async middleware. Connections belong to a thread, so the wrappers
+    go on the connections of the request's sync thread, where its queries run
+    (sync views and the async ORM alike).
+    """
+    stack = ExitStack()
+    await sync_to_async(enter_tracking)(stack, metrics)
+    try:
+        yield metrics
+    finally:
+        await sync_to_async(stack.close)()
+
+
+def route_name(request):
+    """URL name rather than path, so ids do not make every line unique"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+def redact(value, fields):
+    """Copy of a decoded JSON value with every key containing one of `fields` masked"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if any(field in str(key).lower() for field in fields) else redact(item, fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+class RequestLoggingMiddleware:
+    """
+    Log one structured JSON line per request.
+
+    The line has the method, route name, status, duration (perf_counter), database
+    query count and time, and response size. Headers are never logged. A sample of
+    requests (REQUEST_LOG_BODY_SAMPLE_RATE) also logs the JSON request and response
+    bodies, up to REQUEST_LOG_BODY_MAX_BYTES each, with sensitive fields redacted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.sample_rate = getattr(settings, 'REQUEST_LOG_BODY_SAMPLE_RATE', 0.0)
+        self.max_body_bytes = getattr(settings, 'REQUEST_LOG_BODY_MAX_BYTES', 4096)
+        self.redact_fields = tuple(
+            field.lower() for field in getattr(settings, 'REQUEST_LOG_REDACT_FIELDS', ('password', 'token'))
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not logger.isEnabledFor(logging.INFO):
+            return self.add_cors_headers(request, self.get_response(request))
+
+        capture_body = self.sample_rate > 0 and random.random() < self.sample_rate
+        request_body = self.capture_request_body(request) if capture_body else None
+
+        # PerformanceMiddleware, when installed, already counts the queries of the request
+        query_stats = getattr(request, 'metrics', None)
+        start = time.perf_counter()
+        if query_stats is not None:
+            response = self.get_response(request)
+        else:
+            query_stats = RequestMetrics()
+            with track_queries(query_stats):
+                response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        self.log(request, response, query_stats, duration, capture_body, request_body)
+        return self.add_cors_headers(request, response)
+
+    async def __acall__(self, request):
+        if not logger.isEnabledFor(logging.INFO):
+            return self.add_cors_headers(request, await self.get_response(request))
+
+        capture_body = self.sample_rate > 0 and random.random() < self.sample_rate
+        request_body = self.capture_request_body(request) if capture_body else None
+
+        query_stats = getattr(request, 'metrics', None)
+        start = time.perf_counter()
+        if query_stats is not None:
+            response = await self.get_response(request)
+        else:
+            query_stats = RequestMetrics()
+            async with atrack_queries(query_stats):
+                response = await self.get_response(request)
+        duration = time.perf_counter() - start
+
+        self.log(request, response, query_stats, duration, capture_body, request_body)
+        return self.add_cors_headers(request, response)
+
+    def log(self, request, response, query_stats, duration, capture_body, request_body):
+        entry = {
+            'method': request.method,
+            'route': route_name(request),
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': query_stats.query_count,
+            'db_ms': round(query_stats.db_time * 1000, 2),
+            'response_bytes': self.response_size(response),
+        }
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            entry['user_id'] = user.pk
+        if capture_body:
+            entry['request_body'] = request_body
+            entry['response_body'] = self.capture_response_body(response)
+        logger.info(json.dumps(entry, default=str))
+
+    @staticmethod
+    def response_size(response):
+        if response.streaming:
+            return None
+        return len(response.content)
+
+    def capture_request_body(self, request):
+        # Read before the view so the body is cached; skip uploads and large payloads
+        if request.content_type != 'application/json':
+            return None
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return None
+        if not length or length > self.max_body_bytes:
+            return None
+        return self.decode_body(request.body)
+
+    def capture_response_body(self, response):
+        if response.streaming or 'json' not in response.get('Content-Type', ''):
+            return None
+        if len(response.content) > self.max_body_bytes:
+            return None
+        return self.decode_body(response.content)
+
+    def decode_body(self, body):
+        try:
+            return redact(json.loads(body), self.redact_fields)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    @staticmethod
+    def add_cors_headers(request, response):
         # Handle CORS preflight requests (OPTIONS)
         if request.method == 'OPTIONS' and request.path == '/api/users/':
-            # Log that we're handling a CORS preflight request
-            logger.info("Handling CORS preflight request for /api/users/")
-            
-            # Ensure CORS headers are present
             response["Access-Control-Allow-Origin"] = "*"
             response["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
             response["Access-Control-Allow-Methods"] = "POST, GET, OPTIONS"
-        
-        return response 
\ No newline at end of file
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Record query count, DB time, duplicate queries, serialize and render time per request.
+
+    The totals go out in a Server-Timing header and into the per-route rolling windows
+    served by /api/metrics/. Disabled when PERF_INSTRUMENTATION is False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = request.metrics = RequestMetrics()
+        token = metrics.activate()
+        start = time.perf_counter()
+        try:
+            with track_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.record(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        token = metrics.activate()
+        start = time.perf_counter()
+        try:
+            async with atrack_queries(metrics):
+                response = await self.get_response(request)
+        finally:
+            metrics.deactivate(token)
+        return self.record(request, response, metrics, time.perf_counter() - start)
+
+    @staticmethod
+    def record(request, response, metrics, duration):
+        response['Server-Timing'] = server_timing(metrics, duration)
+        route = route_name(request)
+        HTTP_REQUESTS.inc(route=route or 'unmatched', method=request.method, status=response.status_code)
+        HTTP_REQUEST_DURATION_SECONDS.observe(duration, route=route or 'unmatched', method=request.method)
+        if route is not None:
+            route_stats.record(route, {
+                'duration_ms': duration * 1000,
+                'db_ms': metrics.db_time * 1000,
+                'queries': metrics.query_count,
+                'serialize_ms': metrics.spans['serialize'] * 1000,
+                'render_ms': metrics.spans['render'] * 1000,
+            }, metrics.duplicate_queries())
+        return response
@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     # Third-party apps
     'rest_framework',
     'rest_framework.authtoken',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     
     # Local apps
@@ -44,7 +46,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'adminportal.middleware.RequestLoggingMiddleware',  # Add custom logging middleware
+    'adminportal.middleware.PerformanceMiddleware',  # Server-Timing header and /api/metrics/
+    'adminportal.middleware.RequestLoggingMiddleware',  # One structured log line per request
 ]
 
 # CORS settings - enhanced for mobile and web connections
@@ -93,6 +96,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'adminportal.wsgi.application'
 
+# URLconf of the ASGI application (adminportal.asgi): ROOT_URLCONF's routes with
+# async views for the dashboards and task reads
+ASGI_URLCONF = 'adminportal.urls_asgi'
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -103,6 +110,78 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory is per process. When running several workers, switch to the
+# file-based backend so dashboard cache invalidation reaches every worker:
+#     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#     'LOCATION': BASE_DIR / 'cache',
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache alias and timeout (seconds) for the dashboard response cache
+DASHBOARD_CACHE_ALIAS = 'default'
+DASHBOARD_CACHE_TIMEOUT = 300
+
+# Per-process token-to-user cache of accounts.authentication.CachedTokenAuthentication.
+# The TTL (seconds) bounds how long another worker may keep accepting a deleted token.
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_TTL = 60
+
+# accounts.locations.location_registry keeps every Location row in each worker. Workers
+# compare a version in this cache with theirs at most every CHECK_INTERVAL seconds.
+# Deployments with several workers need a shared cache here (as for the dashboards):
+# with the per-process LocMemCache, a Location edited or deleted in one worker stays
+# stale in the others until they restart. Only newly created ones are found anyway,
+# because a lookup that misses reads the database.
+LOCATION_REGISTRY_CACHE_ALIAS = 'default'
+LOCATION_REGISTRY_CHECK_INTERVAL = 5
+
+# Logging
+# Request log lines go through a queue to a background thread, so writing them
+# never blocks a request. Set REQUEST_LOG_FILE to write them to a file instead of stderr.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'requests': {
+            'class': 'adminportal.log_handlers.NonBlockingQueueHandler',
+            'filename': os.environ.get('REQUEST_LOG_FILE'),
+        },
+    },
+    'loggers': {
+        'adminportal.middleware': {
+            'handlers': ['requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Share of requests whose JSON bodies are logged, with these fields redacted
+REQUEST_LOG_BODY_SAMPLE_RATE = 0.0
+REQUEST_LOG_BODY_MAX_BYTES = 4096
+REQUEST_LOG_REDACT_FIELDS = ('password', 'token', 'access', 'refresh', 'secret', 'authorization')
+
+# Per-request performance instrumentation (adminportal.instrumentation)
+PERF_INSTRUMENTATION = True
+# Samples kept per route and measurement for the /api/metrics/ percentiles
+PERF_WINDOW_SIZE = 1024
+# A query shape run this many times in one request is reported as a likely N+1
+PERF_DUPLICATE_QUERY_THRESHOLD = 3
+
+# Prometheus metrics on /metrics (adminportal.metrics). With several worker processes,
+# point METRICS_MULTIPROCESS_DIR at an empty directory shared by the workers.
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR')
+# /metrics requires the header "Authorization: Bearer <METRICS_TOKEN>". Without a
+# token it answers 404, unless DEBUG is on.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -150,10 +229,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
 
+# API authentication: 'token' (DB tokens), 'jwt' (signed access + refresh tokens)
+# or 'both' while clients migrate. It decides what LoginAPIView issues and which
+# Authorization schemes ("Token <key>", "Bearer <jwt>") are accepted.
+AUTH_SCHEME = os.environ.get('AUTH_SCHEME', 'both')
+
+_AUTHENTICATION_CLASSES = {
+    'token': ['accounts.authentication.CachedTokenAuthentication'],
+    'jwt': ['accounts.authentication.StatelessJWTAuthentication'],
+    'both': [
+        'accounts.authentication.CachedTokenAuthentication',
+        'accounts.authentication.StatelessJWTAuthentication',
+    ],
+}[AUTH_SCHEME]
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
+    'AUTH_HEADER_TYPES': ('Bearer',),
+    'UPDATE_LAST_LOGIN': False,
+}
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        *_AUTHENTICATION_CLASSES,
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -167,8 +267,59 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'adminportal.instrumentation.TimedJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'rest_framework.negotiation.DefaultContentNegotiation',
-} 
+}
+
+# Upper bound for the ?page_size= query parameter on task and report listings
+API_MAX_PAGE_SIZE = 100
+
+# Live event stream (/api/events/stream/, tasks.events): events kept per worker for
+# Last-Event-ID resume, seconds between keep-alive comments, and events queued for one
+# connection before it is closed as too slow
+EVENTS_REPLAY_BUFFER = 1000
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_QUEUE_SIZE = 100
+# Dotted path of the broker class the stream and the task WebSocket subscribe to.
+# tasks.events.EventBroker when unset, which only delivers events published in its
+# own process. With several ASGI workers, or to see the events of sweep_overdue_tasks
+# and run_workers, use 'tasks.events.DatabaseEventBroker': it stores events in the
+# database, polled every EVENTS_POLL_INTERVAL seconds by each worker with open
+# streams, and deletes them after EVENTS_RETENTION seconds.
+EVENTS_BROKER = None
+EVENTS_POLL_INTERVAL = 1
+EVENTS_RETENTION = 3600
+
+# Task WebSocket (/ws/tasks/, tasks.sockets): seconds to wait for more events before
+# sending a batch, and most events per message
+WEBSOCKET_BATCH_DELAY = 0.05
+WEBSOCKET_BATCH_SIZE = 50
+
+# Limits for POST /api/tasks/bulk/ and /api/tasks/bulk_transition/
+BULK_TASKS_MAX_ITEMS = 5000
+BULK_TASKS_BATCH_SIZE = 500
+
+# Rows fetched per database round trip by the streaming task and report exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Background jobs (tasks.jobqueue, manage.py run_workers): jobs claimed per round trip,
+# seconds an idle worker sleeps between polls, attempts before a job is FAILED, base and
+# cap of the retry backoff in seconds, seconds before a RUNNING job of a dead worker is
+# queued again, and seconds DONE jobs (and their idempotency keys) are kept
+JOBS_BATCH_SIZE = 10
+JOBS_POLL_INTERVAL = 1
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10
+JOBS_RETRY_BACKOFF_MAX = 3600
+JOBS_LOCK_TIMEOUT = 600
+JOBS_RETENTION = 7 * 24 * 3600
+
+# Longest side in pixels of the thumbnails a background job makes of uploaded profile
+# pictures and image report attachments; the uploaded files are kept as they are
+PROFILE_PICTURE_THUMBNAIL_SIZE = 256
+REPORT_ATTACHMENT_THUMBNAIL_SIZE = 512
+
+# Tasks flagged per transaction by manage.py sweep_overdue_tasks (tasks.overdue)
+OVERDUE_SWEEP_BATCH_SIZE = 1000
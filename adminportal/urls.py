@@ -6,11 +6,17 @@ from django.urls import path, include
 from rest_framework.authtoken.views import obtain_auth_token
 from accounts.views import (
     LoginAPIView, 
+    JWTRefreshView,
+    JWTLogoutView,
     SuperAdminDashboardView, 
     AdminDashboardView, 
     ClientDashboardView,
+    DashboardCacheStatsView,
+    PerformanceMetricsView,
+    TokenCacheStatsView,
 )
 from django.conf import settings
+from .views import metrics_view
 from django.conf.urls.static import static
 
 urlpatterns = [
@@ -18,12 +24,18 @@ urlpatterns = [
     
     # Auth endpoints
     path('api/login/', LoginAPIView.as_view(), name='login'),
+    path('api/token/refresh/', JWTRefreshView.as_view(), name='token_refresh'),
+    path('api/token/logout/', JWTLogoutView.as_view(), name='token_logout'),
     path('api/token-auth/', obtain_auth_token, name='token_auth'),
     
     # Dashboard endpoints
     path('api/dashboard/superadmin/', SuperAdminDashboardView.as_view(), name='superadmin_dashboard'),
     path('api/dashboard/admin/', AdminDashboardView.as_view(), name='admin_dashboard'),
     path('api/dashboard/client/', ClientDashboardView.as_view(), name='client_dashboard'),
+    path('api/dashboard/cache-stats/', DashboardCacheStatsView.as_view(), name='dashboard_cache_stats'),
+    path('api/metrics/', PerformanceMetricsView.as_view(), name='performance_metrics'),
+    path('api/token-cache-stats/', TokenCacheStatsView.as_view(), name='token_cache_stats'),
+    path('metrics', metrics_view, name='prometheus_metrics'),
     
     # Other API endpoints
     path('api/', include('accounts.urls')),
@@ -0,0 +1,24 @@
+"""
+URL configuration of the ASGI application (adminportal.asgi).
+
+The routes of adminportal.urls, with async views in front for the read paths the
+dashboards poll: the three dashboards and the task list and detail. Those views
+run their queries with the async ORM; every other route, and the other methods of
+the task routes, keep their sync handlers.
+"""
+from django.urls import path, re_path
+from accounts.views import SuperAdminDashboardView, AdminDashboardView, ClientDashboardView
+from tasks.views import TaskViewSet
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/dashboard/superadmin/', SuperAdminDashboardView.as_async_view(), name='superadmin_dashboard'),
+    path('api/dashboard/admin/', AdminDashboardView.as_async_view(), name='admin_dashboard'),
+    path('api/dashboard/client/', ClientDashboardView.as_async_view(), name='client_dashboard'),
+    re_path(r'^api/tasks/$', TaskViewSet.as_async_view({'get': 'list', 'post': 'create'}), name='task-list'),
+    # Digits only, so the list-level actions (api/tasks/export/ and the rest) reach the sync router
+    re_path(r'^api/tasks/(?P<pk>[0-9]+)/$', TaskViewSet.as_async_view({
+        'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+    }), name='task-detail'),
+    *sync_urlpatterns,
+]
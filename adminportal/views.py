@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from .metrics import CONTENT_TYPE, registry
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, hidden unless METRICS_TOKEN is set or DEBUG is on"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponse(status=404)
+    elif not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(registry.exposition(), content_type=CONTENT_TYPE)
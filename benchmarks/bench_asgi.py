@@ -0,0 +1,216 @@
+"""
+Compare sync WSGI and async ASGI throughput under a mixed dashboard polling workload.
+Run using: python -m benchmarks.bench_asgi [--tasks 10000] [--concurrency 1,8,32]
+    [--duration 5] [--dashboard-cache] [--database-file PATH]
+
+Each server is driven in-process with real token authentication, through the whole
+middleware stack:
+- wsgi: adminportal.wsgi.application (sync views), one thread per concurrent client,
+  like a threaded WSGI server
+- asgi_sync_views: Django's plain ASGIHandler on ROOT_URLCONF, so the sync views run
+  in threads under the event loop
+- asgi: adminportal.asgi.application, with the async dashboard and task read views
+  of ASGI_URLCONF, every concurrent client a coroutine on one event loop
+
+Every client picks requests from WORKLOAD by weight until --duration runs out. The
+dashboard cache is off unless --dashboard-cache is given, so the queries run. The
+report has the requests per second, latency percentiles and status codes for each
+server and concurrency level.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import setup_django, benchmark_database, summarize, report
+
+# (weight, role, path) of the polling requests; {task} is a task the role can see
+WORKLOAD = [
+    (30, 'client', '/api/dashboard/client/'),
+    (25, 'client', '/api/tasks/?page_size=20'),
+    (10, 'client', '/api/tasks/{task}/'),
+    (15, 'admin', '/api/dashboard/admin/'),
+    (10, 'admin', '/api/tasks/?cursor=&page_size=20'),
+    (5, 'superadmin', '/api/dashboard/superadmin/'),
+    (5, 'superadmin', '/api/tasks/?page=2&page_size=20'),
+]
+
+
+def wsgi_request(application, path, authorization):
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_AUTHORIZATION': authorization,
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    response = application(environ, lambda line, headers: status.append(int(line.split()[0])))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return status[0]
+
+
+async def asgi_request(application, path, authorization):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', authorization.encode())],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    received = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not received.is_set():
+            received.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def pick_requests(rng, requests, count):
+    weights = [weight for weight, _, _ in requests]
+    return rng.choices(requests, weights=weights, k=count)
+
+
+def result(samples, statuses, elapsed):
+    return {
+        'requests': len(samples),
+        'requests_per_second': round(len(samples) / elapsed, 1),
+        'latency': summarize(samples) if samples else None,
+        'statuses': dict(sorted(statuses.items())),
+    }
+
+
+def run_wsgi(application, requests, concurrency, duration, seed):
+    samples, statuses, lock = [], {}, threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            [(_, authorization, path)] = pick_requests(rng, requests, 1)
+            start = time.perf_counter()
+            status = wsgi_request(application, path, authorization)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return result(samples, statuses, time.perf_counter() - start)
+
+
+def run_asgi(application, requests, concurrency, duration, seed):
+    samples, statuses = [], {}
+
+    async def client(index, deadline):
+        rng = random.Random(seed + index)
+        while time.perf_counter() < deadline:
+            [(_, authorization, path)] = pick_requests(rng, requests, 1)
+            start = time.perf_counter()
+            status = await asgi_request(application, path, authorization)
+            samples.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    async def run():
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(client(index, deadline) for index in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return result(samples, statuses, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrent client counts')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per server and concurrency level')
+    parser.add_argument('--dashboard-cache', action='store_true', help='Keep the dashboard response cache on')
+    parser.add_argument('--database-file', help='SQLite file for the test database instead of shared memory')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from rest_framework.authtoken.models import Token
+    from adminportal.asgi import application as asgi_application
+    from benchmarks.dataset import seed_dataset
+
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    if not args.dashboard_cache:
+        settings.DASHBOARD_CACHE_TIMEOUT = 0
+    servers = {
+        'wsgi': (run_wsgi, WSGIHandler()),
+        'asgi_sync_views': (run_asgi, ASGIHandler()),
+        'asgi': (run_asgi, asgi_application),
+    }
+
+    with benchmark_database(args.database_file):
+        sample = seed_dataset(args.tasks, seed=args.seed)
+        authorization = {
+            role: f'Token {Token.objects.get_or_create(user=sample[role])[0].key}'
+            for role in ('superadmin', 'admin', 'client')
+        }
+        requests = [
+            (weight, authorization[role], path.format(task=sample['task'].id))
+            for weight, role, path in WORKLOAD
+        ]
+        results = {
+            'tasks': args.tasks,
+            'duration_s': args.duration,
+            'dashboard_cache': args.dashboard_cache,
+            'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+        }
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            results[f'concurrency_{concurrency}'] = {
+                name: run(application, requests, concurrency, args.duration, args.seed)
+                for name, (run, application) in servers.items()
+            }
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
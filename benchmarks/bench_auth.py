@@ -0,0 +1,90 @@
+"""
+Measure the per-request cost of each authentication scheme.
+Run using: python -m benchmarks.bench_auth [--repeat 2000] [--users 1000]
+
+For each scheme this times authenticate() on its own, and a full GET of a small
+client task listing through the test client. It also counts the queries that
+authentication makes. The schemes are:
+- token_db: DRF TokenAuthentication, one Token JOIN User query per request
+- token_cached: CachedTokenAuthentication with a warm cache
+- token_cache_miss: CachedTokenAuthentication with a zero TTL
+- jwt: StatelessJWTAuthentication
+"""
+import argparse
+import logging
+
+from benchmarks.harness import setup_django, benchmark_database, time_calls, summarize, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=1000, help='Users with a token, so lookups hit a real index')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.authentication import TokenAuthentication
+    from rest_framework.authtoken.models import Token
+    from rest_framework.request import Request
+    from rest_framework.test import APIClient, APIRequestFactory
+    from accounts.authentication import CachedTokenAuthentication, StatelessJWTAuthentication, issue_jwt, token_cache
+    from accounts.models import User, Location
+    from tasks.models import Task
+
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+    factory = APIRequestFactory()
+
+    with benchmark_database():
+        location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, home_location=location)
+        users = User.objects.bulk_create(
+            User(username=f'client{index}', role=User.Role.CLIENT, home_location=location)
+            for index in range(args.users)
+        )
+        Token.objects.bulk_create(Token(key=Token.generate_key(), user=user) for user in users)
+        client = users[-1]
+        Task.objects.bulk_create(
+            Task(title=f'Task {index}', description='Benchmark task', location=location, assigned_by=admin,
+                 assigned_to=client, deadline='2030-01-01T00:00:00Z')
+            for index in range(5)
+        )
+        token_header = f'Token {Token.objects.get(user=client).key}'
+        jwt_header = f"Bearer {issue_jwt(client)['access']}"
+
+        schemes = {
+            'token_db': (TokenAuthentication(), token_header, None),
+            'token_cached': (CachedTokenAuthentication(), token_header, 60),
+            'token_cache_miss': (CachedTokenAuthentication(), token_header, 0),
+            'jwt': (StatelessJWTAuthentication(), jwt_header, None),
+        }
+        results = {'repeat': args.repeat, 'users': args.users}
+        for name, (authentication, header, ttl) in schemes.items():
+            token_cache._ttl = ttl
+            token_cache.clear()
+            request = Request(factory.get('/api/tasks/', HTTP_AUTHORIZATION=header))
+            authentication.authenticate(request)  # Warm the cache where there is one
+            with CaptureQueriesContext(connection) as queries:
+                user, _ = authentication.authenticate(request)
+            assert user.id == client.id
+            auth_queries = len(queries)
+
+            api = APIClient()
+            api.credentials(HTTP_AUTHORIZATION=header)
+            full_request = None
+            if name != 'token_db':
+                # The API only runs the configured classes; DRF's own class is timed alone
+                assert api.get('/api/tasks/?page_size=5').status_code == 200
+                full_request = summarize(time_calls(lambda: api.get('/api/tasks/?page_size=5'), args.repeat // 4))
+            results[name] = {
+                'auth_queries': auth_queries,
+                'authenticate': summarize(time_calls(lambda: authentication.authenticate(request), args.repeat)),
+                'task_list_request': full_request,
+            }
+        token_cache._ttl = None
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
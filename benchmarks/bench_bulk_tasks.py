@@ -0,0 +1,86 @@
+"""
+Compare task creation and approval throughput of the single-object and bulk endpoints.
+Run using: python -m benchmarks.bench_bulk_tasks [--single 300] [--bulk 5000]
+"""
+import argparse
+import io
+import time
+from datetime import timedelta
+
+from benchmarks.harness import setup_django, benchmark_database, seed_tasks, report
+
+
+def rows_per_second(rows, seconds):
+    return round(rows / seconds, 1) if seconds else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--single', type=int, default=300, help='Tasks created one POST at a time')
+    parser.add_argument('--bulk', type=int, default=5000, help='Tasks created through the bulk endpoint')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from tasks.models import Task
+
+    with benchmark_database():
+        users = seed_tasks(0)
+        api = APIClient()
+        api.force_authenticate(users['admin'])
+        payload = {
+            'title': 'Benchmark task',
+            'description': 'Created by bench_bulk_tasks',
+            'location': users['location'].id,
+            'assigned_by': users['admin'].id,
+            'assigned_to': users['client'].id,
+            'deadline': (timezone.now() + timedelta(days=7)).isoformat(),
+        }
+
+        start = time.perf_counter()
+        for _ in range(args.single):
+            api.post('/api/tasks/', payload, format='json')
+        single_create = time.perf_counter() - start
+
+        items = [payload] * args.bulk
+        start = time.perf_counter()
+        for offset in range(0, len(items), settings.BULK_TASKS_MAX_ITEMS):
+            response = api.post('/api/tasks/bulk/', items[offset:offset + settings.BULK_TASKS_MAX_ITEMS], format='json')
+            assert response.status_code == 201, response.data
+        bulk_create = time.perf_counter() - start
+
+        Task.objects.update(status=Task.Status.COMPLETED)
+        call_command('rebuild_task_stats', stdout=io.StringIO())
+        ids = list(Task.objects.values_list('id', flat=True))
+        single_ids, bulk_ids = ids[:args.single], ids[args.single:]
+
+        start = time.perf_counter()
+        for task_id in single_ids:
+            api.post(f'/api/tasks/{task_id}/approve_task/')
+        single_approve = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for offset in range(0, len(bulk_ids), settings.BULK_TASKS_MAX_ITEMS):
+            api.post('/api/tasks/bulk_transition/', {
+                'action': 'approve_task',
+                'ids': bulk_ids[offset:offset + settings.BULK_TASKS_MAX_ITEMS],
+            }, format='json')
+        bulk_approve = time.perf_counter() - start
+
+        report({
+            'create': {
+                'single_rows_per_sec': rows_per_second(args.single, single_create),
+                'bulk_rows_per_sec': rows_per_second(args.bulk, bulk_create),
+            },
+            'approve': {
+                'single_rows_per_sec': rows_per_second(len(single_ids), single_approve),
+                'bulk_rows_per_sec': rows_per_second(len(bulk_ids), bulk_approve),
+            },
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the completion rate query over the daily task stats rollup with the same
+conditional aggregation over the Task table.
+Run using: python -m benchmarks.bench_completion [--tasks 50000] [--repeat 30]
+
+Both compute, per location, the tasks due and done in this week, month, quarter
+and year (LocationDailyTaskStats.completion). The rollup reads at most a row per
+location and day; the Task query reads every task due in the year.
+"""
+import argparse
+from datetime import datetime, time, timedelta
+
+from benchmarks.harness import setup_django, benchmark_database, time_calls, summarize, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.db.models import Count, Q
+    from django.utils import timezone
+    from benchmarks.dataset import seed_dataset
+    from tasks.models import Task, LocationDailyTaskStats
+
+    with benchmark_database():
+        seed_dataset(args.tasks)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        today = timezone.localdate()
+        windows = LocationDailyTaskStats.completion_windows(today)
+
+        def from_rollup():
+            return {
+                row['location_id']: LocationDailyTaskStats.completion_rates(row)
+                for row in LocationDailyTaskStats.completion(today)
+            }
+
+        def day_start(day):
+            return timezone.make_aware(datetime.combine(day, time.min), timezone.get_default_timezone())
+
+        def from_tasks():
+            counts = {}
+            for window, (first, last) in windows.items():
+                in_window = Q(deadline__gte=day_start(first), deadline__lt=day_start(last + timedelta(days=1)))
+                counts[f'{window}_due'] = Count('id', filter=in_window)
+                counts[f'{window}_done'] = Count('id', filter=in_window & Q(status__in=Task.DONE_STATUSES))
+            rows = Task.objects.filter(
+                deadline__gte=day_start(min(first for first, _ in windows.values())),
+                deadline__lt=day_start(max(last for _, last in windows.values()) + timedelta(days=1)),
+            ).values('location_id').annotate(**counts).order_by()
+            return {row['location_id']: LocationDailyTaskStats.completion_rates(row) for row in rows}
+
+        rollup, tasks = from_rollup(), from_tasks()
+        assert rollup == tasks, 'The rollup must match the Task table'
+        report({
+            'tasks': args.tasks,
+            'today': today.isoformat(),
+            'rollup_rows': LocationDailyTaskStats.objects.count(),
+            'rollup': summarize(time_calls(from_rollup, args.repeat)),
+            'task_table': summarize(time_calls(from_tasks, args.repeat)),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Load-test the live event stream (GET /api/events/stream/) with many idle connections.
+Run using: python -m benchmarks.bench_events [--connections 5000] [--clients 500]
+    [--admins 0.1] [--writes 50] [--idle 5] [--heartbeat 15]
+
+The connections are made in-process against adminportal.asgi.application, with
+the ASGI receive/send callables played by the script, so no server or sockets are
+involved. Every connection authenticates with a JWT. The --admins share of the
+connections are the admin of the one location, who see every event; the rest are
+spread over --clients clients, who see only the tasks assigned to them.
+
+It reports:
+- connect: the time to open every stream, up to its first bytes
+- memory: the RSS growth per open connection
+- fan_out: for --writes tasks created from another thread, the time from the start
+  of the write to each stream that should see it receiving the event, and the
+  write itself
+- idle: the CPU time the process uses over --idle seconds of open, idle streams
+- disconnect: the time for every stream to go away after an http.disconnect, and
+  the broker's subscriber count afterwards, which must be 0
+"""
+import argparse
+import asyncio
+import logging
+import random
+import re
+import time
+from datetime import timedelta
+
+from benchmarks.harness import setup_django, benchmark_database, summarize, report, rss_kb
+
+EVENT_ID = re.compile(rb'^id: (\S+)\nevent: task\.assigned\n', re.MULTILINE)
+
+
+class Connection:
+    """One client of the stream, as the ASGI receive/send pair of its request"""
+
+    def __init__(self, header, user_id, arrivals):
+        self.header = header
+        self.user_id = user_id
+        self.arrivals = arrivals
+        self.status = None
+        self.opened = asyncio.Event()
+        self.requested = False
+        self.disconnected = asyncio.Event()
+
+    def scope(self, index):
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': '/api/events/stream/',
+            'raw_path': b'/api/events/stream/',
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'authorization', self.header.encode())],
+            'client': ('127.0.0.1', 10000 + index),
+            'server': ('testserver', 80),
+        }
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            now = time.perf_counter()
+            self.opened.set()
+            for event_id in EVENT_ID.findall(message.get('body', b'')):
+                self.arrivals.setdefault(event_id.decode(), []).append(now)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=500, help='Distinct client users behind the connections')
+    parser.add_argument('--admins', type=float, default=0.1, help='Share of the connections made by the admin')
+    parser.add_argument('--writes', type=int, default=50, help='Tasks created while the streams are open')
+    parser.add_argument('--idle', type=float, default=5, help='Seconds to measure idle CPU over')
+    parser.add_argument('--heartbeat', type=float, default=15, help='EVENTS_HEARTBEAT_SECONDS')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.utils import timezone
+    from accounts.authentication import issue_jwt
+    from accounts.models import User, Location, AdminLocation
+    from adminportal.asgi import application
+    from tasks.events import broker
+    from tasks.models import Task
+
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    settings.EVENTS_HEARTBEAT_SECONDS = args.heartbeat
+    # Room for every event of the run, so no stream is dropped for falling behind
+    broker._max_queued = max(broker.max_queued, args.writes + 1)
+    rng = random.Random(args.seed)
+
+    with benchmark_database():
+        location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, home_location=location)
+        AdminLocation.objects.create(admin=admin, location=location)
+        clients = User.objects.bulk_create(
+            User(username=f'client{index}', role=User.Role.CLIENT, home_location=location)
+            for index in range(args.clients)
+        )
+        headers = {user.id: f"Bearer {issue_jwt(user)['access']}" for user in [admin, *clients]}
+        deadline = timezone.now() + timedelta(days=7)
+
+        def create_task(index, client_id):
+            return Task.objects.create(
+                title=f'Task {index}', description='Benchmark task', location=location,
+                assigned_by=admin, assigned_to_id=client_id, deadline=deadline,
+            )
+
+        async def run():
+            arrivals = {}
+            connections = []
+            for index in range(args.connections):
+                user_id = admin.id if rng.random() < args.admins else rng.choice(clients).id
+                connections.append(Connection(headers[user_id], user_id, arrivals))
+            results = {'connections': args.connections, 'clients': args.clients, 'writes': args.writes}
+
+            rss_before = rss_kb()
+            start = time.perf_counter()
+            requests = [
+                asyncio.ensure_future(application(connection.scope(index), connection.receive, connection.send))
+                for index, connection in enumerate(connections)
+            ]
+            await asyncio.gather(*(connection.opened.wait() for connection in connections))
+            connect_seconds = time.perf_counter() - start
+            statuses = {}
+            for connection in connections:
+                statuses[connection.status] = statuses.get(connection.status, 0) + 1
+            rss_after = rss_kb()
+            results['connect'] = {
+                'total_s': round(connect_seconds, 3),
+                'per_second': round(args.connections / connect_seconds),
+                'statuses': statuses,
+                'subscribers': broker.stats()['subscribers'],
+            }
+            results['memory'] = {
+                'rss_before_kb': rss_before,
+                'rss_after_kb': rss_after,
+                'per_connection_kb': round((rss_after - rss_before) / args.connections, 2),
+            }
+
+            by_user = {}
+            for connection in connections:
+                by_user[connection.user_id] = by_user.get(connection.user_id, 0) + 1
+            latencies, write_times, missing = [], [], 0
+            for index in range(args.writes):
+                client_id = rng.choice(clients).id
+                expected = by_user.get(admin.id, 0) + by_user.get(client_id, 0)
+                started = time.perf_counter()
+                # A request thread elsewhere in the worker makes the write
+                task = await asyncio.to_thread(create_task, index, client_id)
+                write_times.append(time.perf_counter() - started)
+                event_id = f'{broker.stream_id}-{broker.seq}'
+                wait_until = time.perf_counter() + 5
+                while len(arrivals.get(event_id, ())) < expected and time.perf_counter() < wait_until:
+                    await asyncio.sleep(0.001)
+                received = arrivals.pop(event_id, [])
+                missing += expected - len(received)
+                latencies.extend(arrival - started for arrival in received)
+                assert task.assigned_to_id == client_id
+            results['fan_out'] = {
+                'deliveries': len(latencies),
+                'missing': missing,
+                'latency': summarize(latencies) if latencies else None,
+                'write': summarize(write_times) if write_times else None,
+            }
+
+            cpu_before = time.process_time()
+            await asyncio.sleep(args.idle)
+            cpu = time.process_time() - cpu_before
+            results['idle'] = {
+                'seconds': args.idle,
+                'heartbeat_s': args.heartbeat,
+                'cpu_s': round(cpu, 3),
+                'cpu_percent': round(100 * cpu / args.idle, 2),
+            }
+
+            start = time.perf_counter()
+            for connection in connections:
+                connection.disconnected.set()
+            await asyncio.gather(*requests)
+            results['disconnect'] = {
+                'total_s': round(time.perf_counter() - start, 3),
+                'subscribers': broker.stats()['subscribers'],
+            }
+            results['broker'] = broker.stats()
+            return results
+
+        results = asyncio.run(run())
+        assert results['disconnect']['subscribers'] == 0, 'streams were left subscribed'
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure the overhead of PerformanceMiddleware on real endpoints.
+Run using: python -m benchmarks.bench_instrumentation [--tasks 2000] [--repeat 300]
+
+Each endpoint is timed with PERF_INSTRUMENTATION off and on, alternating between
+the two so drift affects both equally. Request logging is silenced for both.
+"""
+import argparse
+import logging
+
+from benchmarks.harness import setup_django, benchmark_database, seed_tasks, summarize, report, time_calls
+
+ENDPOINTS = (
+    '/api/tasks/?page_size=100',
+    '/api/task-reports/',
+    '/api/users/',
+    '/api/dashboard/superadmin/',
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+    from accounts import dashboard_cache
+
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+
+    def make_client(enabled, user):
+        # The middleware chain is built on the first request of each client
+        with override_settings(PERF_INSTRUMENTATION=enabled, DASHBOARD_CACHE_TIMEOUT=0):
+            api = APIClient()
+            api.force_authenticate(user)
+            api.get('/api/users/')
+        return api
+
+    with benchmark_database():
+        users = seed_tasks(args.tasks)
+        clients = {
+            'off': make_client(False, users['superadmin']),
+            'on': make_client(True, users['superadmin']),
+        }
+        results = {'tasks': args.tasks}
+        for url in ENDPOINTS:
+            samples = {'off': [], 'on': []}
+            for _ in range(args.repeat):
+                for mode, api in clients.items():
+                    dashboard_cache.bump_data_version()  # Time the uncached dashboard
+                    samples[mode] += time_calls(lambda: api.get(url), 1)
+            off, on = summarize(samples['off']), summarize(samples['on'])
+            results[url] = {
+                'off': off,
+                'on': on,
+                'overhead_p50_pct': round((on['p50_ms'] / off['p50_ms'] - 1) * 100, 2),
+            }
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
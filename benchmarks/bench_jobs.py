@@ -0,0 +1,109 @@
+"""
+Measure enqueue and dequeue throughput of the background job queue (tasks.jobqueue).
+Run using: python -m benchmarks.bench_jobs [--jobs 5000] [--processes 1,2,4]
+    [--work-ms 0] [--batch-size 10] [--database-file PATH]
+
+enqueue: --jobs jobs queued one at a time, each write its own transaction as in a
+request. Modes:
+- plain: enqueue() without an idempotency key
+- idempotency_key: enqueue() with a new key per job
+- duplicate_key: enqueue() of keys that are taken, which returns the existing job
+- on_commit: enqueue_on_commit() inside transaction.atomic(), the way the views
+  queue their side effects
+
+dequeue: --jobs jobs, each sleeping --work-ms, worked by run_workers(until_empty=True)
+for each --processes count, from a full queue to an empty one. Worker processes
+need a database they can share, so SQLite runs on a file (a temporary one unless
+--database-file is given).
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.harness import setup_django, benchmark_database, summarize, report
+
+
+def sleep_job(ms):
+    if ms:
+        time.sleep(ms / 1000)
+
+
+def timed_enqueues(count, enqueue_one):
+    samples = []
+    start = time.perf_counter()
+    for index in range(count):
+        started = time.perf_counter()
+        enqueue_one(index)
+        samples.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - start
+    return {'jobs_per_second': round(count / elapsed), 'latency': summarize(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--jobs', type=int, default=5000)
+    parser.add_argument('--processes', default='1,2,4', help='Comma-separated worker process counts')
+    parser.add_argument('--work-ms', type=float, default=0, help='Milliseconds each dequeued job sleeps')
+    parser.add_argument('--batch-size', type=int, default=10, help='JOBS_BATCH_SIZE')
+    parser.add_argument('--database-file', help='SQLite file for the test database (default: a temporary file)')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.db import connection, transaction
+    from tasks.jobqueue import job, enqueue, enqueue_on_commit, run_workers
+    from tasks.models import Job
+
+    settings.JOBS_BATCH_SIZE = args.batch_size
+    work = job(name='benchmarks.sleep')(sleep_job)
+    database_file = args.database_file
+    if database_file is None and 'sqlite' in settings.DATABASES['default']['ENGINE']:
+        database_file = os.path.join(tempfile.mkdtemp(), 'bench_jobs.sqlite3')
+
+    with benchmark_database(database_file):
+        results = {
+            'jobs': args.jobs,
+            'work_ms': args.work_ms,
+            'batch_size': args.batch_size,
+            'database': connection.vendor,
+        }
+
+        def queue_on_commit(index):
+            with transaction.atomic():
+                enqueue_on_commit(work, {'ms': 0})
+
+        results['enqueue'] = {
+            'plain': timed_enqueues(args.jobs, lambda index: enqueue(work, {'ms': 0})),
+            'idempotency_key': timed_enqueues(
+                args.jobs, lambda index: enqueue(work, {'ms': 0}, idempotency_key=f'bench:{index}'),
+            ),
+            'duplicate_key': timed_enqueues(
+                args.jobs, lambda index: enqueue(work, {'ms': 0}, idempotency_key=f'bench:{index}'),
+            ),
+            'on_commit': timed_enqueues(args.jobs, queue_on_commit),
+        }
+        assert Job.objects.count() == 3 * args.jobs, 'duplicate keys queued new jobs'
+
+        results['dequeue'] = {}
+        for processes in [int(value) for value in args.processes.split(',')]:
+            Job.objects.all().delete()
+            Job.objects.bulk_create(
+                (Job(name=work.job_name, kwargs={'ms': args.work_ms}) for _ in range(args.jobs)),
+                batch_size=1000,
+            )
+            start = time.perf_counter()
+            succeeded, failed = run_workers(processes, until_empty=True)
+            elapsed = time.perf_counter() - start
+            results['dequeue'][f'processes_{processes}'] = {
+                'succeeded': succeeded,
+                'failed': failed,
+                'left_queued': Job.objects.filter(status=Job.Status.QUEUED).count(),
+                'seconds': round(elapsed, 3),
+                'jobs_per_second': round(succeeded / elapsed),
+            }
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compare deep-page latency of page number and keyset pagination on /api/tasks/.
+Run using: python -m benchmarks.bench_pagination [--tasks 20000] [--page 1000]
+"""
+import argparse
+
+from benchmarks.harness import setup_django, benchmark_database, seed_tasks, time_calls, summarize, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.test import APIClient
+    from tasks.models import Task
+    from tasks.pagination import TaskPagination
+
+    with benchmark_database():
+        users = seed_tasks(args.tasks)
+        api = APIClient()
+        api.force_authenticate(users['superadmin'])
+
+        # The keyset cursor a client holds after paging to just before the target page
+        offset = (args.page - 1) * args.page_size
+        pagination = TaskPagination()
+        last_row = Task.objects.order_by(*pagination.ordering)[offset - 1]
+        cursor = pagination.encode_cursor(pagination.get_position(last_row), reverse=False)
+
+        page_url = f'/api/tasks/?page={args.page}&page_size={args.page_size}'
+        cursor_url = f'/api/tasks/?cursor={cursor}&page_size={args.page_size}'
+        page_ids = [row['id'] for row in api.get(page_url).data['results']]
+        cursor_ids = [row['id'] for row in api.get(cursor_url).data['results']]
+        assert page_ids == cursor_ids, 'Both modes must return the same page'
+
+        report({
+            'tasks': args.tasks,
+            'page': args.page,
+            'page_size': args.page_size,
+            'page_number': summarize(time_calls(lambda: api.get(page_url), args.repeat)),
+            'keyset': summarize(time_calls(lambda: api.get(cursor_url), args.repeat)),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure the per-request overhead of the request logging middleware.
+Run using: python -m benchmarks.bench_request_logging [--rows 100] [--repeat 2000]
+    [--middleware adminportal.middleware.RequestLoggingMiddleware]
+
+The middleware wraps a view that returns a JSON page of `rows` tasks; the overhead
+is the latency over calling that view directly. Log records go through the
+NonBlockingQueueHandler to os.devnull at INFO level, so formatting is included
+but terminal output is not.
+"""
+import argparse
+import json
+import logging
+import os
+
+from benchmarks.harness import setup_django, time_calls, summarize, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--middleware', default='adminportal.middleware.RequestLoggingMiddleware')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from django.utils.module_loading import import_string
+    from adminportal.log_handlers import NonBlockingQueueHandler
+
+    middleware_class = import_string(args.middleware)
+    handler = NonBlockingQueueHandler(filename=os.devnull)
+    middleware_logger = logging.getLogger(middleware_class.__module__)
+    middleware_logger.handlers = [handler]
+    middleware_logger.setLevel(logging.INFO)
+    middleware_logger.propagate = False
+
+    page = json.dumps({
+        'count': args.rows,
+        'results': [
+            {'id': index, 'title': f'Task {index}', 'description': 'Routine inspection ' * 5,
+             'status': 'PENDING', 'site_name': f'Site {index}', 'service_type': ['AC', 'DC']}
+            for index in range(args.rows)
+        ],
+    }).encode()
+
+    def view(request):
+        return HttpResponse(page, content_type='application/json')
+
+    factory = RequestFactory()
+    login_body = {'username': 'tnadmin', 'password': 'secret'}
+
+    def get_request():
+        request = factory.get('/api/tasks/', HTTP_AUTHORIZATION='Token abc123')
+        request.user = AnonymousUser()
+        return request
+
+    def post_request():
+        request = factory.post('/api/login/', login_body, content_type='application/json')
+        request.user = AnonymousUser()
+        return request
+
+    middleware = middleware_class(view)
+    results = {'middleware': args.middleware, 'rows': args.rows}
+    for name, make_request in (('get_list', get_request), ('post_json', post_request)):
+        bare = summarize(time_calls(lambda: view(make_request()), args.repeat))
+        wrapped = summarize(time_calls(lambda: middleware(make_request()), args.repeat))
+        results[name] = {
+            'bare': bare,
+            'with_middleware': wrapped,
+            'overhead_p50_ms': round(wrapped['p50_ms'] - bare['p50_ms'], 3),
+        }
+    handler.close()
+    report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""
+Load-test the task WebSocket (/ws/tasks/) with many concurrent sockets on one process.
+Run using: python -m benchmarks.bench_websockets [--sockets 10000] [--writes 50]
+    [--burst 200] [--burst-rate 2000] [--slow 0.01] [--idle 5]
+
+The sockets are made in-process against adminportal.asgi.application, with the
+ASGI receive/send callables played by the script, so no server or network is
+involved. Each socket is a different client, authenticated with a DB token
+(?token=). It reports:
+- connect: the time to authenticate and accept every socket
+- memory: the RSS growth per open socket
+- fan_out: for --writes tasks created from another thread, the time from the start
+  of the write to the assignee's socket receiving the event
+- burst: --burst events for every client published at --burst-rate per second. It
+  reports how many messages carried them (batching) and the time until every fast
+  socket had all of them. The --slow share of the sockets take 0.2s for each
+  send, and should be closed with code 1013 when they fall EVENTS_QUEUE_SIZE
+  events behind.
+- idle: the CPU time the process uses over --idle seconds of open, idle sockets
+- disconnect: the time for every socket to go away, and the broker's subscriber
+  count afterwards, which must be 0
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+from benchmarks.harness import setup_django, benchmark_database, summarize, report, rss_kb
+
+SLOW_SEND_SECONDS = 0.2
+
+
+class Socket:
+    """One WebSocket client, as the ASGI receive/send pair of its connection"""
+
+    def __init__(self, token, user_id, slow=False):
+        self.token = token
+        self.user_id = user_id
+        self.slow = slow
+        self.accepted = asyncio.Event()
+        self.closed = None
+        self.connected = False
+        self.disconnected = asyncio.Event()
+        self.messages = 0
+        self.events = 0
+        self.arrivals = {}
+
+    def scope(self):
+        return {
+            'type': 'websocket',
+            'path': '/ws/tasks/',
+            'query_string': f'token={self.token}'.encode(),
+            'headers': [(b'host', b'testserver')],
+        }
+
+    async def receive(self):
+        if not self.connected:
+            self.connected = True
+            return {'type': 'websocket.connect'}
+        await self.disconnected.wait()
+        return {'type': 'websocket.disconnect', 'code': 1000}
+
+    async def send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif message['type'] == 'websocket.close':
+            self.closed = message.get('code')
+            self.accepted.set()
+        elif message['type'] == 'websocket.send':
+            now = time.perf_counter()
+            events = json.loads(message['text']).get('events') or []
+            if events:
+                self.messages += 1
+                self.events += len(events)
+                for event in events:
+                    self.arrivals[event['id']] = now
+            if self.slow:
+                await asyncio.sleep(SLOW_SEND_SECONDS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sockets', type=int, default=10000)
+    parser.add_argument('--writes', type=int, default=50, help='Tasks created while the sockets are open')
+    parser.add_argument('--burst', type=int, default=200, help='Events published to every client at once')
+    parser.add_argument('--burst-rate', type=float, default=2000, help='Burst events published per second')
+    parser.add_argument('--slow', type=float, default=0.01, help='Share of the sockets that read slowly')
+    parser.add_argument('--idle', type=float, default=5, help='Seconds to measure idle CPU over')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+    from accounts.models import User, Location, AdminLocation
+    from adminportal.asgi import application
+    from tasks.events import broker
+    from tasks.models import Task
+
+    rng = random.Random(args.seed)
+
+    with benchmark_database():
+        location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, home_location=location)
+        AdminLocation.objects.create(admin=admin, location=location)
+        clients = User.objects.bulk_create(
+            User(username=f'client{index}', role=User.Role.CLIENT, home_location=location)
+            for index in range(args.sockets)
+        )
+        tokens = Token.objects.bulk_create(Token(key=Token.generate_key(), user=user) for user in clients)
+        deadline = timezone.now() + timedelta(days=7)
+
+        def create_task(index, client_id):
+            return Task.objects.create(
+                title=f'Task {index}', description='Benchmark task', location=location,
+                assigned_by=admin, assigned_to_id=client_id, deadline=deadline,
+            )
+
+        def publish_burst(user_ids):
+            for index in range(args.burst):
+                broker.publish('task.assigned', {'task_id': index}, user_ids=user_ids)
+                time.sleep(1 / args.burst_rate)
+
+        async def run():
+            sockets = [Socket(token.key, token.user_id, slow=rng.random() < args.slow) for token in tokens]
+            by_user = {socket.user_id: socket for socket in sockets}
+            results = {'sockets': args.sockets, 'slow_sockets': sum(socket.slow for socket in sockets)}
+
+            rss_before = rss_kb()
+            start = time.perf_counter()
+            connections = [asyncio.ensure_future(application(socket.scope(), socket.receive, socket.send)) for socket in sockets]
+            await asyncio.gather(*(socket.accepted.wait() for socket in sockets))
+            connect_seconds = time.perf_counter() - start
+            rss_after = rss_kb()
+            results['connect'] = {
+                'total_s': round(connect_seconds, 3),
+                'per_second': round(args.sockets / connect_seconds),
+                'refused': sum(socket.closed is not None for socket in sockets),
+                'subscribers': broker.stats()['subscribers'],
+            }
+            results['memory'] = {
+                'rss_before_kb': rss_before,
+                'rss_after_kb': rss_after,
+                'per_socket_kb': round((rss_after - rss_before) / args.sockets, 2),
+            }
+
+            latencies, missing = [], 0
+            fast = [socket for socket in sockets if not socket.slow]
+            for index in range(args.writes):
+                socket = rng.choice(fast)
+                started = time.perf_counter()
+                # A request thread elsewhere in the worker makes the write
+                await asyncio.to_thread(create_task, index, socket.user_id)
+                event_id = f'{broker.stream_id}-{broker.seq}'
+                wait_until = time.perf_counter() + 5
+                while event_id not in socket.arrivals and time.perf_counter() < wait_until:
+                    await asyncio.sleep(0.001)
+                if event_id in socket.arrivals:
+                    latencies.append(socket.arrivals[event_id] - started)
+                else:
+                    missing += 1
+            results['fan_out'] = {
+                'missing': missing,
+                'latency': summarize(latencies) if latencies else None,
+            }
+
+            for socket in sockets:
+                socket.messages = socket.events = 0
+            start = time.perf_counter()
+            publisher = threading.Thread(target=publish_burst, args=(list(by_user),))
+            publisher.start()
+            wait_until = time.perf_counter() + 30
+            while any(socket.events < args.burst for socket in fast) and time.perf_counter() < wait_until:
+                await asyncio.sleep(0.01)
+            delivered_seconds = time.perf_counter() - start
+            await asyncio.to_thread(publisher.join)
+            messages = sum(socket.messages for socket in fast)
+            results['burst'] = {
+                'events_per_socket': args.burst,
+                'all_delivered_s': round(delivered_seconds, 3),
+                'incomplete_fast_sockets': sum(socket.events < args.burst for socket in fast),
+                'messages_per_fast_socket': round(messages / len(fast), 1) if fast else None,
+                'events_per_message': round(sum(socket.events for socket in fast) / messages, 1) if messages else None,
+                'slow_sockets_closed': sum(socket.closed is not None for socket in sockets if socket.slow),
+            }
+
+            cpu_before = time.process_time()
+            await asyncio.sleep(args.idle)
+            cpu = time.process_time() - cpu_before
+            results['idle'] = {
+                'seconds': args.idle,
+                'cpu_s': round(cpu, 3),
+                'cpu_percent': round(100 * cpu / args.idle, 2),
+            }
+
+            start = time.perf_counter()
+            for socket in sockets:
+                socket.disconnected.set()
+            await asyncio.gather(*connections)
+            results['disconnect'] = {
+                'total_s': round(time.perf_counter() - start, 3),
+                'subscribers': broker.stats()['subscribers'],
+            }
+            results['broker'] = broker.stats()
+            return results
+
+        results = asyncio.run(run())
+        assert results['disconnect']['subscribers'] == 0, 'sockets were left subscribed'
+        report(results)
+
+
+if __name__ == '__main__':
+    main()
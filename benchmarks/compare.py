@@ -0,0 +1,69 @@
+"""
+Compare two benchmarks.run reports endpoint by endpoint.
+Run using: python -m benchmarks.compare baseline.json candidate.json [--threshold 15]
+
+Prints the p50/p95 latency and median query count of every endpoint in both
+reports. Exits with status 1 when an endpoint's p95 grew by more than
+--threshold percent or its query count grew at all, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def change(before, after):
+    if not before:
+        return None
+    return round((after / before - 1) * 100, 1)
+
+
+def median_queries(result):
+    return (result.get('queries') or {}).get('median')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=15.0, help='Allowed p95 growth in percent')
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    for name, report in (('baseline', baseline), ('candidate', candidate)):
+        revision = report.get('revision') or {}
+        print(f"{name}: {revision.get('commit', 'unknown')}{' (dirty)' if revision.get('dirty') else ''} "
+              f"scale={report.get('scale')}")
+    if baseline.get('scale', {}).get('tasks') != candidate.get('scale', {}).get('tasks'):
+        print('warning: the reports were run at different scales')
+
+    regressions = []
+    print(f"\n{'endpoint':<55} {'p50 ms':>19} {'p95 ms':>19} {'p95 %':>7} {'queries':>9}")
+    for label in sorted(set(baseline['endpoints']) | set(candidate['endpoints'])):
+        before, after = baseline['endpoints'].get(label), candidate['endpoints'].get(label)
+        if before is None or after is None:
+            print(f"{label:<55} {'only in ' + ('candidate' if before is None else 'baseline'):>19}")
+            continue
+        p95_change = change(before['p95_ms'], after['p95_ms'])
+        queries_before, queries_after = median_queries(before), median_queries(after)
+        print(f"{label:<55} {before['p50_ms']:>8} -> {after['p50_ms']:<8} {before['p95_ms']:>8} -> "
+              f"{after['p95_ms']:<8} {p95_change if p95_change is not None else '':>7} "
+              f"{queries_before} -> {queries_after}")
+        if p95_change is not None and p95_change > args.threshold:
+            regressions.append(f"{label}: p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+        if queries_before is not None and queries_after is not None and queries_after > queries_before:
+            regressions.append(f"{label}: queries {queries_before} -> {queries_after}")
+
+    if regressions:
+        print('\nRegressions:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
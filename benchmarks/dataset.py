@@ -0,0 +1,39 @@
+"""
+Synthetic data set for the benchmarks, built by tasks.synthetic like generate_load_data.
+
+A seed always gives the same rows, so runs at the same scale are comparable.
+Reports are derived from the task statuses rather than requested separately.
+"""
+from django.db.models import Count
+
+
+def seed_dataset(tasks=10000, clients=None, seed=0, password='benchmark', batch_size=5000):
+    """Generate the data set and return sample users, objects and the row counts"""
+    from accounts.models import User, Location, AdminLocation
+    from tasks.models import Task, TaskReport
+    from tasks.synthetic import generate_load_data
+
+    result = generate_load_data(
+        tasks, clients=clients, admins_per_location=1, seed=seed, batch_size=batch_size,
+        password=password, prefix='bench',
+    )
+
+    # Sample objects in the busiest location, so every role sees them
+    location = Location.objects.get(name=Location.StateName.TAMIL_NADU)
+    admin_location = AdminLocation.objects.select_related('admin').get(location=location)
+    # The busiest client, whose listings are the largest a client sees
+    client_id = (
+        Task.objects.filter(location=location).values_list('assigned_to')
+        .annotate(count=Count('id')).order_by('-count', 'assigned_to')[0][0]
+    )
+    client = User.objects.get(id=client_id)
+    return {
+        'superadmin': result['superadmin'],
+        'admin': admin_location.admin,
+        'client': client,
+        'location': location,
+        'admin_location': admin_location,
+        'task': Task.objects.filter(assigned_to=client).order_by('id').first(),
+        'report': TaskReport.objects.filter(submitted_by=client).order_by('id').first(),
+        'counts': {key: result[key] for key in ('users', 'tasks', 'reports')},
+    }
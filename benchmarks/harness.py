@@ -0,0 +1,122 @@
+"""
+Shared setup for the benchmark scripts.
+
+Benchmarks run in-process against a throwaway test database (in-memory for
+SQLite), so they never touch db.sqlite3. Run them from the repository root, e.g.
+    python -m benchmarks.bench_pagination
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(settings_module='adminportal.settings'):
+    if BASE_DIR not in sys.path:
+        sys.path.append(BASE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+    # A JSON line per request on stderr would bury the report; bench_request_logging sets its own handler
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+
+
+@contextmanager
+def benchmark_database(test_name=None):
+    """
+    Create a fresh test database for the duration of the block.
+    test_name overrides the test database name, e.g. a file path so that concurrent
+    SQLite writers get database-level locking instead of the shared in-memory cache.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    if test_name:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = test_name
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def seed_tasks(count, batch_size=5000):
+    """Create one location, admin and client with `count` tasks"""
+    from django.utils import timezone
+    from accounts.models import User, Location, AdminLocation
+    from tasks.models import Task
+
+    location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+    superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+    admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, location='Tamil Nadu')
+    AdminLocation.objects.create(admin=admin, location=location)
+    client = User.objects.create(username='tnclient1', role=User.Role.CLIENT, location='Tamil Nadu')
+
+    now = timezone.now()
+    tasks = (
+        Task(
+            title=f'Task {index}',
+            description='Benchmark task',
+            location=location,
+            assigned_by=admin,
+            assigned_to=client,
+            deadline=now + timedelta(days=7),
+        )
+        for index in range(count)
+    )
+    Task.objects.bulk_create(tasks, batch_size=batch_size)
+    return {'location': location, 'superadmin': superadmin, 'admin': admin, 'client': client}
+
+
+def time_calls(func, repeat):
+    """Call func `repeat` times and return the wall-clock durations in seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def rss_kb():
+    """Current resident set size in kB (the peak where /proc is missing)"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def report(results):
+    print(json.dumps(results, indent=2))
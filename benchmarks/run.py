@@ -0,0 +1,327 @@
+"""
+Drive every route in adminportal/urls.py in-process and report latency per endpoint.
+Run using:
+    python -m benchmarks.run [--tasks 10000] [--clients N] [--seed 0]
+        [--requests 50] [--concurrency 1] [--roles superadmin,admin,client]
+        [--skip REGEX] [--database-file PATH] [--output results.json]
+
+The data set is seeded into a throwaway test database (see benchmarks.dataset).
+Every named route that answers GET is requested as each role, with real token
+authentication, through the Django test client. Write routes are driven by the
+scenarios in write_scenarios(); any other method a route allows is listed under
+"not_driven". The JSON report has p50/p95/p99 latency, throughput, status codes and
+query counts (from the Server-Timing header) per endpoint, plus the commit and
+scale, so two runs can be compared with benchmarks.compare.
+
+Concurrency uses threads that share the test database. SQLite's shared in-memory
+cache locks whole tables, so use --database-file for concurrent write scenarios.
+Even then, SQLite fails transactions that read before they write (bulk_transition)
+with "database is locked" under concurrency; those show up in "statuses" as
+OperationalError. Point DATABASES at PostgreSQL for concurrent write numbers.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from benchmarks.harness import BASE_DIR, setup_django, benchmark_database, percentile
+
+# Django admin and the browsable API login pages are HTML forms, not part of the API
+DEFAULT_SKIP = r'^(admin:|rest_framework:)'
+
+# Sample object used for the <pk> of each router basename
+DETAIL_OBJECTS = {
+    'user': 'client',
+    'location': 'location',
+    'adminlocation': 'admin_location',
+    'task': 'task',
+    'taskreport': 'report',
+}
+
+# Extra GET variants worth tracking on their own: (label, route name, query string)
+QUERY_VARIANTS = (
+    ('task-list?cursor', 'task-list', '?cursor='),
+    ('taskreport-list?cursor', 'taskreport-list', '?cursor='),
+    ('task-list?page_size=100', 'task-list', '?page_size=100'),
+)
+
+
+def write_scenarios(sample, password):
+    """(label, route name, role, method, url, body factory) for the write routes"""
+    from django.urls import reverse
+    from django.utils import timezone
+
+    counter = itertools.count()
+    task_ids = list(sample['task'].location.tasks.order_by('id').values_list('id', flat=True)[:100])
+
+    def task_payload():
+        return {
+            'title': 'Benchmark task',
+            'description': 'Created by benchmarks.run',
+            'location': sample['location'].id,
+            'assigned_by': sample['admin'].id,
+            'assigned_to': sample['client'].id,
+            'deadline': (timezone.now() + timedelta(days=7)).isoformat(),
+        }
+
+    return [
+        ('login', 'login', None, 'post', reverse('login'),
+         lambda: {'username': sample['superadmin'].username, 'password': password}),
+        ('token_auth', 'token_auth', None, 'post', reverse('token_auth'),
+         lambda: {'username': sample['superadmin'].username, 'password': password}),
+        ('user-list', 'user-list', 'superadmin', 'post', reverse('user-list'),
+         lambda: {'username': f'bench-client-{next(counter)}', 'password': password, 'role': 'CLIENT',
+                  'location': 'Tamil Nadu'}),
+        ('create-admin', 'create-admin', 'superadmin', 'post', reverse('create-admin'),
+         lambda: {'username': f'bench-admin-{next(counter)}', 'password': password,
+                  'location_code': sample['location'].name}),
+        ('test-post', 'test-post', None, 'post', reverse('test-post'), lambda: {'ping': 1}),
+        ('task-list', 'task-list', 'admin', 'post', reverse('task-list'), task_payload),
+        ('task-bulk', 'task-bulk', 'admin', 'post', reverse('task-bulk'),
+         lambda: {'tasks': [task_payload() for _ in range(100)]}),
+        ('task-bulk-transition', 'task-bulk-transition', 'admin', 'post', reverse('task-bulk-transition'),
+         lambda: {'action': 'mark_in_progress', 'ids': task_ids}),
+        ('task-mark-in-progress', 'task-mark-in-progress', 'admin', 'post',
+         reverse('task-mark-in-progress', args=[sample['task'].pk]), dict),
+        ('task-mark-completed', 'task-mark-completed', 'client', 'post',
+         reverse('task-mark-completed', args=[sample['task'].pk]), dict),
+        ('taskreport-list', 'taskreport-list', 'client', 'post', reverse('taskreport-list'),
+         lambda: {'task': sample['task'].pk, 'submitted_by': sample['client'].pk, 'report_text': 'Benchmark report'}),
+        ('taskreport-review-report', 'taskreport-review-report', 'admin', 'post',
+         reverse('taskreport-review-report', args=[sample['report'].pk]),
+         lambda: {'approved': True, 'feedback': 'Benchmark review'}),
+    ]
+
+
+def discover_routes():
+    """{route name: (pattern, allowed methods)} for every named route in the URLconf"""
+    from django.urls import URLPattern, URLResolver, get_resolver
+
+    def walk(patterns, namespace=''):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                inner = f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace
+                yield from walk(pattern.url_patterns, inner)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                yield f'{namespace}{pattern.name}', pattern
+
+    routes = {}
+    for name, pattern in walk(get_resolver().url_patterns):
+        # Router format-suffix duplicates (.json) resolve to the same view
+        if name not in routes and 'format' not in pattern.pattern.regex.groupindex:
+            routes[name] = (pattern, allowed_methods(pattern.callback))
+    return routes
+
+
+def allowed_methods(callback):
+    if getattr(callback, 'actions', None):
+        return sorted(callback.actions)
+    view_class = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+    if view_class is None:
+        return ['get']
+    return [method for method in ('get', 'post', 'put', 'patch', 'delete') if hasattr(view_class, method)]
+
+
+def route_url(name, pattern, sample):
+    from django.urls import reverse
+
+    kwargs = {}
+    for group in pattern.pattern.regex.groupindex:
+        if group != 'pk':
+            return None
+        kwargs['pk'] = sample[DETAIL_OBJECTS[name.split('-')[0]]].pk
+    return reverse(name, kwargs=kwargs)
+
+
+def queries_from(response):
+    match = re.search(r'desc="(\d+) queries"', response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+class Driver:
+    """Sends the requests of one endpoint from `concurrency` threads, each with its own clients"""
+
+    def __init__(self, tokens, concurrency):
+        self.tokens = tokens
+        self.concurrency = concurrency
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def client(self, role):
+        from rest_framework.test import APIClient
+
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if role not in clients:
+            clients[role] = APIClient()
+            if role:
+                clients[role].credentials(HTTP_AUTHORIZATION=f'Token {self.tokens[role]}')
+        return clients[role]
+
+    def request(self, role, method, url, body):
+        start = time.perf_counter()
+        try:
+            response = getattr(self.client(role), method)(url, body() if body else None, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            status = response.status_code
+            queries = queries_from(response)
+        except Exception as exc:
+            status, queries = type(exc).__name__, None
+        return time.perf_counter() - start, status, queries
+
+    def run(self, role, method, url, body, requests, warmup):
+        for _ in range(warmup):
+            self.request(role, method, url, body)
+        start = time.perf_counter()
+        results = list(self.executor.map(lambda _: self.request(role, method, url, body), range(requests)))
+        elapsed = time.perf_counter() - start
+        return summarize(results, elapsed)
+
+    def close(self):
+        from django.db import connections
+
+        # Each worker thread opened its own database connection
+        self.executor.map(lambda _: connections.close_all(), range(self.concurrency))
+        self.executor.shutdown()
+
+
+def summarize(results, elapsed):
+    durations = [duration for duration, _, _ in results]
+    queries = [count for _, _, count in results if count is not None]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'statuses': statuses,
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.mean(durations) * 1000, 3),
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+        'queries': {'median': statistics.median(queries), 'max': max(queries)} if queries else None,
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BASE_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--clients', type=int, help='Default: tasks / 50')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--roles', default='superadmin,admin,client', help='Roles each GET route is requested as')
+    parser.add_argument('--only', help='Only endpoints whose label matches this regex')
+    parser.add_argument('--skip', default=DEFAULT_SKIP, help='Skip route names matching this regex')
+    parser.add_argument('--no-dashboard-cache', action='store_true', help='Measure the uncached dashboards')
+    parser.add_argument('--database-file', help='Use a file for the test database instead of memory')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    setup_django()
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings
+    from rest_framework.authtoken.models import Token
+    from benchmarks.dataset import seed_dataset
+
+    # Keep the per-request log lines and debug prints of some views out of the report
+    logging.getLogger('adminportal.middleware').setLevel(logging.WARNING)
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    password = 'benchmark-password'
+    roles = [role for role in args.roles.split(',') if role]
+    skip = re.compile(args.skip) if args.skip else None
+    only = re.compile(args.only) if args.only else None
+    overrides = {'DASHBOARD_CACHE_TIMEOUT': 0} if args.no_dashboard_cache else {}
+
+    with benchmark_database(args.database_file), override_settings(**overrides), \
+            contextlib.redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        sample = seed_dataset(tasks=args.tasks, clients=args.clients, seed=args.seed, password=password)
+        seed_seconds = time.perf_counter() - start
+        tokens = {role: Token.objects.get_or_create(user=sample[role])[0].key
+                  for role in ('superadmin', 'admin', 'client')}
+
+        endpoints = []
+        not_driven = []
+        routes = discover_routes()
+        for name, (pattern, methods) in routes.items():
+            if skip and skip.search(name):
+                continue
+            url = route_url(name, pattern, sample)
+            if url is not None and 'get' in methods:
+                endpoints += [(f'GET {name} [{role}]', role, 'get', url, None) for role in roles]
+            for method in methods:
+                if method != 'get':
+                    not_driven.append(f'{method.upper()} {name}')
+        for label, name, query in QUERY_VARIANTS:
+            url = route_url(name, routes[name][0], sample) + query
+            endpoints += [(f'GET {label} [{role}]', role, 'get', url, None) for role in roles]
+        for label, name, role, method, url, body in write_scenarios(sample, password):
+            if skip and skip.search(name):
+                continue
+            endpoints.append((f'{method.upper()} {label} [{role or "anonymous"}]', role, method, url, body))
+            if f'{method.upper()} {name}' in not_driven:
+                not_driven.remove(f'{method.upper()} {name}')
+
+        driver = Driver(tokens, args.concurrency)
+        results = {}
+        try:
+            for label, role, method, url, body in endpoints:
+                if only and not only.search(label):
+                    continue
+                results[label] = {'url': url, **driver.run(role, method, url, body, args.requests, args.warmup)}
+                print(f"{label}: p50 {results[label]['p50_ms']} ms", file=sys.stderr)
+        finally:
+            driver.close()
+
+    report = {
+        'revision': git_revision(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        },
+        'scale': {**sample['counts'], 'seed': args.seed, 'seed_seconds': round(seed_seconds, 1)},
+        'load': {
+            'requests': args.requests, 'warmup': args.warmup, 'concurrency': args.concurrency,
+            'dashboard_cache': not args.no_dashboard_cache and settings.DASHBOARD_CACHE_TIMEOUT > 0,
+        },
+        'endpoints': results,
+        'not_driven': sorted(not_driven),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for the list and retrieve actions of a ModelViewSet.
+
+    The validators come from a single aggregate (max updated_at, row count and
+    highest id) over the same role-filtered queryset that get_queryset builds, so a
+    304 response is returned before any object is loaded or serialized. The highest
+    id moves when a row is deleted and another created within the same second.
+    Fields read from related rows that have no updated_at (user and location
+    names) are not covered. alist and aretrieve do the same with the async ORM,
+    for the async views of the ASGI application.
+    """
+    modified_field = 'updated_at'
+
+    def get_conditional_aggregates(self):
+        """Aggregates whose values change whenever the response would change"""
+        return {
+            'last_modified': Max(self.modified_field),
+            'count': Count('pk', distinct=True),
+            'last_id': Max('pk'),
+        }
+
+    def get_validators(self, queryset):
+        """Return (etag, last_modified timestamp) for the rows in queryset"""
+        return self.validators_from(queryset.order_by().aggregate(**self.get_conditional_aggregates()))
+
+    async def aget_validators(self, queryset):
+        return self.validators_from(await queryset.order_by().aaggregate(**self.get_conditional_aggregates()))
+
+    def validators_from(self, values):
+        if not values['count']:
+            return None, None
+
+        timestamps = [value for value in values.values() if hasattr(value, 'timestamp')]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+
+        # The user is part of the tag because the same URL shows each role a different scope
+        fingerprint = f"{self.request.user.pk}|{self.request.get_full_path()}|{sorted(values.items())}"
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        return etag, last_modified
+
+    def conditional_response(self, request, queryset, respond):
+        etag, last_modified = self.get_validators(queryset)
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+        return self.add_validators(respond(), etag, last_modified)
+
+    async def aconditional_response(self, request, queryset, respond):
+        etag, last_modified = await self.aget_validators(queryset)
+        if etag:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
+        return self.add_validators(await respond(), etag, last_modified)
+
+    @staticmethod
+    def add_validators(response, etag, last_modified):
+        if etag and response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            request, queryset, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError, ValidationError):
+            # Let get_object turn a malformed lookup into a 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, queryset, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    async def afiltered_queryset(self):
+        # get_queryset may resolve the user's scope, which can query
+        return await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+
+    async def alist(self, request, *args, **kwargs):
+        """list with the async ORM, for the async view under ASGI (accounts.mixins.AsyncDispatchMixin)"""
+        queryset = await self.afiltered_queryset()
+
+        async def respond():
+            if self.paginator is None:
+                page = None
+            elif hasattr(self.paginator, 'apaginate_queryset'):
+                page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            else:
+                page = await sync_to_async(self.paginate_queryset)(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer([row async for row in queryset], many=True).data)
+        return await self.aconditional_response(request, queryset, respond)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        """retrieve with the async ORM, for the async view under ASGI"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = await self.afiltered_queryset()
+        try:
+            queryset = queryset.filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+
+        async def respond():
+            try:
+                instance = await queryset.aget()
+            except queryset.model.DoesNotExist:
+                raise Http404
+            await sync_to_async(self.check_object_permissions)(request, instance)
+            return Response(self.get_serializer(instance).data)
+        return await self.aconditional_response(request, queryset, respond)
@@ -0,0 +1,378 @@
+"""
+Live task and report events, served as a Server-Sent Events stream to the dashboards.
+
+Signal receivers (tasks.signals) publish an event once a write commits: a task
+assigned or reassigned, a task status change, a task flagged or cleared as overdue
+by the sweep (tasks.overdue, delivered only by a cross-process broker, see below),
+a report submitted, or a report reviewed. Each
+event names the locations and users it concerns. The broker fans it out to the
+connected streams allowed to see it: SuperAdmins see every event, admins the
+events of their assigned location, and clients the events about themselves.
+
+The broker lives in the worker process. Streams are async generators served by
+the ASGI application (adminportal.asgi), so an idle connection costs a small
+queue and one timer, not a thread. Publishing runs on the thread that made the
+write. It hands each event loop one callback per event, which then fills the
+queue of every matching stream. Each event is encoded once, and every stream
+sends the same bytes.
+
+The last EVENTS_REPLAY_BUFFER events are kept for resuming. An event id is
+"<stream id>-<sequence>". The stream id changes on every worker start, so a
+Last-Event-ID from another worker or from before a restart is recognised. A
+reconnecting client gets the events it missed when they are still buffered.
+Otherwise it gets a "reset" event and should reload through the REST API.
+
+A stream whose queue reaches EVENTS_QUEUE_SIZE, because the client reads slower
+than events arrive, is closed. The client reconnects with its Last-Event-ID.
+
+EventBroker only carries the writes made in its own process. With several ASGI
+workers, or writes made by other processes (manage.py sweep_overdue_tasks,
+run_workers), set EVENTS_BROKER to 'tasks.events.DatabaseEventBroker': publishing
+inserts a PublishedEvent row, and every process with open streams polls the
+table and fans the new rows out. Any other broker class provides publish(),
+subscribe(), unsubscribe(), stats() and stream_id, like EventBroker, and hands
+out Subscription objects.
+
+The task WebSocket (tasks.sockets) subscribes to the same broker.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, DatabaseError
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import PublishedEvent
+
+logger = logging.getLogger(__name__)
+
+ALL = ('all',)
+
+
+def scope_key(access):
+    """The subscriber key of what a user may see, or None when they may see no events"""
+    if access.is_superadmin():
+        return ALL
+    if access.is_admin():
+        return ('location', access.location_id) if access.location_id is not None else None
+    if access.is_client():
+        return ('user', access.user_id)
+    return None
+
+
+class Event:
+    """One published change, with its SSE encoding"""
+    __slots__ = ('seq', 'id', 'type', 'location_ids', 'user_ids', 'encoded', 'message')
+
+    def __init__(self, stream_id, seq, event_type, data, location_ids, user_ids):
+        self.seq = seq
+        self.id = f'{stream_id}-{seq}'
+        self.type = event_type
+        self.location_ids = frozenset(location_ids)
+        self.user_ids = frozenset(user_ids)
+        payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        self.encoded = f'id: {self.id}\nevent: {event_type}\ndata: {payload}\n\n'.encode()
+        # The JSON object of the event in a WebSocket batch (tasks.sockets)
+        self.message = f'{{"id":"{self.id}","type":"{event_type}","data":{payload}}}'
+
+    def keys(self):
+        """The subscriber keys this event is delivered to"""
+        return (
+            [ALL]
+            + [('location', location_id) for location_id in self.location_ids]
+            + [('user', user_id) for user_id in self.user_ids]
+        )
+
+    def visible_to(self, key):
+        kind, value = key[0], key[-1]
+        return (
+            key == ALL
+            or (kind == 'location' and value in self.location_ids)
+            or (kind == 'user' and value in self.user_ids)
+        )
+
+
+class Subscription:
+    """The queue of one connected stream, read on its event loop"""
+
+    def __init__(self, key, loop, max_queued, types=None):
+        self.key = key
+        # Event types delivered, or None for all of them
+        self.types = types
+        self.loop = loop
+        self.max_queued = max_queued
+        self.queue = deque()
+        self.waiter = None
+        self.overflowed = False
+        # Id of the last event published before the subscription started
+        self.resume_id = None
+
+    def deliver(self, event):
+        """Queue an event; runs on self.loop"""
+        if self.overflowed or not self.wants(event):
+            return
+        if len(self.queue) >= self.max_queued:
+            self.overflowed = True
+            self.queue.clear()
+        else:
+            self.queue.append(event)
+        self.wake()
+
+    def wants(self, event):
+        return self.types is None or event.type in self.types
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def get(self, timeout):
+        """Every queued event, waiting up to timeout seconds for one; [] on timeout"""
+        if not self.queue and not self.overflowed:
+            self.waiter = self.loop.create_future()
+            timer = self.loop.call_later(timeout, self.wake)
+            try:
+                await self.waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+        return self.drain()
+
+    def drain(self):
+        """Every queued event, without waiting"""
+        events = list(self.queue)
+        self.queue.clear()
+        return events
+
+
+def deliver_all(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+
+class EventBroker:
+    """In-process fan-out of events to the subscriptions allowed to see them"""
+
+    def __init__(self, replay_size=None, max_queued=None):
+        self._replay_size = replay_size
+        self._max_queued = max_queued
+        self.lock = threading.Lock()
+        self.stream_id = f'{time.time_ns():x}'
+        self.seq = 0
+        self.replay = deque(maxlen=self.replay_size)
+        self.subscribers = {}
+        self.published = 0
+        self.overflows = 0
+
+    @property
+    def replay_size(self):
+        return self._replay_size or getattr(settings, 'EVENTS_REPLAY_BUFFER', 1000)
+
+    @property
+    def max_queued(self):
+        return self._max_queued or getattr(settings, 'EVENTS_QUEUE_SIZE', 100)
+
+    def publish(self, event_type, data, location_ids=(), user_ids=()):
+        """Publish an event to the subscriptions of its locations and users, from any thread"""
+        with self.lock:
+            self.seq += 1
+            event, by_loop = self.buffer(self.seq, event_type, data, location_ids, user_ids)
+        self.deliver(event, by_loop)
+        return event
+
+    def buffer(self, seq, event_type, data, location_ids, user_ids):
+        """Add event seq to the replay buffer; returns it and {loop: its subscriptions}. Needs self.lock"""
+        event = Event(self.stream_id, seq, event_type, data, location_ids, user_ids)
+        self.replay.append(event)
+        self.published += 1
+        by_loop = {}
+        for key in event.keys():
+            for subscription in self.subscribers.get(key, ()):
+                by_loop.setdefault(subscription.loop, []).append(subscription)
+        return event, by_loop
+
+    def deliver(self, event, by_loop):
+        for loop, subscriptions in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(deliver_all, subscriptions, event)
+            except RuntimeError:
+                # The loop has closed; its subscriptions are gone with it
+                pass
+
+    def subscribe(self, key, last_event_id=None, types=None):
+        """
+        Subscribe the running event loop to the events of key, or only those of types. Returns
+        the subscription and the buffered events after last_event_id, or None when they can no
+        longer be replayed.
+        """
+        subscription = Subscription(key, asyncio.get_running_loop(), self.max_queued, types)
+        with self.lock:
+            backlog = self.missed_events(subscription, last_event_id) if last_event_id else []
+            subscription.resume_id = f'{self.stream_id}-{self.seq}'
+            self.subscribers.setdefault(key, set()).add(subscription)
+        return subscription, backlog
+
+    def missed_events(self, subscription, last_event_id):
+        stream_id, _, seq = last_event_id.rpartition('-')
+        if stream_id != self.stream_id or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self.seq:
+            return None
+        oldest = self.replay[0].seq if self.replay else self.seq + 1
+        if seq < oldest - 1:
+            return None
+        return [
+            event for event in self.replay
+            if event.seq > seq and event.visible_to(subscription.key) and subscription.wants(event)
+        ]
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscribers.get(subscription.key)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscribers[subscription.key]
+            if subscription.overflowed:
+                self.overflows += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'stream_id': self.stream_id,
+                'subscribers': sum(len(subscriptions) for subscriptions in self.subscribers.values()),
+                'published': self.published,
+                'buffered': len(self.replay),
+                'overflows': self.overflows,
+            }
+
+
+class DatabaseEventBroker(EventBroker):
+    """
+    Events carried between processes through the PublishedEvent table. publish() only
+    inserts a row. In a process with subscribers, a thread polls the table every
+    EVENTS_POLL_INTERVAL seconds and fans the new rows out as EventBroker does, and
+    deletes the rows older than EVENTS_RETENTION seconds. Event ids are the row ids
+    under one stream id, so a client can resume on any worker that has the events it
+    missed buffered. With poll_interval=0 no thread is started; call poll() instead.
+    """
+    STREAM_ID = 'db'
+
+    def __init__(self, replay_size=None, max_queued=None, poll_interval=None):
+        super().__init__(replay_size, max_queued)
+        self.stream_id = self.STREAM_ID
+        self.poll_interval = getattr(settings, 'EVENTS_POLL_INTERVAL', 1) if poll_interval is None else poll_interval
+        # Set once seq holds the newest row id, from which polling starts
+        self.ready = threading.Event()
+        self.poller = None
+
+    def publish(self, event_type, data, location_ids=(), user_ids=()):
+        """Store an event for the pollers of every process, from any thread"""
+        try:
+            PublishedEvent.objects.create(
+                type=event_type, data=data, location_ids=list(location_ids), user_ids=list(user_ids),
+            )
+        except DatabaseError:
+            # Events are a hint to reload; losing one must not fail the write that committed
+            logger.exception("Could not publish a %s event", event_type)
+
+    def subscribe(self, key, last_event_id=None, types=None):
+        if self.poll_interval and self.poller is None:
+            with self.lock:
+                if self.poller is None:
+                    self.poller = threading.Thread(target=self.run, name='events-poller', daemon=True)
+                    self.poller.start()
+        return super().subscribe(key, last_event_id, types)
+
+    def missed_events(self, subscription, last_event_id):
+        if not self.ready.is_set():
+            return None
+        stream_id, _, seq = last_event_id.rpartition('-')
+        if stream_id == self.stream_id and seq.isdigit() and int(seq) > self.seq:
+            # Published after this process last polled: the poller brings them
+            return []
+        return super().missed_events(subscription, last_event_id)
+
+    def start(self):
+        """Skip the rows published before now"""
+        latest = PublishedEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+        with self.lock:
+            self.seq = max(self.seq, latest)
+        self.ready.set()
+
+    def poll(self, limit=1000):
+        """Fan out the rows published since the last poll; returns how many"""
+        if not self.ready.is_set():
+            self.start()
+        rows = list(
+            PublishedEvent.objects.filter(id__gt=self.seq).order_by('id')
+            .values_list('id', 'type', 'data', 'location_ids', 'user_ids')[:limit]
+        )
+        for seq, event_type, data, location_ids, user_ids in rows:
+            with self.lock:
+                self.seq = seq
+                event, by_loop = self.buffer(seq, event_type, data, location_ids, user_ids)
+            self.deliver(event, by_loop)
+        return len(rows)
+
+    def purge(self):
+        """Delete the rows older than EVENTS_RETENTION seconds"""
+        cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'EVENTS_RETENTION', 3600))
+        PublishedEvent.objects.filter(created_at__lt=cutoff).delete()
+
+    def run(self):
+        next_purge = 0
+        while True:
+            close_old_connections()
+            try:
+                while self.poll():
+                    pass
+                if time.monotonic() >= next_purge:
+                    self.purge()
+                    next_purge = time.monotonic() + 60
+            except DatabaseError:
+                logger.exception("Polling for events failed")
+            time.sleep(self.poll_interval)
+
+
+def get_broker():
+    """A new broker of the EVENTS_BROKER class"""
+    path = getattr(settings, 'EVENTS_BROKER', None)
+    return import_string(path)() if path else EventBroker()
+
+
+broker = get_broker()
+
+
+def encode_comment(text):
+    return f': {text}\n\n'.encode()
+
+
+async def event_stream(key, last_event_id=None, heartbeat=None):
+    """The SSE byte stream of one connection, until the client goes away or falls behind"""
+    heartbeat = heartbeat or getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    subscription, backlog = broker.subscribe(key, last_event_id)
+    try:
+        # Reconnect after 3 seconds, and send the first bytes so proxies and clients see the stream open
+        yield b'retry: 3000\n\n'
+        if backlog is None:
+            # Its id moves the client's Last-Event-ID to now, so the next reconnect can resume
+            yield f'id: {subscription.resume_id}\nevent: reset\ndata: {{}}\n\n'.encode()
+        elif backlog:
+            yield b''.join(event.encoded for event in backlog)
+        while True:
+            events = await subscription.get(heartbeat)
+            if subscription.overflowed:
+                yield encode_comment('too far behind, reconnect')
+                return
+            yield b''.join(event.encoded for event in events) if events else encode_comment('ping')
+    finally:
+        broker.unsubscribe(subscription)
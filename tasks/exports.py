@@ -0,0 +1,188 @@
+import csv
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Task
+
+# Columns of each export: (column name, values() lookup)
+TASK_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('title', 'title'),
+    ('status', 'status'),
+    ('location', 'location__name'),
+    ('group_id', 'group_id'),
+    ('site_name', 'site_name'),
+    ('cluster', 'cluster'),
+    ('service_engineer_name', 'service_engineer_name'),
+    ('service_type', 'service_type'),
+    ('is_required', 'is_required'),
+    ('assigned_by', 'assigned_by__username'),
+    ('assigned_to', 'assigned_to__username'),
+    ('created_at', 'created_at'),
+    ('deadline', 'deadline'),
+    ('completed_at', 'completed_at'),
+    ('report_count', 'report_count'),
+    ('unreviewed_report_count', 'unreviewed_report_count'),
+    ('last_reviewed_at', 'last_reviewed_at'),
+)
+
+REPORT_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('task_id', 'task_id'),
+    ('task_title', 'task__title'),
+    ('task_status', 'task__status'),
+    ('location', 'task__location__name'),
+    ('group_id', 'task__group_id'),
+    ('site_name', 'task__site_name'),
+    ('cluster', 'task__cluster'),
+    ('service_engineer_name', 'task__service_engineer_name'),
+    ('service_type', 'task__service_type'),
+    ('submitted_by', 'submitted_by__username'),
+    ('submitted_at', 'submitted_at'),
+    ('reviewed_by', 'reviewed_by__username'),
+    ('reviewed_at', 'reviewed_at'),
+    ('feedback', 'feedback'),
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() returns the value, so csv.writer yields lines"""
+
+    def write(self, value):
+        return value
+
+
+def parse_export_date(value, param):
+    """Parse a date or datetime query parameter, returning (value, is_date)"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            return parsed, False
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({param: ["Expected a date (YYYY-MM-DD) or an ISO 8601 datetime."]})
+    return parsed, True
+
+
+def filter_export_queryset(queryset, params, prefix, date_field):
+    """
+    Apply the export filters from the query string.
+    status (comma separated), group_id, and date_from/date_to on date_field;
+    prefix is the path from the exported model to Task ('' or 'task__').
+    """
+    statuses = [value for value in params.get('status', '').split(',') if value]
+    if statuses:
+        invalid = [value for value in statuses if value not in Task.Status.values]
+        if invalid:
+            raise ValidationError({'status': [f"Invalid status: {', '.join(invalid)}."]})
+        queryset = queryset.filter(**{f'{prefix}status__in': statuses})
+
+    group_id = params.get('group_id')
+    if group_id:
+        queryset = queryset.filter(**{f'{prefix}group_id': group_id})
+
+    for param, lookup in (('date_from', 'gte'), ('date_to', 'lte')):
+        if params.get(param):
+            value, is_date = parse_export_date(params[param], param)
+            field = f'{date_field}__date' if is_date else date_field
+            queryset = queryset.filter(**{f'{field}__{lookup}': value})
+    return queryset
+
+
+def task_export_rows(queryset):
+    """Task rows together with the review state of their reports"""
+    return queryset.annotate(
+        report_count=Count('reports'),
+        unreviewed_report_count=Count('reports', filter=Q(reports__reviewed_at__isnull=True)),
+        last_reviewed_at=Max('reports__reviewed_at'),
+    )
+
+
+def iter_rows(queryset, columns):
+    """Yield one dict per row, reading the queryset in chunks so memory stays flat"""
+    names = [name for name, _ in columns]
+    lookups = [lookup for _, lookup in columns]
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    for values in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        yield dict(zip(names, values))
+
+
+async def aiter_rows(queryset, columns):
+    """iter_rows with the async ORM"""
+    lookups = [lookup for _, lookup in columns]
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    # values(), as values_list().aiterator() runs the query outside the ORM's thread in Django 5.0
+    async for values in queryset.values(*lookups).aiterator(chunk_size=chunk_size):
+        yield {name: values[lookup] for name, lookup in columns}
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '; '.join(str(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row.values()])
+
+
+def stream_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+async def astream_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield writer.writerow([name for name, _ in columns])
+    async for row in rows:
+        yield writer.writerow([csv_value(value) for value in row.values()])
+
+
+async def astream_ndjson(rows):
+    encoder = DjangoJSONEncoder()
+    async for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def export_response(request, queryset, columns, output, filename):
+    """
+    StreamingHttpResponse with the rows of queryset as CSV or NDJSON.
+    Under ASGI the content is an async generator over the async ORM: the ASGI handler
+    would read a sync iterator into a list before sending the first byte.
+    """
+    if output not in EXPORT_FORMATS:
+        raise ValidationError({'output': [f"Expected one of {', '.join(EXPORT_FORMATS)}."]})
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        rows = aiter_rows(queryset, columns)
+        content = astream_csv(rows, columns) if output == 'csv' else astream_ndjson(rows)
+    else:
+        rows = iter_rows(queryset, columns)
+        content = stream_csv(rows, columns) if output == 'csv' else stream_ndjson(rows)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[output])
+    stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+    response['Content-Disposition'] = f'attachment; filename="{filename}-{stamp}.{output}"'
+    return response
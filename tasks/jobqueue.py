@@ -0,0 +1,280 @@
+"""
+Database-backed queue for side effects a request does not need to wait for.
+
+A job is a function registered under a name with @job:
+
+    @job(priority=LOW)
+    def make_profile_picture_thumbnail(user_id, name):
+        ...
+
+enqueue_on_commit(make_profile_picture_thumbnail, {'user_id': 1, 'name': ...}) stores the
+call as a Job row once the current transaction commits (right away outside one).
+So the request returns as soon as its own write commits, and no job runs against
+a write that was rolled back. The kwargs must be JSON-serializable. With an
+idempotency_key, enqueueing the same key again returns the existing job instead
+of adding one; the key stays taken until the job is purged.
+
+`manage.py run_workers` starts the worker processes. Each claims up to
+JOBS_BATCH_SIZE due QUEUED jobs at a time, highest priority first, by flipping them
+to RUNNING under its own claim token (SELECT ... FOR UPDATE SKIP LOCKED where the
+database has it; SQLite serializes the writers anyway). A job that raises is
+queued again after JOBS_RETRY_BACKOFF * 2 ** (attempts - 1) seconds, jittered and
+capped at JOBS_RETRY_BACKOFF_MAX, until it has made max_attempts attempts. Then it
+is FAILED, with the traceback in last_error, and kept for inspection.
+
+A job left RUNNING for JOBS_LOCK_TIMEOUT seconds belongs to a worker that died, and
+is queued again, or FAILED if that was its last attempt. A job can therefore run
+more than once; job functions must be safe to repeat. DONE jobs are deleted after JOBS_RETENTION seconds.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Priorities; any integer works, higher runs first
+HIGH = 10
+NORMAL = 0
+LOW = -10
+
+# {name: job function}
+registry = {}
+
+
+def job(func=None, *, name=None, priority=NORMAL, max_attempts=None):
+    """Register a job function, by default as '<app>.<function name>'"""
+    def register(func):
+        func.job_name = name or f"{func.__module__.split('.')[0]}.{func.__name__}"
+        func.job_priority = priority
+        func.job_max_attempts = max_attempts
+        registry[func.job_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def autodiscover():
+    """Import the jobs module of every installed app, registering its job functions"""
+    autodiscover_modules('jobs')
+
+
+def enqueue(func, kwargs=None, priority=None, idempotency_key=None, delay=0, using=None):
+    """Queue a call of the job function func now, and return its Job"""
+    if registry.get(getattr(func, 'job_name', None)) is not func:
+        raise ValueError(f"{func!r} is not a registered job function")
+    queued = Job(
+        name=func.job_name,
+        kwargs=kwargs or {},
+        priority=func.job_priority if priority is None else priority,
+        max_attempts=func.job_max_attempts or getattr(settings, 'JOBS_MAX_ATTEMPTS', 5),
+        idempotency_key=idempotency_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if idempotency_key is None:
+        queued.save(using=using)
+        return queued
+    try:
+        with transaction.atomic(using=using):
+            queued.save(using=using)
+    except IntegrityError:
+        return Job.objects.using(using).get(idempotency_key=idempotency_key)
+    return queued
+
+
+def enqueue_on_commit(func, kwargs=None, priority=None, idempotency_key=None, delay=0, using=None):
+    """Queue a call of the job function func once the current transaction commits"""
+    transaction.on_commit(
+        partial(enqueue, func, kwargs, priority=priority, idempotency_key=idempotency_key, delay=delay, using=using),
+        using=using,
+    )
+
+
+def retry_delay(attempts):
+    """Seconds before the next attempt of a job that failed attempts times"""
+    base = getattr(settings, 'JOBS_RETRY_BACKOFF', 10)
+    cap = getattr(settings, 'JOBS_RETRY_BACKOFF_MAX', 3600)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    # Jitter, so jobs that failed together do not retry together
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(worker_id, limit):
+    """Mark up to limit due jobs RUNNING for this worker and return them, highest priority first"""
+    now = timezone.now()
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    due = Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+        else:
+            # One UPDATE with a subquery, so SQLite takes its write lock before reading
+            due = due.values('id')[:limit]
+        # The status check keeps a job from being claimed twice where rows are not locked
+        claimed = Job.objects.filter(id__in=due, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, locked_by=token, locked_at=now, attempts=F('attempts') + 1,
+        )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status=Job.Status.RUNNING, locked_by=token).order_by('-priority', 'run_at', 'id'))
+
+
+def run(claimed):
+    """Run one claimed job and record the outcome; True when it succeeded"""
+    mine = Job.objects.filter(pk=claimed.pk, status=Job.Status.RUNNING, locked_by=claimed.locked_by)
+    try:
+        func = registry.get(claimed.name)
+        if func is None:
+            raise LookupError(f"No job function is registered as {claimed.name!r}")
+        func(**claimed.kwargs)
+    except Exception as exc:
+        error = ''.join(traceback.format_exception(exc))
+        if claimed.attempts >= claimed.max_attempts:
+            mine.update(status=Job.Status.FAILED, locked_by='', locked_at=None, last_error=error, finished_at=timezone.now())
+            logger.error("Job %s %s failed for good after %s attempts", claimed.pk, claimed.name, claimed.attempts, exc_info=exc)
+        else:
+            delay = retry_delay(claimed.attempts)
+            mine.update(
+                status=Job.Status.QUEUED, locked_by='', locked_at=None, last_error=error,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+            logger.warning("Job %s %s failed, retrying in %.0fs: %s", claimed.pk, claimed.name, delay, exc)
+        return False
+    mine.update(status=Job.Status.DONE, locked_by='', locked_at=None, finished_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """Queue again the jobs whose worker has held them for JOBS_LOCK_TIMEOUT; returns the count"""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.Status.RUNNING, locked_at__lt=now - timedelta(seconds=getattr(settings, 'JOBS_LOCK_TIMEOUT', 600)),
+    )
+    # A job that keeps killing its worker must not come back forever
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.Status.FAILED, locked_by='', locked_at=None, last_error='Worker lost', finished_at=now,
+    )
+    return stale.update(status=Job.Status.QUEUED, locked_by='', locked_at=None, last_error='Worker lost')
+
+
+def purge_finished():
+    """Delete the DONE jobs older than JOBS_RETENTION; returns the count"""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOBS_RETENTION', 7 * 24 * 3600))
+    deleted, _ = Job.objects.filter(status=Job.Status.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def work(worker_id=None, stop=None, until_empty=False):
+    """
+    Claim and run jobs until stop (an Event) is set, or no job is due with until_empty.
+    Returns (succeeded, failed).
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    batch_size = getattr(settings, 'JOBS_BATCH_SIZE', 10)
+    poll_interval = getattr(settings, 'JOBS_POLL_INTERVAL', 1)
+    maintenance_interval = getattr(settings, 'JOBS_LOCK_TIMEOUT', 600) / 10
+    succeeded = failed = 0
+    next_maintenance = 0
+    while not (stop and stop.is_set()):
+        close_old_connections()
+        if time.monotonic() >= next_maintenance:
+            requeue_stale()
+            purge_finished()
+            next_maintenance = time.monotonic() + maintenance_interval
+        claimed = claim(worker_id, batch_size)
+        if not claimed:
+            if until_empty:
+                break
+            if stop:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        for index, queued in enumerate(claimed):
+            if stop and stop.is_set():
+                # Hand back the rest of the batch
+                Job.objects.filter(
+                    pk__in=[job.pk for job in claimed[index:]], status=Job.Status.RUNNING, locked_by=queued.locked_by,
+                ).update(status=Job.Status.QUEUED, locked_by='', locked_at=None, attempts=F('attempts') - 1)
+                break
+            if run(queued):
+                succeeded += 1
+            else:
+                failed += 1
+    return succeeded, failed
+
+
+def _worker_process(stop, until_empty, results):
+    import django
+    django.setup()
+    autodiscover()
+    # The parent handles Ctrl-C and SIGTERM, and sets stop for its workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    worker_id = f'{socket.gethostname()}:{os.getpid()}'
+    results.put(work(worker_id, stop, until_empty))
+
+
+def run_workers(processes=1, until_empty=False):
+    """
+    Work the queue in `processes` processes until SIGINT or SIGTERM, or until no job is
+    due with until_empty. Returns (succeeded, failed) over all processes.
+    """
+    autodiscover()
+    if processes <= 1:
+        stop = threading.Event()
+        handlers = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            return work(stop=stop, until_empty=until_empty)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        raise ValueError("An in-memory SQLite database cannot be shared with worker processes")
+    # Children open their own database connections
+    connections.close_all()
+    method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    stop = context.Event()
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker_process, args=(stop, until_empty, results), daemon=True)
+        for _ in range(processes)
+    ]
+    handlers = {signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        totals = [0, 0]
+        # A worker that crashed reports nothing
+        while True:
+            try:
+                succeeded, failed = results.get(timeout=0.1)
+            except queue.Empty:
+                break
+            totals[0] += succeeded
+            totals[1] += failed
+        return tuple(totals)
+    finally:
+        stop.set()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
@@ -0,0 +1,19 @@
+"""
+Background jobs of the tasks app, run by manage.py run_workers (see tasks.jobqueue).
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from accounts.jobs import save_thumbnail
+from .jobqueue import job, LOW
+from .models import TaskReport
+
+
+@job(priority=LOW)
+def make_report_attachment_thumbnail(report_id, name):
+    """Store a REPORT_ATTACHMENT_THUMBNAIL_SIZE thumbnail of an image attached to a report"""
+    # updated_at moves with the thumbnail, so conditional GETs of the report see the change
+    save_thumbnail(
+        TaskReport.objects.filter(pk=report_id, attachments=name), 'attachments', 'attachment_thumbnail',
+        settings.REPORT_ATTACHMENT_THUMBNAIL_SIZE, updated_at=timezone.now(),
+    )
@@ -0,0 +1,108 @@
+"""
+Management command to print the query plan of every hot dashboard/viewset query.
+Run using: python manage.py explain_hot_queries [--only task] [--sql]
+
+Use it after schema changes to check that the role-scoped queries still hit the
+indexes declared on Task, TaskReport and User.
+"""
+
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from accounts.models import User, Location, AdminLocation
+from accounts.views import UserViewSet
+from tasks.models import Task, TaskReport, LocationDailyTaskStats
+from tasks.overdue import due_tasks, no_longer_due_tasks
+from tasks.views import TaskViewSet, TaskReportViewSet
+
+class Command(BaseCommand):
+    help = 'Prints the database query plan for each dashboard and viewset hot query'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--only',
+            help='Only explain queries whose label contains this text',
+        )
+        parser.add_argument(
+            '--sql',
+            action='store_true',
+            help='Also print the SQL of each query',
+        )
+
+    def handle(self, *args, **options):
+        superadmin, admin, client = self.sample_users()
+        only = (options.get('only') or '').lower()
+
+        for label, queryset in self.hot_queries(superadmin, admin, client):
+            if only and only not in label.lower():
+                continue
+            self.stdout.write(self.style.SUCCESS(f"== {label}"))
+            try:
+                if options['sql']:
+                    self.stdout.write(str(queryset.query))
+                self.stdout.write(queryset.explain())
+            except EmptyResultSet:
+                self.stdout.write(self.style.WARNING("Query short-circuits to an empty result, nothing to explain"))
+            self.stdout.write('')
+
+    def sample_users(self):
+        """Use real users where they exist so the plans reflect the table statistics"""
+        superadmin = User.objects.filter(role=User.Role.SUPERADMIN).first() or User(id=0, role=User.Role.SUPERADMIN)
+        client = User.objects.filter(role=User.Role.CLIENT).first() or User(id=0, role=User.Role.CLIENT)
+        admin_location = AdminLocation.objects.select_related('admin', 'location').first()
+        if admin_location:
+            admin = admin_location.admin
+        else:
+            admin = User(id=0, role=User.Role.ADMIN)
+            admin.assigned_location = AdminLocation(admin=admin, location=Location(id=0))
+        return superadmin, admin, client
+
+    def viewset_queryset(self, viewset_class, user, action='list'):
+        """Build the queryset a viewset action runs for user, without serializing anything"""
+        request = Request(APIRequestFactory().get('/'))
+        request.user = user
+        view = viewset_class(request=request, action=action, format_kwarg=None, args=(), kwargs={})
+        return view.filter_queryset(view.get_queryset())
+
+    def hot_queries(self, superadmin, admin, client):
+        location_id = admin.assigned_location.location_id
+        active = [Task.Status.PENDING, Task.Status.IN_PROGRESS]
+        queries = []
+
+        for role, user in (('superadmin', superadmin), ('admin', admin), ('client', client)):
+            queries += [
+                (f'task list ({role})', self.viewset_queryset(TaskViewSet, user)[:10]),
+                (f'task report list ({role})', self.viewset_queryset(TaskReportViewSet, user)[:10]),
+            ]
+        queries += [
+            ('user list (admin)', self.viewset_queryset(UserViewSet, admin)[:10]),
+            ('superadmin dashboard: users by role and location',
+             User.objects.filter(role__in=['ADMIN', 'CLIENT']).values('role', 'home_location')
+             .annotate(count=Count('id')).order_by()),
+            ('superadmin dashboard: recent tasks', Task.objects.order_by('-updated_at')[:5]),
+            ('superadmin dashboard: recent reports', TaskReport.objects.order_by('-submitted_at')[:5]),
+            ('admin dashboard: clients in location',
+             User.objects.filter(role=User.Role.CLIENT, home_location_id=location_id).values('id')),
+            ('admin dashboard: unreviewed reports',
+             TaskReport.objects.filter(task__location_id=location_id, reviewed_at__isnull=True).values('id')),
+            ('admin dashboard: recent tasks',
+             Task.objects.filter(location_id=location_id).order_by('-updated_at')[:5]),
+            ('admin dashboard: recent reports',
+             TaskReport.objects.filter(task__location_id=location_id).order_by('-submitted_at')[:5]),
+            ('admin dashboard: completion rates',
+             LocationDailyTaskStats.completion(timezone.localdate()).filter(location_id=location_id)),
+            ('client dashboard: upcoming deadlines',
+             Task.objects.filter(assigned_to=client, status__in=active).order_by('deadline')[:3]),
+            ('client dashboard: recent tasks',
+             Task.objects.filter(assigned_to=client).order_by('-updated_at')[:3]),
+            ('client dashboard: recent reports',
+             TaskReport.objects.filter(submitted_by=client).order_by('-submitted_at')[:3]),
+            ('task status counts per location (stats rebuild)',
+             Task.objects.filter(location_id=location_id).values('status').annotate(count=Count('id')).order_by()),
+            ('overdue sweep: tasks to flag', due_tasks(timezone.now()).values('id')[:1000]),
+            ('overdue sweep: tasks to clear', no_longer_due_tasks(timezone.now()).values('id')[:1000]),
+        ]
+        return queries
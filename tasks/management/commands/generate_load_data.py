@@ -0,0 +1,63 @@
+"""
+Management command to fill the database with synthetic users, tasks and reports at scale.
+Run using: python manage.py generate_load_data [--tasks 1000000] [--workers 8] [--seed 0]
+
+All users get the same password (--password). Usernames start with --prefix, so run
+it again with another prefix to add more data. See tasks/synthetic.py for the
+distributions.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from tasks.synthetic import generate_load_data
+
+class Command(BaseCommand):
+    help = 'Generates synthetic users, locations, tasks and reports for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100000, help='Number of tasks (default 100000)')
+        parser.add_argument('--clients', type=int, help='Number of clients (default tasks / 50)')
+        parser.add_argument('--admins-per-location', type=int, default=2, help='Admins per location (default 2)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=min(8, os.cpu_count() or 1),
+            help='Worker processes writing tasks in parallel (default: CPU count, at most 8)',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tasks per INSERT batch (default 5000)')
+        parser.add_argument('--days', type=int, default=365, help='Spread task creation over this many days')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+        parser.add_argument('--prefix', default='load', help='Username prefix of the generated users')
+
+    def handle(self, *args, **options):
+        tasks = options['tasks']
+        self.stdout.write(f"Generating {tasks} tasks with {options['workers']} workers...")
+
+        def progress(tasks_written, reports_written):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {tasks_written}/{tasks} tasks, {reports_written} reports")
+
+        try:
+            result = generate_load_data(
+                tasks,
+                clients=options['clients'],
+                admins_per_location=options['admins_per_location'],
+                seed=options['seed'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                days=options['days'],
+                password=options['password'],
+                prefix=options['prefix'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        seconds = result['seconds']
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['users']} users, {result['tasks']} tasks and {result['reports']} reports "
+            f"in {seconds:.1f}s ({result['tasks'] / max(seconds, 0.001):.0f} tasks/s)"
+        ))
+        self.stdout.write(f"Superadmin login: {result['superadmin'].username}")
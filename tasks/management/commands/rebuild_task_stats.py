@@ -0,0 +1,60 @@
+"""
+Management command to recompute the materialized task stats counters.
+Run using: python manage.py rebuild_task_stats [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from tasks.models import COUNTER_MODELS
+
+class Command(BaseCommand):
+    help = 'Recomputes LocationTaskStats, ClientTaskStats and LocationDailyTaskStats from the Task table and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drift, do not write the recomputed counters',
+        )
+
+    def handle(self, *args, **options):
+        total_drift = 0
+        with transaction.atomic():
+            for stats_model in COUNTER_MODELS:
+                total_drift += self.rebuild(stats_model, options['dry_run'])
+
+        if total_drift:
+            verb = 'Found' if options['dry_run'] else 'Fixed'
+            self.stdout.write(self.style.WARNING(f"{verb} drift in {total_drift} stats rows"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Task stats are in sync"))
+
+    def rebuild(self, stats_model, dry_run):
+        """Compare stored counters with a fresh recount and return the number of drifted rows"""
+        expected = stats_model.recount()
+        stored = {stats.owner(): stats for stats in stats_model.objects.all()}
+        drifted = []
+
+        for owner in sorted(set(expected) | set(stored)):
+            counts = expected.get(owner, {})
+            stats = stored.get(owner) or stats_model(**dict(zip(stats_model.OWNER_FIELDS, owner)))
+            differences = []
+            for field in stats_model.COUNTER_FIELDS:
+                actual = getattr(stats, field)
+                wanted = counts.get(field, 0)
+                if actual != wanted:
+                    differences.append(f"{field} {actual} -> {wanted}")
+                    setattr(stats, field, wanted)
+            if differences:
+                drifted.append(stats)
+                self.stdout.write(
+                    f"{stats_model.__name__} {self.describe(stats_model, owner)}: {', '.join(differences)}"
+                )
+
+        if drifted and not dry_run:
+            for stats in drifted:
+                stats.save()
+        return len(drifted)
+
+    def describe(self, stats_model, owner):
+        return ' '.join(f"{field}={value}" for field, value in zip(stats_model.OWNER_FIELDS, owner))
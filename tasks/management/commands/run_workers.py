@@ -0,0 +1,34 @@
+"""
+Management command to work the background job queue (tasks.jobqueue).
+Run using: python manage.py run_workers [--processes 4] [--until-empty]
+
+Runs until Ctrl-C or SIGTERM; the workers finish their current job first. With
+--until-empty it stops once no job is due, e.g. from cron.
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from tasks.jobqueue import run_workers
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=min(4, os.cpu_count() or 1),
+            help='Worker processes (default: CPU count, at most 4)',
+        )
+        parser.add_argument('--until-empty', action='store_true', help='Stop once no job is due')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        self.stdout.write(f"Starting {processes} job worker{'s' if processes != 1 else ''}...")
+        try:
+            succeeded, failed = run_workers(processes, until_empty=options['until_empty'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f"Ran {succeeded + failed} jobs: {succeeded} succeeded, {failed} failed"))
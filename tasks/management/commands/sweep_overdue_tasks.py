@@ -0,0 +1,31 @@
+"""
+Management command to flag the tasks whose deadline has passed (tasks.overdue).
+Run using: python manage.py sweep_overdue_tasks [--batch-size 1000] [--every SECONDS]
+
+Run it from cron every few minutes, or keep it running with --every. Its
+task.overdue events reach the live streams only with the DatabaseEventBroker
+(EVENTS_BROKER); otherwise clients see the flags on their next read.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from tasks.overdue import sweep_overdue
+
+class Command(BaseCommand):
+    help = 'Sets Task.overdue on open tasks past their deadline, and clears it where it no longer holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Tasks updated per transaction (default OVERDUE_SWEEP_BATCH_SIZE)')
+        parser.add_argument('--every', type=float, help='Keep running, sweeping every this many seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            flagged, cleared = sweep_overdue(batch_size=options['batch_size'])
+            self.stdout.write(
+                f"Flagged {flagged} overdue tasks, cleared {cleared} in {time.perf_counter() - start:.2f}s"
+            )
+            if not options['every']:
+                break
+            time.sleep(options['every'])
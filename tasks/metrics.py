@@ -0,0 +1,95 @@
+"""
+Task workflow metrics, exposed on /metrics with the rest of adminportal.metrics.registry.
+
+The counters and histograms are updated by the TaskViewSet and TaskReportViewSet
+actions; the overdue gauge counts the stored Task.overdue flags on every scrape.
+"""
+from collections import Counter
+
+from django.db.models import Count
+
+from accounts.locations import location_registry
+from adminportal.metrics import registry
+from .models import Task
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Location label of tasks whose location this process cannot resolve
+UNKNOWN_LOCATION = 'unknown'
+
+TASKS_CREATED = registry.counter(
+    'tasks_created', 'Tasks created', ['location'],
+)
+TASK_TRANSITIONS = registry.counter(
+    'task_transitions', 'Task status changes by new status', ['location', 'status'],
+)
+TASK_COMPLETION_SECONDS = registry.histogram(
+    'task_completion_seconds', 'Time from created_at to completed_at', ['location'],
+    buckets=(HOUR, 6 * HOUR, DAY, 2 * DAY, 3 * DAY, 7 * DAY, 14 * DAY, 30 * DAY),
+)
+REPORT_REVIEW_LAG_SECONDS = registry.histogram(
+    'report_review_lag_seconds', 'Time from a report being submitted to being reviewed', ['location'],
+    buckets=(5 * 60, HOUR, 4 * HOUR, DAY, 2 * DAY, 7 * DAY),
+)
+
+
+def overdue_per_location():
+    """Tasks flagged overdue (Task.overdue, as of the last sweep), per location"""
+    counts = dict(
+        Task.objects.filter(overdue=True)
+        .values_list('location_id').annotate(count=Count('id')).order_by()
+    )
+    return [
+        ({'location': code}, counts.get(location_id, 0))
+        for location_id, code in sorted(location_registry.codes().items(), key=lambda item: item[1])
+    ]
+
+
+TASKS_OVERDUE = registry.gauge_callback(
+    'tasks_overdue', 'Open tasks past their deadline', ['location'], overdue_per_location,
+)
+
+
+def location_label(location_id):
+    """The location code of a task for the metric labels; never raises, as the write has happened"""
+    return location_registry.code(location_id) or UNKNOWN_LOCATION
+
+
+def record_created(tasks):
+    """Count newly created tasks"""
+    for location_id, count in Counter(task.location_id for task in tasks).items():
+        TASKS_CREATED.inc(count, location=location_label(location_id))
+
+
+def record_transition(task, status):
+    """Count a task moving to `status`"""
+    record_transitions([{
+        'location_id': task.location_id,
+        'created_at': task.created_at,
+        'completed_at': task.completed_at,
+    }], status)
+
+
+def record_transitions(rows, status):
+    """
+    Count tasks moving to `status`.
+    rows are dicts with location_id, created_at and completed_at (for completions).
+    """
+    for location_id, count in Counter(row['location_id'] for row in rows).items():
+        TASK_TRANSITIONS.inc(count, location=location_label(location_id), status=status)
+    if status == Task.Status.COMPLETED:
+        for row in rows:
+            if row.get('completed_at'):
+                TASK_COMPLETION_SECONDS.observe(
+                    (row['completed_at'] - row['created_at']).total_seconds(),
+                    location=location_label(row['location_id']),
+                )
+
+
+def record_review(report):
+    """Observe how long a report waited for review; report.task must be loaded"""
+    REPORT_REVIEW_LAG_SECONDS.observe(
+        (report.reviewed_at - report.submitted_at).total_seconds(),
+        location=location_label(report.task.location_id),
+    )
@@ -0,0 +1,69 @@
+# Generated by Django 5.0.2 on 2026-10-17 04:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_task_stats(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    LocationTaskStats = apps.get_model('tasks', 'LocationTaskStats')
+    ClientTaskStats = apps.get_model('tasks', 'ClientTaskStats')
+    
+    owners = (
+        (LocationTaskStats, 'location_id', 'location_id'),
+        (ClientTaskStats, 'client_id', 'assigned_to_id'),
+    )
+    for stats_model, owner_field, task_field in owners:
+        counters = {}
+        for row in Task.objects.values(task_field, 'status').annotate(count=Count('id')).order_by():
+            counters.setdefault(row[task_field], {})[row['status'].lower()] = row['count']
+        stats_model.objects.bulk_create(
+            stats_model(**{owner_field: owner_id}, **counts) for owner_id, counts in counters.items()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_adminlocation_unique_together_and_more'),
+        ('tasks', '0002_alter_task_options_alter_taskreport_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientTaskStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending', models.PositiveIntegerField(default=0)),
+                ('in_progress', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('approved', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationTaskStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending', models.PositiveIntegerField(default=0)),
+                ('in_progress', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('approved', models.PositiveIntegerField(default=0)),
+                ('rejected', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='task_stats', to='accounts.location')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(backfill_task_stats, migrations.RunPython.noop),
+    ]
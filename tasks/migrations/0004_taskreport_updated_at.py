@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-17 04:18
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    TaskReport = apps.get_model('tasks', 'TaskReport')
+    TaskReport.objects.update(updated_at=Coalesce('reviewed_at', 'submitted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_task_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskreport',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
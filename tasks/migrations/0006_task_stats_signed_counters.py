@@ -0,0 +1,63 @@
+# Generated by Django 5.0.2 on 2026-10-17 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0005_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='clienttaskstats',
+            name='approved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='clienttaskstats',
+            name='completed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='clienttaskstats',
+            name='in_progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='clienttaskstats',
+            name='pending',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='clienttaskstats',
+            name='rejected',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='locationtaskstats',
+            name='approved',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='locationtaskstats',
+            name='completed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='locationtaskstats',
+            name='in_progress',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='locationtaskstats',
+            name='pending',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='locationtaskstats',
+            name='rejected',
+            field=models.IntegerField(default=0),
+        ),
+    ]
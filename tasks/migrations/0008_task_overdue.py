@@ -0,0 +1,41 @@
+# Generated by Django 5.0.2 on 2026-10-17 05:37
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_overdue(apps, schema_editor):
+    """Flag the open tasks already past their deadline; the sweeper keeps it up from here"""
+    Task = apps.get_model('tasks', 'Task')
+    Task.objects.filter(deadline__lt=timezone.now()).exclude(status__in=['COMPLETED', 'APPROVED']).update(overdue=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_home_location'),
+        ('tasks', '0007_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='overdue',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_overdue, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('overdue', False), models.Q(('status__in', ['COMPLETED', 'APPROVED']), _negated=True)), fields=['deadline'], name='task_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('overdue', True)), fields=['location', 'deadline'], name='task_location_overdue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('overdue', True)), fields=['assigned_to', 'deadline'], name='task_assignee_overdue_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.2 on 2026-10-17 05:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_daily_task_stats(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    LocationDailyTaskStats = apps.get_model('tasks', 'LocationDailyTaskStats')
+    
+    counters = {}
+    rows = Task.objects.values(
+        'location_id', 'status', day=TruncDate('deadline', tzinfo=timezone.get_default_timezone()),
+    ).annotate(count=Count('id')).order_by()
+    for row in rows:
+        counters.setdefault((row['location_id'], row['day']), {})[row['status'].lower()] = row['count']
+    LocationDailyTaskStats.objects.bulk_create(
+        (
+            LocationDailyTaskStats(location_id=location_id, day=day, **counts)
+            for (location_id, day), counts in counters.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_home_location'),
+        ('tasks', '0008_task_overdue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationDailyTaskStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('completed', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('rejected', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('day', models.DateField()),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_task_stats', to='accounts.location')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='locationdailytaskstats',
+            constraint=models.UniqueConstraint(fields=('location', 'day'), name='daily_task_stats_location_day_uniq'),
+        ),
+        migrations.RunPython(backfill_daily_task_stats, migrations.RunPython.noop),
+    ]
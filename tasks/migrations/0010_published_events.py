@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-17 05:56
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_daily_task_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=50)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('location_ids', models.JSONField(default=list)),
+                ('user_ids', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='published_event_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-17 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0010_published_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskreport',
+            name='attachment_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='task_reports/thumbnails/'),
+        ),
+    ]
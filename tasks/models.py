@@ -1,4 +1,11 @@
-from django.db import models
+import operator
+from collections import Counter
+from datetime import date, timedelta
+from functools import reduce
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from accounts.models import User, Location
 
@@ -43,15 +50,74 @@ class Task(models.Model):
         choices=Status.choices,
         default=Status.PENDING,
     )
+    # Stored is_overdue(): set on save, and by sweep_overdue_tasks as deadlines pass
+    overdue = models.BooleanField(default=False)
+    
+    # Statuses of finished work, which is never overdue
+    DONE_STATUSES = (Status.COMPLETED, Status.APPROVED)
     
     class Meta:
         ordering = ['-created_at']  # Order by most recent first
+        indexes = [
+            # Task listings per role, newest first (also the keyset pagination order)
+            models.Index(fields=['-created_at', '-id'], name='task_created_idx'),
+            models.Index(fields=['location', '-created_at', '-id'], name='task_location_created_idx'),
+            models.Index(fields=['assigned_to', '-created_at', '-id'], name='task_assignee_created_idx'),
+            # Status filters per location / client, and client deadlines
+            models.Index(fields=['location', 'status'], name='task_location_status_idx'),
+            models.Index(fields=['assigned_to', 'status', 'deadline'], name='task_assignee_status_dl_idx'),
+            # Recent activity feeds
+            models.Index(fields=['-updated_at'], name='task_updated_idx'),
+            models.Index(fields=['location', '-updated_at'], name='task_location_updated_idx'),
+            models.Index(fields=['assigned_to', '-updated_at'], name='task_assignee_updated_idx'),
+            # The overdue sweep: open tasks not yet flagged, by deadline
+            models.Index(
+                fields=['deadline'],
+                name='task_due_idx',
+                condition=models.Q(overdue=False) & ~models.Q(status__in=['COMPLETED', 'APPROVED']),
+            ),
+            # Overdue counts and ?overdue=true per location and client
+            models.Index(fields=['location', 'deadline'], name='task_location_overdue_idx', condition=models.Q(overdue=True)),
+            models.Index(fields=['assigned_to', 'deadline'], name='task_assignee_overdue_idx', condition=models.Q(overdue=True)),
+        ]
+    
+    # Fields whose stored values decide which task stats counters a task belongs to
+    STATS_FIELDS = ('status', 'location_id', 'assigned_to_id', 'deadline')
     
     def __str__(self):
         return self.title
     
+    def stats_values(self):
+        return {field: getattr(self, field) for field in self.STATS_FIELDS}
+    
+    def save(self, *args, **kwargs):
+        """Save the task, refresh its overdue flag and move it between the task stats counters"""
+        self.overdue = self.is_overdue()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'status', 'deadline'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'overdue'}
+        
+        with transaction.atomic():
+            if self._state.adding:
+                previous = None
+            else:
+                # The stored values, not the ones loaded with the task: under the row lock, two
+                # concurrent saves cannot both take the task out of the same old counters
+                previous = Task.objects.select_for_update().filter(pk=self.pk).values(*self.STATS_FIELDS).first()
+                # post_save receivers compare against the stored values too
+                self._stats_values = previous or {}
+            super().save(*args, **kwargs)
+            current = self.stats_values()
+            if not previous:
+                TaskStatusCounters.apply_change(current, 1)
+            elif previous != current:
+                # Only the counter rows the change moves the task between are written
+                TaskStatusCounters.apply_changes([(previous, -1), (current, 1)])
+        self._stats_values = current
+    
     def is_overdue(self):
-        if self.status not in [self.Status.COMPLETED, self.Status.APPROVED]:
+        """Whether the task is open past its deadline right now (overdue is the stored value)"""
+        if self.status not in self.DONE_STATUSES:
             return timezone.now() > self.deadline
         return False
 
@@ -62,7 +128,10 @@ class TaskReport(models.Model):
                                    limit_choices_to={'role': User.Role.CLIENT})
     report_text = models.TextField()
     attachments = models.FileField(upload_to='task_reports/', blank=True, null=True)
+    # Downscaled copy of an image attachment, written by a background job (tasks.jobs)
+    attachment_thumbnail = models.ImageField(upload_to='task_reports/thumbnails/', blank=True, null=True)
     submitted_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     # Review information
     reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, 
@@ -73,6 +142,281 @@ class TaskReport(models.Model):
     
     class Meta:
         ordering = ['-submitted_at']  # Order by most recent first
+        indexes = [
+            models.Index(fields=['-submitted_at', '-id'], name='report_submitted_idx'),
+            models.Index(fields=['submitted_by', '-submitted_at'], name='report_submitter_idx'),
+            # Only reports still waiting for review, as counted on the admin dashboard
+            models.Index(
+                fields=['task'],
+                name='report_unreviewed_task_idx',
+                condition=models.Q(reviewed_at__isnull=True),
+            ),
+        ]
     
     def __str__(self):
         return f"Report for {self.task.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_reviewed_at = instance.__dict__.get('reviewed_at')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_reviewed_at = self.reviewed_at
+
+
+class TaskStatusCounters(models.Model):
+    """Materialized task counts per status, kept in step with Task writes"""
+    # Plain integers: drift from writes that bypass Task.save must not make later updates
+    # fail a CHECK constraint; rebuild_task_stats reconciles it instead
+    pending = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    completed = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    COUNTER_FIELDS = ('pending', 'in_progress', 'completed', 'approved', 'rejected')
+    
+    class Meta:
+        abstract = True
+    
+    @staticmethod
+    def field_for_status(task_status):
+        return task_status.lower()
+    
+    @property
+    def total(self):
+        return self.pending + self.in_progress + self.completed + self.approved + self.rejected
+    
+    @property
+    def active(self):
+        return self.pending + self.in_progress
+    
+    @property
+    def done(self):
+        return self.completed + self.approved
+    
+    @classmethod
+    def owner_of(cls, values):
+        """The OWNER_FIELDS values of the counter row of a task with the given stats values"""
+        return (values[cls.TASK_FIELD],)
+    
+    def owner(self):
+        return tuple(getattr(self, field) for field in self.OWNER_FIELDS)
+    
+    @classmethod
+    def adjust(cls, owner, task_status, delta):
+        """Add delta to one status counter of the row of owner, creating the row on first increment"""
+        lookup = dict(zip(cls.OWNER_FIELDS, owner))
+        field = cls.field_for_status(task_status)
+        counters = cls.objects.filter(**lookup)
+        if counters.update(**{field: F(field) + delta}) or delta < 0:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(**lookup, **{field: delta})
+        except IntegrityError:
+            # Another request created the row first
+            counters.update(**{field: F(field) + delta})
+    
+    @staticmethod
+    def apply_change(values, delta):
+        """Count a task with the given stats values in (+1) or out (-1) of its counters"""
+        for stats_model in COUNTER_MODELS:
+            stats_model.adjust(stats_model.owner_of(values), values['status'], delta)
+    
+    @staticmethod
+    def apply_changes(changes):
+        """Apply many (values, delta) changes with one UPDATE per counter row and status"""
+        for stats_model in COUNTER_MODELS:
+            deltas = Counter()
+            for values, delta in changes:
+                deltas[(stats_model.owner_of(values), values['status'])] += delta
+            for (owner, task_status), delta in deltas.items():
+                if delta:
+                    stats_model.adjust(owner, task_status, delta)
+    
+    @classmethod
+    def recount(cls):
+        """Recompute the counters from the Task table as {owner: {field: count}}"""
+        counters = {}
+        rows = Task.objects.values(cls.TASK_FIELD, 'status').annotate(count=models.Count('id')).order_by()
+        for row in rows:
+            counters.setdefault((row[cls.TASK_FIELD],), {})[cls.field_for_status(row['status'])] = row['count']
+        return counters
+
+
+class LocationTaskStats(TaskStatusCounters):
+    """Task counts per status for one location"""
+    OWNER_FIELDS = ('location_id',)
+    TASK_FIELD = 'location_id'
+    
+    location = models.OneToOneField(Location, on_delete=models.CASCADE, related_name='task_stats')
+    
+    def __str__(self):
+        return f"Task stats for {self.location}"
+
+
+class ClientTaskStats(TaskStatusCounters):
+    """Task counts per status for one assigned client"""
+    OWNER_FIELDS = ('client_id',)
+    TASK_FIELD = 'assigned_to_id'
+    
+    client = models.OneToOneField(User, on_delete=models.CASCADE, related_name='task_stats')
+    
+    def __str__(self):
+        return f"Task stats for {self.client.username}"
+
+
+class LocationDailyTaskStats(TaskStatusCounters):
+    """
+    Task counts per status for one location and deadline day (in TIME_ZONE), so date
+    range statistics read a row per day instead of every task due in the range
+    """
+    OWNER_FIELDS = ('location_id', 'day')
+    
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='daily_task_stats')
+    day = models.DateField()
+    
+    # Calendar periods of the completion rates
+    COMPLETION_WINDOWS = ('this_week', 'this_month', 'this_quarter', 'this_year')
+    
+    class Meta:
+        constraints = [
+            # Also the index of the date range reads per location
+            models.UniqueConstraint(fields=['location', 'day'], name='daily_task_stats_location_day_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"Task stats for {self.location} due {self.day}"
+    
+    @classmethod
+    def owner_of(cls, values):
+        return (values['location_id'], timezone.localdate(values['deadline'], timezone.get_default_timezone()))
+    
+    @classmethod
+    def recount(cls):
+        counters = {}
+        rows = Task.objects.values(
+            'location_id', 'status', day=TruncDate('deadline', tzinfo=timezone.get_default_timezone()),
+        ).annotate(count=models.Count('id')).order_by()
+        for row in rows:
+            counters.setdefault((row['location_id'], row['day']), {})[cls.field_for_status(row['status'])] = row['count']
+        return counters
+    
+    @staticmethod
+    def completion_windows(today):
+        """{window: (first day, last day)} of the calendar week, month, quarter and year of today"""
+        def month_start(year, month):
+            return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+        
+        week_start = today - timedelta(days=today.weekday())
+        quarter_month = (today.month - 1) // 3 * 3 + 1
+        return {
+            'this_week': (week_start, week_start + timedelta(days=6)),
+            'this_month': (today.replace(day=1), month_start(today.year, today.month + 1) - timedelta(days=1)),
+            'this_quarter': (
+                month_start(today.year, quarter_month), month_start(today.year, quarter_month + 3) - timedelta(days=1),
+            ),
+            'this_year': (date(today.year, 1, 1), date(today.year, 12, 31)),
+        }
+    
+    @classmethod
+    def completion(cls, today):
+        """
+        Per location, the tasks due in each completion window around today and how many
+        of them are done, as '<window>_due' and '<window>_done', in one grouped query
+        over the daily rows of the windows (conditional aggregation)
+        """
+        windows = cls.completion_windows(today)
+        due = reduce(operator.add, (F(field) for field in cls.COUNTER_FIELDS))
+        done = F('completed') + F('approved')
+        counts = {}
+        for window, days in windows.items():
+            counts[f'{window}_due'] = Sum(due, filter=Q(day__range=days))
+            counts[f'{window}_done'] = Sum(done, filter=Q(day__range=days))
+        return cls.objects.filter(
+            day__range=(min(first for first, _ in windows.values()), max(last for _, last in windows.values())),
+        ).values('location_id').annotate(**counts).order_by()
+    
+    @classmethod
+    def completion_rates(cls, row):
+        """{window: share of the tasks due in it that are done, 0 when none are due} of a completion() row"""
+        rates = {}
+        for window in cls.COMPLETION_WINDOWS:
+            due = row and row[f'{window}_due']
+            rates[window] = round(row[f'{window}_done'] / due, 2) if due else 0
+        return rates
+
+
+# The materialized counters kept in step with Task writes, in the order they are written
+COUNTER_MODELS = (LocationTaskStats, ClientTaskStats, LocationDailyTaskStats)
+
+
+class Job(models.Model):
+    """A deferred call of a registered job function, run by manage.py run_workers (see tasks.jobqueue)"""
+    
+    class Status(models.TextChoices):
+        QUEUED = 'QUEUED', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+    
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Higher runs first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED)
+    # Not claimed before this time; pushed back by the retry backoff
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    # Claim token of the worker running the job
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Claiming: the due queued jobs, highest priority first
+            models.Index(
+                fields=['-priority', 'run_at', 'id'],
+                name='job_queued_idx',
+                condition=models.Q(status='QUEUED'),
+            ),
+            # Loading a claimed batch, and finding the jobs of dead workers
+            models.Index(
+                fields=['locked_by'],
+                name='job_running_idx',
+                condition=models.Q(status='RUNNING'),
+            ),
+            # Purging finished jobs
+            models.Index(fields=['status', 'finished_at'], name='job_finished_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class PublishedEvent(models.Model):
+    """A live event on its way to the streams of every process (tasks.events.DatabaseEventBroker)"""
+    type = models.CharField(max_length=50)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    location_ids = models.JSONField(default=list)
+    user_ids = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Purging old events
+            models.Index(fields=['created_at'], name='published_event_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.type} #{self.pk}"
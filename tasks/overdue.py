@@ -0,0 +1,71 @@
+"""
+Upkeep of the stored Task.overdue flag.
+
+Task.save sets the flag from is_overdue(), but a task also becomes overdue just by
+its deadline passing, with no write. sweep_overdue() catches those up: it walks
+the open, unflagged tasks with a deadline before now through the partial
+task_due_idx index, which only holds the tasks that can still become overdue, and
+flags them OVERDUE_SWEEP_BATCH_SIZE at a time, one short transaction per batch.
+It then clears the flag on tasks that bulk writes finished or moved past (read
+through the small overdue=True partial indexes).
+
+Only the flag is written. updated_at keeps the time of the last real edit, so
+swept tasks do not crowd the recent activity lists, and the tasks_bulk_changed
+signal sent per batch moves the dashboards. Run it periodically with manage.py
+sweep_overdue_tasks. That is its own process, so the task.overdue events it
+publishes only reach the live streams with
+EVENTS_BROKER = 'tasks.events.DatabaseEventBroker' (see tasks.events). With the
+default in-process broker, clients see the flag changes on their next read.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task
+from .signals import tasks_bulk_changed
+
+# The status half of task_due_idx's condition as SQL. SQLite only reads a partial
+# index for a query that repeats its condition with the same literal values, and
+# Django sends the values of a status__in filter as parameters.
+OPEN_STATUS_SQL = 'NOT ("{table}"."status" IN ({statuses}))'.format(
+    table=Task._meta.db_table, statuses=', '.join(f"'{status}'" for status in Task.DONE_STATUSES),
+)
+
+
+def update_in_batches(candidates, values, batch_size):
+    """Set values on the tasks matching candidates, batch_size per transaction; returns the count"""
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(candidates.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            # Matching again drops tasks another write changed since the read
+            updated = candidates.order_by().filter(id__in=ids).update(**values)
+            tasks_bulk_changed.send(sender=Task, action='overdue', ids=ids)
+        total += updated
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def due_tasks(now):
+    """The open tasks past their deadline that are not flagged yet, oldest deadline first"""
+    return Task.objects.filter(overdue=False, deadline__lt=now).extra(where=[OPEN_STATUS_SQL]).order_by('deadline')
+
+
+def no_longer_due_tasks(now):
+    """The flagged tasks that are done or whose deadline was moved past now"""
+    return Task.objects.filter(overdue=True).filter(
+        Q(status__in=Task.DONE_STATUSES) | Q(deadline__gte=now)
+    ).order_by('deadline')
+
+
+def sweep_overdue(now=None, batch_size=None):
+    """Bring Task.overdue up to date as of now; returns (flagged, cleared)"""
+    now = now or timezone.now()
+    batch_size = batch_size or getattr(settings, 'OVERDUE_SWEEP_BATCH_SIZE', 1000)
+    flagged = update_in_batches(due_tasks(now), {'overdue': True}, batch_size)
+    cleared = update_in_batches(no_longer_due_tasks(now), {'overdue': False}, batch_size)
+    return flagged, cleared
@@ -0,0 +1,180 @@
+import asyncio
+import base64
+import json
+
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page number pagination with an opt-in keyset (cursor) mode.
+
+    Requests without a `cursor` query parameter keep the regular ?page= behaviour.
+    Passing `?cursor=` (empty for the first page) switches to keyset mode: rows are
+    ordered on `ordering` and each page continues strictly after the last row of the
+    previous one, so there is no OFFSET scan, no COUNT(*), and rows inserted while a
+    client is paging neither shift nor repeat results.
+    """
+    # A (timestamp field, unique tiebreaker) pair, descending like the models' Meta.ordering
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            self.keyset_mode = False
+            return super().paginate_queryset(queryset, request, view)
+
+        return self.keyset_page(list(self.keyset_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset with the async ORM. In page number mode the count and the
+        rows of the page are read concurrently.
+        """
+        if self.cursor_query_param in request.query_params:
+            return self.keyset_page([row async for row in self.keyset_queryset(queryset, request)])
+
+        self.keyset_mode = False
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            paginator.count = await queryset.acount()
+            page_number = paginator.num_pages
+        try:
+            number = int(page_number)
+        except (TypeError, ValueError):
+            number = 0
+        if number < 1:
+            # Rejected before the count is needed
+            self.validate_page_number(paginator, page_number)
+
+        bottom = (number - 1) * page_size
+        rows = queryset[bottom:bottom + page_size]
+        if 'count' in paginator.__dict__:
+            rows = [row async for row in rows]
+        else:
+            paginator.count, rows = await asyncio.gather(queryset.acount(), self.afetch(rows))
+        number = self.validate_page_number(paginator, number)
+
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return rows
+
+    @staticmethod
+    async def afetch(queryset):
+        return [row async for row in queryset]
+
+    def validate_page_number(self, paginator, page_number):
+        try:
+            return paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+    def keyset_queryset(self, queryset, request):
+        """The rows of the page of the request's cursor, plus one"""
+        self.keyset_mode = True
+        self.request = request
+        self.keyset_size = self.get_page_size(request)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(self.flip(field) for field in ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self.after_position(self.position, ordering))
+
+        # Fetch one extra row to learn whether another page exists in this direction
+        return queryset.order_by(*ordering)[:self.keyset_size + 1]
+
+    def keyset_page(self, rows):
+        """The page from the rows of keyset_queryset"""
+        page_size, position, reverse = self.keyset_size, self.position, self.reverse
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        has_next = has_more if not reverse else position is not None
+        has_previous = has_more if reverse else position is not None
+        self.next_position = self.get_position(rows[-1]) if rows and has_next else None
+        self.previous_position = self.get_position(rows[0]) if rows and has_previous else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_cursor_link(self.next_position, reverse=False),
+            'previous': self.get_cursor_link(self.previous_position, reverse=True),
+            'results': data,
+        })
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    def get_position(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def after_position(self, position, ordering):
+        """Q matching the rows that come strictly after `position` in `ordering`"""
+        (first, second), (first_value, second_value) = ordering, position
+        first_lookup = 'lt' if first.startswith('-') else 'gt'
+        second_lookup = 'lt' if second.startswith('-') else 'gt'
+        first, second = first.lstrip('-'), second.lstrip('-')
+        return (
+            Q(**{f'{first}__{first_lookup}': first_value})
+            | Q(**{first: first_value, f'{second}__{second_lookup}': second_value})
+        )
+
+    def encode_cursor(self, position, reverse):
+        timestamp, pk = position
+        payload = json.dumps({'p': [timestamp.isoformat(), pk], 'r': reverse})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Return (position, reverse) for the cursor in the request; an empty cursor is the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            timestamp, pk = payload['p']
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                raise ValueError
+            return (timestamp, int(pk)), bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor_link(self, position, reverse):
+        if position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+
+class TaskPagination(KeysetPagination):
+    """Pagination for tasks, keyset mode ordered like Task.Meta.ordering"""
+    ordering = ('-created_at', '-id')
+
+
+class TaskReportPagination(KeysetPagination):
+    """Pagination for task reports, keyset mode ordered like TaskReport.Meta.ordering"""
+    ordering = ('-submitted_at', '-id')
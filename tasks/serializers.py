@@ -1,13 +1,19 @@
 from rest_framework import serializers
+from adminportal.instrumentation import TimedSerializerMixin
+from .jobqueue import enqueue_on_commit
+from .jobs import make_report_attachment_thumbnail
 from .models import Task, TaskReport
+from accounts.locations import location_registry
+from accounts.models import User, Location
 from accounts.serializers import UserSerializer
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Task model"""
     assigned_by_name = serializers.CharField(source='assigned_by.get_full_name', read_only=True)
     assigned_to_name = serializers.CharField(source='assigned_to.get_full_name', read_only=True)
     location_name = serializers.CharField(source='location.name', read_only=True)
-    is_overdue = serializers.BooleanField(read_only=True)
+    # Stored by Task.save and the overdue sweep, not computed per row
+    is_overdue = serializers.BooleanField(source='overdue', read_only=True)
     
     class Meta:
         model = Task
@@ -17,7 +23,7 @@ class TaskSerializer(serializers.ModelSerializer):
                   'status', 'is_overdue', 'group_id', 'site_name', 'cluster',
                   'service_engineer_name', 'service_type', 'is_required']
 
-class TaskReportSerializer(serializers.ModelSerializer):
+class TaskReportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for TaskReport model"""
     submitted_by_name = serializers.CharField(source='submitted_by.get_full_name', read_only=True)
     reviewed_by_name = serializers.CharField(source='reviewed_by.get_full_name', read_only=True)
@@ -26,12 +32,68 @@ class TaskReportSerializer(serializers.ModelSerializer):
     class Meta:
         model = TaskReport
         fields = ['id', 'task', 'task_title', 'submitted_by', 'submitted_by_name',
-                  'report_text', 'attachments', 'submitted_at',
+                  'report_text', 'attachments', 'attachment_thumbnail', 'submitted_at', 'updated_at',
                   'reviewed_by', 'reviewed_by_name', 'reviewed_at', 'feedback']
+        read_only_fields = ['attachment_thumbnail']
+    
+    def save(self, **kwargs):
+        report = super().save(**kwargs)
+        if self.validated_data.get('attachments'):
+            # Make the thumbnail of an uploaded image after the report's write commits
+            name = report.attachments.name
+            enqueue_on_commit(
+                make_report_attachment_thumbnail,
+                {'report_id': report.pk, 'name': name},
+                idempotency_key=f'report-attachment-thumbnail:{report.pk}:{name}',
+            )
+        return report
 
 class TaskDetailSerializer(TaskSerializer):
     """Detailed Task serializer with reports included"""
     reports = TaskReportSerializer(many=True, read_only=True)
     
     class Meta(TaskSerializer.Meta):
-        fields = TaskSerializer.Meta.fields + ['reports'] 
\ No newline at end of file
+        fields = TaskSerializer.Meta.fields + ['reports'] 
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key field that resolves ids from objects preloaded into the serializer
+    context under 'preloaded'[field_name], so validating many items costs no queries.
+    """
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.field_name)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return preloaded[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class TaskBulkItemSerializer(TaskSerializer):
+    """Validates one item of a bulk task creation request"""
+    location = PreloadedPrimaryKeyRelatedField(queryset=Location.objects.all())
+    assigned_to = PreloadedPrimaryKeyRelatedField(queryset=User.objects.filter(role=User.Role.CLIENT))
+    
+    class Meta(TaskSerializer.Meta):
+        read_only_fields = ['assigned_by', 'completed_at']
+    
+    @classmethod
+    def preload(cls, items):
+        """Load every client referenced by items with one query; locations come from the registry"""
+        def ids(field):
+            values = set()
+            for item in items:
+                try:
+                    values.add(int(item.get(field)))
+                except (AttributeError, TypeError, ValueError):
+                    continue
+            return values
+        return {
+            'location': location_registry.in_bulk(ids('location')),
+            'assigned_to': User.objects.filter(role=User.Role.CLIENT).in_bulk(ids('assigned_to')),
+        }
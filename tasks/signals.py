@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver, Signal
+from .events import broker
+from .models import Task, TaskReport, TaskStatusCounters
+
+# Sent after bulk writes that bypass Task.save and post_save (bulk_create, queryset.update)
+tasks_bulk_changed = Signal()
+
+# Event type of each tasks_bulk_changed action, task.status for the bulk transitions
+BULK_EVENT_TYPES = {'bulk': 'task.assigned', 'overdue': 'task.overdue'}
+
+# Task fields carried by the live events (tasks.events)
+TASK_EVENT_FIELDS = ('id', 'title', 'status', 'location_id', 'assigned_to_id', 'deadline', 'overdue', 'updated_at')
+
+
+@receiver(post_delete, sender=Task)
+def remove_task_from_stats(sender, instance, **kwargs):
+    """Take deleted tasks (including cascaded deletes) out of the task stats counters"""
+    TaskStatusCounters.apply_change(instance.stats_values(), -1)
+
+
+def task_event(values, **extra):
+    return {
+        'task_id': values['id'],
+        'title': values['title'],
+        'status': values['status'],
+        'location_id': values['location_id'],
+        'assigned_to': values['assigned_to_id'],
+        'deadline': values['deadline'],
+        'overdue': values['overdue'],
+        'updated_at': values['updated_at'],
+        **extra,
+    }
+
+
+def publish_on_commit(events, location_ids, user_ids):
+    """Publish (type, data) events once the current transaction commits"""
+    def publish():
+        for event_type, data in events:
+            broker.publish(event_type, data, location_ids, user_ids)
+    if events:
+        transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=Task)
+def publish_task_events(sender, instance, created, **kwargs):
+    """Publish new assignments, reassignments and status changes"""
+    # Task.save refreshes the remembered stats values only after post_save
+    previous = {} if created else getattr(instance, '_stats_values', {})
+    previous_assignee = previous.get('assigned_to_id', instance.assigned_to_id)
+    previous_status = previous.get('status', instance.status)
+    values = {field: getattr(instance, field) for field in TASK_EVENT_FIELDS}
+    events = []
+    if created or previous_assignee != instance.assigned_to_id:
+        events.append(('task.assigned', task_event(values)))
+    if previous_status != instance.status:
+        events.append(('task.status', task_event(values, previous_status=previous_status)))
+    # A reassignment or move is shown to both the old and the new audience
+    publish_on_commit(
+        events,
+        {instance.location_id, previous.get('location_id', instance.location_id)},
+        {instance.assigned_to_id, previous_assignee},
+    )
+
+
+@receiver(tasks_bulk_changed)
+def publish_bulk_task_events(sender, action, ids, **kwargs):
+    """Publish the tasks created or moved by the bulk endpoints or the overdue sweep, read back after the commit"""
+    event_type = BULK_EVENT_TYPES.get(action, 'task.status')
+
+    def publish():
+        for values in Task.objects.filter(id__in=ids).values(*TASK_EVENT_FIELDS):
+            broker.publish(event_type, task_event(values), {values['location_id']}, {values['assigned_to_id']})
+    if ids:
+        transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=TaskReport)
+def publish_report_events(sender, instance, created, **kwargs):
+    """Publish report submissions and reviews"""
+    if created:
+        event_type = 'report.submitted'
+    elif instance.reviewed_at and instance.reviewed_at != getattr(instance, '_loaded_reviewed_at', None):
+        event_type = 'report.reviewed'
+    else:
+        return
+    task = instance.task
+    data = {
+        'report_id': instance.id,
+        'task_id': task.id,
+        'submitted_by': instance.submitted_by_id,
+        'submitted_at': instance.submitted_at,
+        'reviewed_by': instance.reviewed_by_id,
+        'reviewed_at': instance.reviewed_at,
+        'feedback': instance.feedback,
+    }
+    publish_on_commit([(event_type, data)], {task.location_id}, {instance.submitted_by_id, task.assigned_to_id})
@@ -0,0 +1,132 @@
+"""
+WebSocket push of new assignments and report reviews to field clients.
+
+adminportal.asgi routes WebSocket connections on /ws/tasks/ to task_socket. The
+client authenticates as on the REST API: with an "Authorization: Token <key>" or
+"Bearer <jwt>" header, or with ?token=<key> where it cannot set headers. The
+connection then gets the task.assigned and report.reviewed events of its user
+from the event broker (tasks.events), as JSON text messages:
+    {"events": [{"id": "<event id>", "type": "task.assigned", "data": {...}}, ...]}
+An empty batch is a keep-alive, sent every EVENTS_HEARTBEAT_SECONDS when nothing
+else is. To resume after a reconnect, pass the last id seen as ?last_event_id=.
+When the missed events can no longer be replayed, the first message is
+{"reset": "<event id>"} instead: reload through the REST API and resume from that id.
+
+Events are batched. Once one is queued, the connection waits WEBSOCKET_BATCH_DELAY
+seconds for more and sends what has gathered, WEBSOCKET_BATCH_SIZE events per
+message. While a send waits on a slow client, new events queue on its
+subscription. When EVENTS_QUEUE_SIZE of them are waiting, the connection is
+closed with code 1013 (try again later), and the client reconnects and resumes.
+
+A connection that fails authentication is closed before the handshake completes
+(code 4401). Nothing the client sends is read.
+"""
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .events import broker
+
+SOCKET_EVENT_TYPES = frozenset({'task.assigned', 'report.reviewed'})
+
+# Close codes: the client is not authenticated, or fell too far behind
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def query_param(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode()).get(name)
+    return values[0] if values else None
+
+
+def authorization(scope):
+    """The Authorization value of a connection, from its header or ?token="""
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            return value.decode('latin-1')
+    token = query_param(scope, 'token')
+    return f'Token {token}' if token else None
+
+
+def authenticate(value):
+    """The active user an Authorization value belongs to, through the API's authentication classes, or None"""
+    if not value:
+        return None
+    http_request = HttpRequest()
+    http_request.META['HTTP_AUTHORIZATION'] = value
+    request = Request(http_request)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = authentication_class().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+async def send_batches(send, events, batch_size):
+    """Send events as messages of up to batch_size events; an empty list is a keep-alive"""
+    for start in range(0, len(events), batch_size) if events else (0,):
+        batch = events[start:start + batch_size]
+        await send({
+            'type': 'websocket.send',
+            'text': '{"events":[' + ','.join(event.message for event in batch) + ']}',
+        })
+
+
+async def push_events(send, subscription, backlog):
+    """Send the subscription's events until it falls too far behind"""
+    heartbeat = getattr(settings, 'EVENTS_HEARTBEAT_SECONDS', 15)
+    batch_delay = getattr(settings, 'WEBSOCKET_BATCH_DELAY', 0.05)
+    batch_size = getattr(settings, 'WEBSOCKET_BATCH_SIZE', 50)
+    if backlog is None:
+        await send({'type': 'websocket.send', 'text': f'{{"reset":"{subscription.resume_id}"}}'})
+    elif backlog:
+        await send_batches(send, backlog, batch_size)
+    while True:
+        events = await subscription.get(heartbeat)
+        if events and batch_delay and not subscription.overflowed:
+            # Let the rest of a burst arrive, to send it as one message
+            await asyncio.sleep(batch_delay)
+            events += subscription.drain()
+        if subscription.overflowed:
+            await send({'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER, 'reason': 'Too far behind, reconnect'})
+            return
+        await send_batches(send, events, batch_size)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+async def task_socket(scope, receive, send):
+    """ASGI application of one /ws/tasks/ connection"""
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    user = await sync_to_async(authenticate)(authorization(scope))
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        return
+
+    subscription, backlog = broker.subscribe(('user', user.pk), query_param(scope, 'last_event_id'), SOCKET_EVENT_TYPES)
+    try:
+        await send({'type': 'websocket.accept'})
+        pusher = asyncio.ensure_future(push_events(send, subscription, backlog))
+        listener = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            done, _ = await asyncio.wait({pusher, listener}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pusher.cancel()
+            listener.cancel()
+        if pusher in done:
+            pusher.result()
+    finally:
+        broker.unsubscribe(subscription)
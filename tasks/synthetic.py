@@ -0,0 +1,374 @@
+"""
+Synthetic data at scale for load tests and benchmarks.
+
+The generate_load_data command and benchmarks.dataset both build their data here.
+Users, tasks and reports are written with bulk_create in batches, with one
+precomputed password hash for every user. Tasks are split into chunks of
+`batch_size` ids. Each chunk gets its own id range and its own random.Random,
+seeded from the seed and the chunk number, so a seed always gives the same rows
+however many worker processes write the chunks.
+
+The distributions are skewed the way production data is: most tasks sit in a
+few locations, a few clients and clusters carry most of the work, recent tasks
+are still open and older ones are mostly done, and deadlines follow a
+log-normal spread around a week.
+"""
+import functools
+import io
+import multiprocessing
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import User, Location, AdminLocation
+from .models import Task, TaskReport
+
+# Share of the tasks per location
+LOCATION_WEIGHTS = {
+    Location.StateName.TAMIL_NADU: 45,
+    Location.StateName.ANDHRA_PRADESH: 25,
+    Location.StateName.TELANGANA: 20,
+    Location.StateName.ODISHA: 10,
+}
+
+SERVICE_TYPES = ('Maintenance', 'Installation', 'Repair', 'Inspection', 'Survey', 'Decommissioning')
+SERVICE_TYPE_WEIGHTS = (40, 25, 18, 10, 5, 2)
+# How many service types a task lists
+SERVICE_TYPE_COUNTS = ((1, 2, 3), (65, 28, 7))
+
+# Status of tasks whose deadline is still ahead, and of those past it
+OPEN_STATUS_WEIGHTS = {
+    Task.Status.PENDING: 45,
+    Task.Status.IN_PROGRESS: 35,
+    Task.Status.COMPLETED: 12,
+    Task.Status.APPROVED: 7,
+    Task.Status.REJECTED: 1,
+}
+PAST_STATUS_WEIGHTS = {
+    Task.Status.PENDING: 6,
+    Task.Status.IN_PROGRESS: 9,
+    Task.Status.COMPLETED: 15,
+    Task.Status.APPROVED: 62,
+    Task.Status.REJECTED: 8,
+}
+DONE_STATUSES = (Task.Status.COMPLETED, Task.Status.APPROVED, Task.Status.REJECTED)
+
+CLUSTERS_PER_LOCATION = 30
+ENGINEERS_PER_LOCATION = 80
+SITES_PER_LOCATION = 2000
+
+DESCRIPTIONS = (
+    'Scheduled visit to the site',
+    'Customer reported an outage at the site',
+    'Replace the faulty unit and record the serial numbers',
+    'Quarterly preventive maintenance',
+    'Survey the site ahead of the installation',
+)
+REPORT_TEXTS = (
+    'Work completed as scheduled.',
+    'Unit replaced, site back online.',
+    'Site visited, photos attached to the ticket.',
+    'Partial fix, spare part on order.',
+)
+REJECTION_FEEDBACK = ('Photos missing', 'Serial numbers do not match', 'Site still reporting alarms')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def zipf_weights(count, exponent=1.1):
+    """Cumulative weights where rank r is picked in proportion to 1 / r**exponent"""
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+def insert_rows(model, rows):
+    """
+    INSERT rows, dicts of {attname: value}, with one executemany.
+
+    At millions of rows bulk_create spends most of its time building model instances and
+    calling pre_save/get_db_prep_save on every value, in batches of ~60 rows under
+    SQLite's parameter limit. Here only datetime and JSON values are adapted, columns
+    missing from the rows get their field default, and auto_now fields keep the values
+    they are given.
+    """
+    if not rows:
+        return
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key or field.attname in rows[0]
+    ]
+    adapters = []
+    for field in fields:
+        internal_type = field.get_internal_type()
+        if internal_type == 'DateTimeField':
+            adapters.append(connection.ops.adapt_datetimefield_value)
+        elif internal_type == 'JSONField':
+            adapters.append(functools.partial(field.get_db_prep_save, connection=connection))
+        else:
+            adapters.append(None)
+    defaults = [None if field.null else field.get_default() for field in fields]
+    columns = list(zip([field.attname for field in fields], adapters, defaults))
+
+    def values(row):
+        params = []
+        for attname, adapt, default in columns:
+            value = row.get(attname, default)
+            params.append(adapt(value) if adapt and value is not None else value)
+        return params
+
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [values(row) for row in rows])
+
+
+def create_users(prefix, clients, admins_per_location, password_hash, batch_size):
+    """
+    The locations, one superadmin, `admins_per_location` admins per location (the first
+    one assigned to it) and `clients` clients spread over the locations by LOCATION_WEIGHTS.
+    Returns the superadmin and {location id: {'admins': [ids], 'clients': [ids]}}.
+    """
+    if User.objects.filter(username__startswith=f'{prefix}-').exists():
+        raise ValueError(f"Users named {prefix}-* already exist; pick another prefix")
+
+    locations = [Location.objects.get_or_create(name=state)[0] for state in LOCATION_WEIGHTS]
+    superadmin = User.objects.create(
+        username=f'{prefix}-superadmin', role=User.Role.SUPERADMIN, password=password_hash,
+        is_staff=True,
+    )
+
+    def user(username, role, location):
+        # bulk_create skips User.save, so the legacy location name is set here
+        return User(
+            username=username, role=role, password=password_hash,
+            home_location=location, location=location.get_name_display(),
+        )
+
+    admins = User.objects.bulk_create([
+        user(f'{prefix}-{location.name.lower()}-admin{index}', User.Role.ADMIN, location)
+        for location in locations for index in range(admins_per_location)
+    ])
+    AdminLocation.objects.bulk_create(
+        AdminLocation(admin=admin, location_id=admin.home_location_id)
+        for admin in admins[::admins_per_location]
+    )
+
+    weights = list(accumulate(LOCATION_WEIGHTS.values()))
+    rng = random.Random(f'{prefix}:clients')
+    people = {location.id: {'admins': [], 'clients': []} for location in locations}
+    for admin in admins:
+        people[admin.home_location_id]['admins'].append(admin.id)
+
+    def client_rows():
+        for index in range(clients):
+            # Every location gets at least one client
+            location = locations[index] if index < len(locations) else rng.choices(locations, cum_weights=weights)[0]
+            yield user(f'{prefix}-client{index}', User.Role.CLIENT, location)
+
+    for batch in batched(client_rows(), batch_size):
+        for client in User.objects.bulk_create(batch):
+            people[client.home_location_id]['clients'].append(client.id)
+    return superadmin, people
+
+
+class ChunkWriter:
+    """Builds and writes the tasks and reports of one chunk of task ids"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.now = plan['now']
+        self.span = plan['days'] * 86400
+        self.location_ids = list(plan['people'])
+        self.location_names = dict(zip(self.location_ids, plan['location_names']))
+        self.location_weights = list(accumulate(
+            LOCATION_WEIGHTS[code] for code in plan['location_codes']
+        ))
+        self.client_weights = {
+            location_id: zipf_weights(len(people['clients']))
+            for location_id, people in plan['people'].items()
+        }
+        self.cluster_weights = zipf_weights(CLUSTERS_PER_LOCATION)
+        self.engineer_weights = zipf_weights(ENGINEERS_PER_LOCATION)
+        self.service_type_weights = list(accumulate(SERVICE_TYPE_WEIGHTS))
+
+    def __call__(self, chunk):
+        plan = self.plan
+        first_id = plan['first_task_id'] + chunk * plan['batch_size']
+        count = min(plan['batch_size'], plan['tasks'] - chunk * plan['batch_size'])
+        rng = random.Random(f"{plan['seed']}:{chunk}")
+        tasks = [self.task(rng, task_id) for task_id in range(first_id, first_id + count)]
+        reports = [report for task in tasks for report in self.reports(rng, task)]
+        with transaction.atomic():
+            insert_rows(Task, tasks)
+            insert_rows(TaskReport, reports)
+        return len(tasks), len(reports)
+
+    def task(self, rng, task_id):
+        location_id = rng.choices(self.location_ids, cum_weights=self.location_weights)[0]
+        people = self.plan['people'][location_id]
+        name = self.location_names[location_id]
+        # Skewed towards recent tasks
+        created_at = self.now - timedelta(seconds=self.span * rng.random() ** 2)
+        deadline = created_at + timedelta(days=min(rng.lognormvariate(1.9, 0.6), 90))
+        weights = OPEN_STATUS_WEIGHTS if deadline > self.now else PAST_STATUS_WEIGHTS
+        status = rng.choices(list(weights), list(weights.values()))[0]
+        completed_at = None
+        if status in DONE_STATUSES:
+            # Most tasks finish before their deadline, some run late
+            completed_at = min(self.now, created_at + (deadline - created_at) * rng.uniform(0.2, 1.3))
+
+        count = rng.choices(*SERVICE_TYPE_COUNTS)[0]
+        service_types = []
+        while len(service_types) < count:
+            service_type = rng.choices(SERVICE_TYPES, cum_weights=self.service_type_weights)[0]
+            if service_type not in service_types:
+                service_types.append(service_type)
+
+        cluster = rng.choices(range(CLUSTERS_PER_LOCATION), cum_weights=self.cluster_weights)[0]
+        engineer = rng.choices(range(ENGINEERS_PER_LOCATION), cum_weights=self.engineer_weights)[0]
+        return dict(
+            id=task_id,
+            title=f'{service_types[0]} #{task_id}',
+            description=rng.choice(DESCRIPTIONS),
+            location_id=location_id,
+            # Tasks are created in groups of a few dozen
+            group_id=f'GRP-{task_id // 25:07d}',
+            site_name=f'{name} site {rng.randrange(SITES_PER_LOCATION)}',
+            cluster=f'{name} cluster {cluster}',
+            service_engineer_name=f'{name} engineer {engineer}',
+            service_type=service_types,
+            assigned_by_id=rng.choice(people['admins']),
+            assigned_to_id=rng.choices(people['clients'], cum_weights=self.client_weights[location_id])[0],
+            created_at=created_at,
+            updated_at=completed_at or created_at,
+            deadline=deadline,
+            completed_at=completed_at,
+            status=status,
+            # bulk_create skips Task.save, which sets the flag
+            overdue=deadline < self.now and status not in Task.DONE_STATUSES,
+        )
+
+    def reports(self, rng, task):
+        """Completed tasks have a report (rejected ones sometimes two), a few open ones too"""
+        if task['status'] in DONE_STATUSES:
+            count = 2 if task['status'] == Task.Status.REJECTED and rng.random() < 0.4 else 1
+            submitted_at = task['completed_at']
+        elif task['status'] == Task.Status.IN_PROGRESS and rng.random() < 0.2:
+            count = 1
+            submitted_at = task['created_at'] + (self.now - task['created_at']) * rng.random()
+        else:
+            return
+        for index in range(count):
+            reviewed_at = None
+            if task['status'] in (Task.Status.APPROVED, Task.Status.REJECTED):
+                reviewed_at = min(self.now, submitted_at + timedelta(hours=rng.lognormvariate(2.5, 1.0)))
+            last = index == count - 1
+            rejected = task['status'] == Task.Status.REJECTED or not last
+            yield dict(
+                task_id=task['id'],
+                submitted_by_id=task['assigned_to_id'],
+                report_text=rng.choice(REPORT_TEXTS),
+                submitted_at=submitted_at,
+                updated_at=reviewed_at or submitted_at,
+                reviewed_by_id=task['assigned_by_id'] if reviewed_at else None,
+                reviewed_at=reviewed_at,
+                feedback=rng.choice(REJECTION_FEEDBACK) if reviewed_at and rejected else None,
+            )
+            if reviewed_at:
+                submitted_at = reviewed_at
+
+
+_worker_writer = None
+
+
+def _init_worker(plan):
+    global _worker_writer
+    import django
+    django.setup()
+    _worker_writer = ChunkWriter(plan)
+
+
+def _write_worker_chunk(chunk):
+    return _worker_writer(chunk)
+
+
+def generate_load_data(tasks, clients=None, admins_per_location=2, seed=0, workers=1,
+                       batch_size=5000, days=365, password='password', prefix='load', progress=None):
+    """
+    Create `clients` clients (default tasks / 50), admins and `tasks` tasks with their
+    reports, in `workers` processes. `progress(tasks_written, reports_written)` is called
+    after every chunk. Returns the superadmin, the people per location and the row counts.
+    """
+    if clients is None:
+        clients = max(len(LOCATION_WEIGHTS), tasks // 50)
+    if clients < len(LOCATION_WEIGHTS):
+        raise ValueError(f"Need at least {len(LOCATION_WEIGHTS)} clients, one per location")
+    if workers > 1 and connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        raise ValueError("An in-memory SQLite database cannot be shared with worker processes")
+
+    password_hash = make_password(password)
+    superadmin, people = create_users(prefix, clients, admins_per_location, password_hash, batch_size)
+    locations = Location.objects.in_bulk(list(people))
+    plan = {
+        'tasks': tasks,
+        'seed': seed,
+        'batch_size': batch_size,
+        'days': days,
+        'now': timezone.now(),
+        'first_task_id': (Task.objects.aggregate(last=Max('id'))['last'] or 0) + 1,
+        'people': people,
+        'location_codes': [locations[location_id].name for location_id in people],
+        'location_names': [str(locations[location_id].get_name_display()) for location_id in people],
+    }
+    chunks = range(-(-tasks // batch_size))
+    totals = [0, 0]
+
+    def done(counts):
+        totals[0] += counts[0]
+        totals[1] += counts[1]
+        if progress:
+            progress(*totals)
+
+    start = time.perf_counter()
+    if workers > 1:
+        # Children open their own database connections
+        connections.close_all()
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(method)
+        with context.Pool(workers, initializer=_init_worker, initargs=(plan,)) as pool:
+            for counts in pool.imap_unordered(_write_worker_chunk, chunks):
+                done(counts)
+    else:
+        writer = ChunkWriter(plan)
+        for chunk in chunks:
+            done(writer(chunk))
+
+    # Explicit ids leave the PostgreSQL sequences behind
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Task, TaskReport]):
+            cursor.execute(sql)
+    # bulk_create bypasses Task.save and its stats counters
+    call_command('rebuild_task_stats', stdout=io.StringIO())
+    return {
+        'superadmin': superadmin,
+        'people': people,
+        'users': 1 + clients + admins_per_location * len(people),
+        'tasks': totals[0],
+        'reports': totals[1],
+        'seconds': time.perf_counter() - start,
+    }
@@ -1,3 +1,1384 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import logging
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from accounts import dashboard_cache, urls as accounts_urls
+from PIL import Image
+
+from accounts.locations import location_registry
+from accounts.models import User, Location, AdminLocation
+from adminportal.asgi import application
+from adminportal.metrics import registry
+from . import urls as tasks_urls
+from . import jobqueue, metrics
+from .events import ALL, EventBroker, DatabaseEventBroker, broker
+from .jobqueue import job, enqueue, enqueue_on_commit, HIGH, LOW
+from .models import Task, TaskReport, LocationTaskStats, ClientTaskStats, LocationDailyTaskStats, Job, PublishedEvent
+from .overdue import sweep_overdue
+from .pagination import TaskPagination
+from .sockets import CLOSE_TRY_AGAIN_LATER, CLOSE_UNAUTHENTICATED
+
+
+def setUpModule():
+    # Keep the line logged per request out of the test output (assertLogs still captures it)
+    logger = logging.getLogger('adminportal.middleware')
+    handlers, logger.handlers = logger.handlers, [logging.NullHandler()]
+    unittest.addModuleCleanup(setattr, logger, 'handlers', handlers)
+
+
+class TaskFixturesMixin:
+    """Shared users, locations and a task factory for the task tests"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.location = Location.objects.create(name=Location.StateName.TAMIL_NADU)
+        cls.other_location = Location.objects.create(name=Location.StateName.ODISHA)
+        cls.superadmin = User.objects.create(username='superadmin', role=User.Role.SUPERADMIN)
+        cls.admin = User.objects.create(username='tnadmin', role=User.Role.ADMIN, location='Tamil Nadu')
+        AdminLocation.objects.create(admin=cls.admin, location=cls.location)
+        cls.client_user = User.objects.create(username='tnclient1', role=User.Role.CLIENT, location='Tamil Nadu')
+
+    def create_task(self, **kwargs):
+        values = {
+            'title': 'Inspect site',
+            'description': 'Routine inspection',
+            'location': self.location,
+            'assigned_by': self.admin,
+            'assigned_to': self.client_user,
+            'deadline': timezone.now() + timedelta(days=3),
+        }
+        values.update(kwargs)
+        return Task.objects.create(**values)
+
+
+class TaskStatsTest(TaskFixturesMixin, TestCase):
+    """The materialized task stats follow every Task write"""
+
+    def location_stats(self, location=None):
+        return LocationTaskStats.objects.get(location=location or self.location)
+
+    def client_stats(self):
+        return ClientTaskStats.objects.get(client=self.client_user)
+
+    def test_create_counts_task(self):
+        self.create_task()
+        self.create_task(status=Task.Status.COMPLETED)
+
+        stats = self.location_stats()
+        self.assertEqual((stats.pending, stats.completed, stats.total), (1, 1, 2))
+        self.assertEqual(self.client_stats().total, 2)
+
+    def test_status_and_location_changes_move_the_task(self):
+        task = self.create_task()
+        task.status = Task.Status.IN_PROGRESS
+        task.save()
+        self.assertEqual((self.location_stats().pending, self.location_stats().in_progress), (0, 1))
+
+        task.location = self.other_location
+        task.save()
+        self.assertEqual(self.location_stats().total, 0)
+        self.assertEqual(self.location_stats(self.other_location).in_progress, 1)
+        self.assertEqual(self.client_stats().in_progress, 1)
+
+    def test_saving_a_freshly_loaded_task_keeps_counts(self):
+        task = self.create_task()
+        Task.objects.get(pk=task.pk).save()
+        self.assertEqual(self.location_stats().pending, 1)
+
+    def test_saves_from_stale_copies_move_the_task_once(self):
+        task = self.create_task()
+        first, second = Task.objects.get(pk=task.pk), Task.objects.get(pk=task.pk)
+        first.status = Task.Status.IN_PROGRESS
+        first.save()
+        # Loaded while the task was still pending
+        second.status = Task.Status.COMPLETED
+        second.save()
+
+        stats = self.location_stats()
+        self.assertEqual((stats.pending, stats.in_progress, stats.completed, stats.total), (0, 0, 1, 1))
+
+    def test_delete_removes_task(self):
+        task = self.create_task()
+        task.delete()
+        self.assertEqual(self.location_stats().total, 0)
+        self.assertEqual(self.client_stats().total, 0)
+
+    def test_status_actions_update_stats(self):
+        task = self.create_task()
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+
+        api.post(f'/api/tasks/{task.id}/mark_in_progress/')
+        self.assertEqual(self.client_stats().in_progress, 1)
+        api.post(f'/api/tasks/{task.id}/mark_completed/')
+        self.assertEqual(self.client_stats().completed, 1)
+
+        api.force_authenticate(self.admin)
+        api.post(f'/api/tasks/{task.id}/approve_task/')
+        stats = self.client_stats()
+        self.assertEqual((stats.completed, stats.approved, stats.total), (0, 1, 1))
+
+    def test_rebuild_task_stats_fixes_drift(self):
+        self.create_task()
+        Task.objects.update(status=Task.Status.REJECTED)  # Bypasses Task.save
+
+        out = StringIO()
+        call_command('rebuild_task_stats', stdout=out)
+
+        self.assertIn('pending 1 -> 0', out.getvalue())
+        stats = self.location_stats()
+        self.assertEqual((stats.pending, stats.rejected), (0, 1))
+
+        out = StringIO()
+        call_command('rebuild_task_stats', stdout=out)
+        self.assertIn('in sync', out.getvalue())
+
+
+class ExplainHotQueriesTest(TaskFixturesMixin, TestCase):
+    """explain_hot_queries prints a plan for each hot query"""
+
+    def test_prints_plans(self):
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertIn('== task list (admin)', out.getvalue())
+        self.assertIn('== client dashboard: upcoming deadlines', out.getvalue())
+
+    def test_only_filters_queries(self):
+        out = StringIO()
+        call_command('explain_hot_queries', only='client dashboard', stdout=out)
+        self.assertNotIn('task list', out.getvalue())
+
+
+class ConditionalGetTest(TaskFixturesMixin, TestCase):
+    """List and retrieve answer If-None-Match with 304 before serializing"""
+
+    def setUp(self):
+        self.task = self.create_task()
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_list_not_modified(self):
+        response = self.api.get('/api/tasks/')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_changes_on_write(self):
+        etag = self.api.get('/api/tasks/')['ETag']
+        self.task.status = Task.Status.IN_PROGRESS
+        self.task.save()
+        self.assertEqual(self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_etag_follows_the_overdue_sweep(self):
+        etag = self.api.get('/api/tasks/')['ETag']
+        sweep_overdue(now=timezone.now() + timedelta(days=7))
+        response = self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_overdue'])
+
+    def test_etag_ignores_writes_to_other_rows(self):
+        etag = self.api.get('/api/tasks/')['ETag']
+        self.create_task(location=Location.objects.create(name=Location.StateName.TELANGANA))
+        self.assertEqual(self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_list_etag_changes_on_delete_and_create_in_the_same_second(self):
+        kept = self.create_task()
+        etag = self.api.get('/api/tasks/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.delete()
+            created = self.create_task()
+        # Same row count and max updated_at as before
+        Task.objects.filter(pk=created.pk).update(updated_at=kept.updated_at)
+        self.assertEqual(self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_retrieve_etag_follows_reports(self):
+        url = f'/api/tasks/{self.task.id}/'
+        etag = self.api.get(url)['ETag']
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        TaskReport.objects.create(task=self.task, submitted_by=self.client_user, report_text='Done')
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_report_list_not_modified(self):
+        TaskReport.objects.create(task=self.task, submitted_by=self.client_user, report_text='Done')
+        etag = self.api.get('/api/task-reports/')['ETag']
+        self.assertEqual(self.api.get('/api/task-reports/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_etag_is_per_user(self):
+        etag = self.api.get('/api/tasks/')['ETag']
+        self.api.force_authenticate(self.superadmin)
+        self.assertEqual(self.api.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_retrieve_outside_scope_is_404(self):
+        self.api.force_authenticate(User.objects.create(username='other', role=User.Role.CLIENT))
+        self.assertEqual(self.api.get(f'/api/tasks/{self.task.id}/').status_code, 404)
+
+
+class QueryBudgetTest(TaskFixturesMixin, TestCase):
+    """
+    Every list/retrieve endpoint in accounts/urls.py and tasks/urls.py stays within a
+    fixed query budget, and the number of queries does not grow with the number of rows.
+    """
+    # Budgets as seen by a SuperAdmin: pagination COUNT, validators aggregate, rows, prefetches
+    QUERY_BUDGETS = {
+        'user-list': 2,
+        'user-detail': 1,
+        'location-list': 2,
+        'location-detail': 1,
+        'adminlocation-list': 2,
+        'adminlocation-detail': 1,
+        'task-list': 3,
+        'task-detail': 3,
+        'taskreport-list': 3,
+        'taskreport-detail': 2,
+    }
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.superadmin)
+
+    def add_rows(self, count):
+        for index in range(count):
+            client = User.objects.create(username=f'client-{count}-{index}', role=User.Role.CLIENT)
+            admin = User.objects.create(username=f'admin-{count}-{index}', role=User.Role.ADMIN)
+            AdminLocation.objects.create(admin=admin, location=self.location)
+            task = self.create_task(assigned_to=client, assigned_by=admin)
+            for _ in range(2):
+                TaskReport.objects.create(task=task, submitted_by=client, reviewed_by=admin, report_text='Done')
+
+    def get_endpoints(self):
+        """Yield (url name, url) for the list and retrieve routes of every registered viewset"""
+        objects = {
+            'user': self.client_user,
+            'location': self.location,
+            'adminlocation': AdminLocation.objects.first(),
+            'task': Task.objects.first(),
+            'taskreport': TaskReport.objects.first(),
+        }
+        for router in (accounts_urls.router, tasks_urls.router):
+            for _, viewset, basename in router.registry:
+                yield f'{basename}-list', reverse(f'{basename}-list')
+                yield f'{basename}-detail', reverse(f'{basename}-detail', args=[objects[basename].pk])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(queries)
+
+    def test_endpoints_stay_within_budget(self):
+        self.add_rows(1)
+        baseline = {name: self.count_queries(url) for name, url in self.get_endpoints()}
+        self.assertEqual(set(baseline), set(self.QUERY_BUDGETS))
+
+        self.add_rows(9)
+        for name, url in self.get_endpoints():
+            with self.subTest(endpoint=name):
+                queries = self.count_queries(url)
+                self.assertLessEqual(queries, self.QUERY_BUDGETS[name])
+                self.assertEqual(queries, baseline[name])
+
+
+class KeysetPaginationTest(TaskFixturesMixin, TestCase):
+    """?cursor= switches task and report listings to keyset pagination"""
+
+    def setUp(self):
+        self.tasks = [self.create_task(title=f'Task {index}') for index in range(25)]
+        # Equal created_at values exercise the id tiebreaker
+        Task.objects.filter(id__in=[task.id for task in self.tasks[:5]]).update(created_at=timezone.now())
+        self.api = APIClient()
+        self.api.force_authenticate(self.superadmin)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(task['id'] for task in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walks_every_task_once_in_model_order(self):
+        ids = self.walk('/api/tasks/?cursor=')
+        expected = list(Task.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_new_tasks_do_not_shift_pages(self):
+        first_page = self.api.get('/api/tasks/?cursor=')
+        self.create_task(title='Inserted while paging')
+        second_page = self.api.get(first_page.data['next'])
+
+        seen = [task['id'] for task in first_page.data['results'] + second_page.data['results']]
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(seen, [task.id for task in Task.objects.order_by('-created_at', '-id')[1:21]])
+
+    def test_previous_link_returns_to_prior_page(self):
+        first_page = self.api.get('/api/tasks/?cursor=')
+        self.assertIsNone(first_page.data['previous'])
+        second_page = self.api.get(first_page.data['next'])
+        back = self.api.get(second_page.data['previous'])
+        self.assertEqual(back.data['results'], first_page.data['results'])
+
+    def test_page_size_is_capped(self):
+        response = self.api.get('/api/tasks/?cursor=&page_size=5')
+        self.assertEqual(len(response.data['results']), 5)
+        with mock.patch.object(TaskPagination, 'max_page_size', 20):
+            response = self.api.get('/api/tasks/?cursor=&page_size=100000')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.api.get('/api/tasks/?cursor=not-a-cursor').status_code, 404)
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.api.get('/api/tasks/?page=2')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_reports_use_submitted_at_ordering(self):
+        for task in self.tasks[:3]:
+            TaskReport.objects.create(task=task, submitted_by=self.client_user, report_text='Done')
+        response = self.api.get('/api/task-reports/?cursor=&page_size=2')
+        expected = list(TaskReport.objects.order_by('-submitted_at', '-id').values_list('id', flat=True))
+        ids = [report['id'] for report in response.data['results']]
+        ids += [report['id'] for report in self.api.get(response.data['next']).data['results']]
+        self.assertEqual(ids, expected)
+
+
+class BulkTaskTest(TaskFixturesMixin, TestCase):
+    """Bulk creation and bulk status transitions"""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def task_payload(self, **kwargs):
+        payload = {
+            'title': 'Bulk task',
+            'description': 'Created in bulk',
+            'location': self.location.id,
+            'assigned_to': self.client_user.id,
+            'deadline': (timezone.now() + timedelta(days=2)).isoformat(),
+            'group_id': 'G-1',
+        }
+        payload.update(kwargs)
+        return payload
+
+    def test_bulk_create_does_not_query_per_item(self):
+        self.api.post('/api/tasks/bulk/', [self.task_payload()] * 2, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post('/api/tasks/bulk/', [self.task_payload()] * 200, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 200)
+        # Preloading, the INSERT chunks and one stats UPDATE per counter row
+        self.assertLess(len(queries), 20)
+        self.assertEqual(Task.objects.filter(assigned_by=self.admin).count(), 202)
+        self.assertEqual(LocationTaskStats.objects.get(location=self.location).pending, 202)
+
+    def test_bulk_create_reports_item_errors(self):
+        items = [
+            self.task_payload(),
+            self.task_payload(assigned_to=self.admin.id),
+            self.task_payload(location=self.other_location.id),
+            self.task_payload(title=''),
+        ]
+        response = self.api.post('/api/tasks/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertIn('assigned_to', response.data['errors'][0]['errors'])
+        self.assertIn('location', response.data['errors'][1]['errors'])
+        self.assertFalse(Task.objects.exists())
+
+        response = self.api.post('/api/tasks/bulk/', {'tasks': items, 'allow_partial': True}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(len(response.data['errors']), 3)
+
+    def test_bulk_create_requires_admin(self):
+        self.api.force_authenticate(self.client_user)
+        response = self.api.post('/api/tasks/bulk/', [self.task_payload()], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_transition(self):
+        completed = [self.create_task(status=Task.Status.COMPLETED) for _ in range(3)]
+        pending = self.create_task()
+        outside = self.create_task(location=self.other_location, status=Task.Status.COMPLETED)
+        ids = [task.id for task in completed] + [pending.id, outside.id, 'x']
+
+        response = self.api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': ids}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        details = {error['id']: error['detail'] for error in response.data['errors']}
+        self.assertEqual(details, {
+            pending.id: 'Task is not completed yet.',
+            outside.id: 'Not found.',
+            'x': 'Invalid id.',
+        })
+        self.assertEqual(Task.objects.filter(status=Task.Status.APPROVED).count(), 3)
+        stats = LocationTaskStats.objects.get(location=self.location)
+        self.assertEqual((stats.completed, stats.approved, stats.pending), (0, 3, 1))
+
+    def test_bulk_transition_checks_client_ownership(self):
+        own = self.create_task()
+        other_client = User.objects.create(username='tnclient2', role=User.Role.CLIENT)
+        self.api.force_authenticate(self.client_user)
+
+        response = self.api.post('/api/tasks/bulk_transition/', {'action': 'mark_completed', 'ids': [own.id]}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        own.refresh_from_db()
+        self.assertIsNotNone(own.completed_at)
+
+        self.api.force_authenticate(other_client)
+        response = self.api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': [own.id]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportTest(TaskFixturesMixin, TestCase):
+    """Task and report exports stream every visible row in a single query"""
+
+    def setUp(self):
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def stream(self, url):
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_task_csv_respects_location_scope(self):
+        task = self.create_task(group_id='G1', site_name='Site A', service_type=['AC', 'DC'])
+        TaskReport.objects.create(task=task, submitted_by=self.client_user, report_text='Done')
+        self.create_task(location=self.other_location)
+
+        response = self.api.get('/api/tasks/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['id'] for row in rows], [str(task.id)])
+        self.assertEqual(rows[0]['site_name'], 'Site A')
+        self.assertEqual(rows[0]['service_type'], 'AC; DC')
+        self.assertEqual((rows[0]['report_count'], rows[0]['unreviewed_report_count']), ('1', '1'))
+
+    def test_task_ndjson_filters(self):
+        self.create_task(group_id='G1', status=Task.Status.COMPLETED)
+        self.create_task(group_id='G1')
+        self.create_task(group_id='G2', status=Task.Status.COMPLETED)
+        old = self.create_task(group_id='G1', status=Task.Status.COMPLETED)
+        Task.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+        date_from = (timezone.now() - timedelta(days=1)).date().isoformat()
+        content = self.stream(f'/api/tasks/export/?output=ndjson&status=COMPLETED&group_id=G1&date_from={date_from}')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['group_id'], rows[0]['status']), ('G1', 'COMPLETED'))
+
+    def test_report_export_includes_review_state(self):
+        task = self.create_task()
+        TaskReport.objects.create(task=task, submitted_by=self.client_user, report_text='Done',
+                                  reviewed_by=self.admin, reviewed_at=timezone.now(), feedback='Good')
+        self.api.force_authenticate(self.client_user)
+        rows = list(csv.DictReader(StringIO(self.stream('/api/task-reports/export/'))))
+        self.assertEqual((rows[0]['reviewed_by'], rows[0]['feedback']), ('tnadmin', 'Good'))
+
+    def test_export_is_one_query(self):
+        for _ in range(5):
+            self.create_task()
+        response = self.api.get('/api/tasks/export/?output=ndjson')
+        with CaptureQueriesContext(connection) as queries:
+            content = b''.join(response.streaming_content)
+        self.assertEqual(len(content.splitlines()), 5)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(ROOT_URLCONF='adminportal.urls_asgi', EXPORT_CHUNK_SIZE=2)
+    async def test_asgi_exports_stream_from_the_async_orm(self):
+        tasks = [await sync_to_async(self.create_task)(title=f'Task {index}') for index in range(5)]
+        await TaskReport.objects.acreate(task=tasks[0], submitted_by=self.client_user, report_text='Done')
+        token = await Token.objects.acreate(user=self.admin)
+        headers = {'Authorization': f'Token {token.key}'}
+
+        response = await self.async_client.get('/api/tasks/export/?output=ndjson', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        # An async generator, which the ASGI handler sends chunk by chunk instead of reading into a list
+        self.assertTrue(response.is_async)
+        rows = [json.loads(chunk) async for chunk in response.streaming_content]
+        self.assertEqual([row['id'] for row in rows], [task.id for task in reversed(tasks)])
+
+        # The report export is a sync view, run in a thread under ASGI
+        response = await self.async_client.get('/api/task-reports/export/', headers=headers)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([row['task_id'] for row in csv.DictReader(StringIO(content))], [str(tasks[0].id)])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.api.get('/api/tasks/export/?output=xml').status_code, 400)
+        self.assertEqual(self.api.get('/api/tasks/export/?status=DONE').status_code, 400)
+        self.assertEqual(self.api.get('/api/tasks/export/?date_to=yesterday').status_code, 400)
+
+
+@override_settings(METRICS_TOKEN='scrape-secret')
+class WorkflowMetricsTest(TaskFixturesMixin, TestCase):
+    """The task actions feed the Prometheus metrics served on /metrics"""
+
+    def setUp(self):
+        registry.reset()
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def scrape(self):
+        response = self.api.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_task_lifecycle(self):
+        response = self.api.post('/api/tasks/', {
+            'title': 'Inspect site', 'description': 'Routine inspection', 'location': self.location.id,
+            'assigned_by': self.admin.id, 'assigned_to': self.client_user.id,
+            'deadline': timezone.now() + timedelta(days=3),
+        }, format='json')
+        task_id = response.data['id']
+        self.api.force_authenticate(self.client_user)
+        self.api.post(f'/api/tasks/{task_id}/mark_completed/')
+        report = TaskReport.objects.create(task_id=task_id, submitted_by=self.client_user, report_text='Done')
+        self.api.force_authenticate(self.admin)
+        self.api.post(f'/api/task-reports/{report.id}/review_report/', {'approved': True}, format='json')
+
+        samples = self.scrape()
+        self.assertEqual(samples['tasks_created_total{location="TAMIL_NADU"}'], 1)
+        self.assertEqual(samples['task_transitions_total{location="TAMIL_NADU",status="COMPLETED"}'], 1)
+        self.assertEqual(samples['task_transitions_total{location="TAMIL_NADU",status="APPROVED"}'], 1)
+        self.assertEqual(samples['task_completion_seconds_bucket{location="TAMIL_NADU",le="3600.0"}'], 1)
+        self.assertEqual(samples['report_review_lag_seconds_count{location="TAMIL_NADU"}'], 1)
+        self.assertGreater(samples['http_requests_total{route="task-list",method="POST",status="201"}'], 0)
+
+    def test_bulk_actions(self):
+        ids = [self.create_task(status=Task.Status.COMPLETED).id for _ in range(3)]
+        self.api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': ids}, format='json')
+        samples = self.scrape()
+        self.assertEqual(samples['task_transitions_total{location="TAMIL_NADU",status="APPROVED"}'], 3)
+
+    def test_bulk_actions_with_a_stale_location_registry(self):
+        location_registry.all()
+        # No signal, as when another worker created the location
+        (telangana,) = Location.objects.bulk_create([Location(name=Location.StateName.TELANGANA)])
+        ids = [self.create_task(location=telangana, status=Task.Status.COMPLETED).id]
+        self.api.force_authenticate(self.superadmin)
+        response = self.api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': ids}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        metrics.record_transitions([{'location_id': -1, 'created_at': None}], Task.Status.APPROVED)
+
+        samples = self.scrape()
+        self.assertEqual(samples['task_transitions_total{location="TELANGANA",status="APPROVED"}'], 1)
+        self.assertEqual(samples['task_transitions_total{location="unknown",status="APPROVED"}'], 1)
+
+    def test_overdue_gauge(self):
+        self.create_task(deadline=timezone.now() - timedelta(days=1))
+        self.create_task(deadline=timezone.now() - timedelta(days=1), status=Task.Status.APPROVED)
+        samples = self.scrape()
+        self.assertEqual(samples['tasks_overdue{location="TAMIL_NADU"}'], 1)
+        self.assertEqual(samples['tasks_overdue{location="ODISHA"}'], 0)
+
+    def test_token(self):
+        self.assertEqual(self.api.get('/metrics').status_code, 401)
+        self.assertEqual(self.api.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_hidden_without_a_token(self):
+        self.assertEqual(self.api.get('/metrics').status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.api.get('/metrics').status_code, 200)
+
+
+class AsyncTaskReadTest(TaskFixturesMixin, TestCase):
+    """Under ASGI the task list and detail are served by async views with the same responses"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.headers = {'Authorization': f'Token {Token.objects.create(user=cls.admin).key}'}
+
+    def setUp(self):
+        self.tasks = [self.create_task(title=f'Task {index}') for index in range(3)]
+        TaskReport.objects.create(task=self.tasks[0], submitted_by=self.client_user, report_text='Done')
+
+    async def async_get(self, path, **headers):
+        with self.settings(ROOT_URLCONF='adminportal.urls_asgi'):
+            return await self.async_client.get(path, headers={**self.headers, **headers})
+
+    async def assert_same_response(self, path):
+        sync_response = await sync_to_async(self.client.get)(path, headers=self.headers)
+        async_response = await self.async_get(path)
+        self.assertEqual(async_response.status_code, sync_response.status_code, path)
+        self.assertEqual(async_response.json(), sync_response.json(), path)
+        self.assertEqual(async_response.get('ETag'), sync_response.get('ETag'), path)
+        return async_response
+
+    def test_read_routes_are_async(self):
+        for path in ('/api/tasks/', f'/api/tasks/{self.tasks[0].id}/'):
+            self.assertTrue(iscoroutinefunction(resolve(path, urlconf='adminportal.urls_asgi').func))
+        self.assertFalse(iscoroutinefunction(resolve('/api/task-reports/', urlconf='adminportal.urls_asgi').func))
+        for path in ('/api/tasks/export/', '/api/tasks/bulk_transition/'):
+            self.assertEqual(
+                resolve(path, urlconf='adminportal.urls_asgi').url_name, resolve(path).url_name, path,
+            )
+
+    async def test_responses_match_the_sync_views(self):
+        await self.assert_same_response('/api/tasks/')
+        await self.assert_same_response('/api/tasks/?page=2&page_size=2')
+        await self.assert_same_response('/api/tasks/?page=last&page_size=2')
+        first_page = await self.assert_same_response('/api/tasks/?cursor=&page_size=2')
+        await self.assert_same_response(first_page.json()['next'].replace('http://testserver', ''))
+        detail = await self.assert_same_response(f'/api/tasks/{self.tasks[0].id}/')
+        self.assertEqual(len(detail.json()['reports']), 1)
+        for path in ('/api/tasks/?page=9', '/api/tasks/?page=0', '/api/tasks/?page=abc',
+                     '/api/tasks/?cursor=bogus', '/api/tasks/999999/', '/api/tasks/abc/'):
+            response = await self.assert_same_response(path)
+            self.assertEqual(response.status_code, 404, path)
+
+    async def test_not_modified(self):
+        response = await self.async_get('/api/tasks/')
+        self.assertEqual((await self.async_get('/api/tasks/', **{'If-None-Match': response['ETag']})).status_code, 304)
+
+    async def test_writes_keep_the_sync_handlers(self):
+        with self.settings(ROOT_URLCONF='adminportal.urls_asgi'):
+            response = await self.async_client.post('/api/tasks/', {
+                'title': 'New task', 'description': 'Created under ASGI', 'location': self.location.id,
+                'assigned_by': self.admin.id, 'assigned_to': self.client_user.id,
+                'deadline': (timezone.now() + timedelta(days=2)).isoformat(),
+            }, content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(await Task.objects.filter(title='New task').acount(), 1)
+
+
+def parse_events(chunk):
+    """(type, data, id) of each event in a chunk of an SSE stream, skipping comments"""
+    events = []
+    for block in chunk.decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], json.loads(fields['data']), fields.get('id')))
+    return events
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=0.05)
+class EventStreamTest(TaskFixturesMixin, TestCase):
+    """Task and report writes reach the live event streams of the users allowed to see them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.od_client = User.objects.create(username='odclient1', role=User.Role.CLIENT, location='Odisha')
+        cls.tokens = {
+            user.username: Token.objects.create(user=user).key
+            for user in (cls.superadmin, cls.admin, cls.client_user, cls.od_client)
+        }
+
+    async def open_stream(self, username, last_event_id=None):
+        headers = {'Authorization': f'Token {self.tokens[username]}', 'Accept': 'text/event-stream'}
+        if last_event_id:
+            headers['Last-Event-ID'] = last_event_id
+        response = await self.async_client.get('/api/events/stream/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 3000\n\n')
+        return stream
+
+    async def next_events(self, stream):
+        """The events of the next chunk that has any, skipping heartbeats"""
+        async def read():
+            while True:
+                events = parse_events(await anext(stream))
+                if events:
+                    return events
+        return await asyncio.wait_for(read(), timeout=2)
+
+    async def collect(self, stream, event_type, count):
+        """The next count events of event_type (any type when None)"""
+        events = []
+        while len(events) < count:
+            events += [
+                event for event in await self.next_events(stream) if event_type in (None, event[0])
+            ]
+        return events
+
+    async def write(self, func):
+        """Run a write and the events it publishes on commit"""
+        def run():
+            with self.captureOnCommitCallbacks(execute=True):
+                return func()
+        return await sync_to_async(run)()
+
+    async def test_events_are_scoped_to_role_and_location(self):
+        streams = {name: await self.open_stream(name) for name in ('superadmin', 'tnadmin', 'tnclient1', 'odclient1')}
+        task = await self.write(self.create_task)
+        for name in ('superadmin', 'tnadmin', 'tnclient1'):
+            [(event_type, data, _)] = await self.next_events(streams[name])
+            self.assertEqual((event_type, data['task_id'], data['assigned_to']), ('task.assigned', task.id, self.client_user.id))
+        self.assertEqual(await asyncio.wait_for(anext(streams['odclient1']), timeout=2), b': ping\n\n')
+        # A client disconnect cancels the read in progress, like ASGIHandler does
+        for stream in streams.values():
+            read = asyncio.ensure_future(anext(stream))
+            await asyncio.sleep(0)
+            read.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await read
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+    async def test_status_changes_and_reports(self):
+        stream = await self.open_stream('tnclient1')
+        task = await self.write(self.create_task)
+        await self.next_events(stream)
+
+        def complete_and_report():
+            task.status = Task.Status.COMPLETED
+            task.save()
+            report = TaskReport.objects.create(task=task, submitted_by=self.client_user, report_text='Done')
+            report = TaskReport.objects.select_related('task').get(id=report.id)
+            report.reviewed_by = self.admin
+            report.reviewed_at = timezone.now()
+            report.save()
+            report.save()  # Not reviewed again
+        await self.write(complete_and_report)
+        events = await self.collect(stream, None, 3)
+        self.assertEqual([event_type for event_type, _, _ in events], ['task.status', 'report.submitted', 'report.reviewed'])
+        self.assertEqual((events[0][1]['status'], events[0][1]['previous_status']), ('COMPLETED', 'PENDING'))
+
+    async def test_bulk_transition(self):
+        stream = await self.open_stream('tnadmin')
+        ids = await self.write(lambda: [self.create_task(status=Task.Status.COMPLETED).id for _ in range(2)])
+        await self.next_events(stream)
+
+        def approve():
+            api = APIClient()
+            api.force_authenticate(self.admin)
+            api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': ids}, format='json')
+        await self.write(approve)
+        events = await self.collect(stream, 'task.status', 2)
+        self.assertEqual(
+            sorted((data['task_id'], data['status']) for _, data, _ in events),
+            [(task_id, 'APPROVED') for task_id in sorted(ids)],
+        )
+
+    async def test_resume_from_last_event_id(self):
+        stream = await self.open_stream('tnclient1')
+        first = await self.write(self.create_task)
+        [(_, _, first_id)] = await self.next_events(stream)
+        await stream.aclose()
+        missed = await self.write(self.create_task)
+
+        resumed = await self.open_stream('tnclient1', last_event_id=first_id)
+        [(event_type, data, _)] = await self.next_events(resumed)
+        self.assertEqual((event_type, data['task_id']), ('task.assigned', missed.id))
+
+        reset = await self.open_stream('tnclient1', last_event_id='unknown-1')
+        [(event_type, _, event_id)] = await self.next_events(reset)
+        self.assertEqual((event_type, event_id), ('reset', f'{broker.stream_id}-{broker.seq}'))
+
+    async def test_slow_streams_are_dropped(self):
+        events = EventBroker(max_queued=2)
+        subscription, _ = events.subscribe(ALL)
+        for index in range(3):
+            events.publish('task.status', {'task_id': index})
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(await subscription.get(1), [])
+        events.unsubscribe(subscription)
+        self.assertEqual((events.stats()['subscribers'], events.stats()['overflows']), (0, 1))
+
+    def test_wsgi_is_refused(self):
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        self.assertEqual(api.get('/api/events/stream/').status_code, 501)
+
+
+class DatabaseEventBrokerTest(TaskFixturesMixin, TestCase):
+    """DatabaseEventBroker carries events between brokers, as between processes, through the database"""
+
+    async def test_events_reach_the_subscribers_of_another_broker(self):
+        # Each stands for the broker of one process
+        publisher, worker = DatabaseEventBroker(poll_interval=0), DatabaseEventBroker(poll_interval=0)
+        await sync_to_async(publisher.publish)('task.status', {'task_id': 0}, user_ids={self.client_user.id})
+        await sync_to_async(worker.start)()
+        everything, _ = worker.subscribe(ALL)
+        client, _ = worker.subscribe(('user', self.client_user.id))
+        other_client, _ = worker.subscribe(('user', self.admin.id))
+
+        deadline = timezone.now()
+        await sync_to_async(publisher.publish)(
+            'task.overdue', {'task_id': 1, 'deadline': deadline}, location_ids={self.location.id},
+            user_ids={self.client_user.id},
+        )
+        self.assertEqual(await sync_to_async(worker.poll)(), 1)
+        [event] = await client.get(1)
+        row = await PublishedEvent.objects.alatest('id')
+        self.assertEqual(event.id, f'db-{row.id}')
+        # Encoded as the in-process broker encodes it
+        self.assertIn(f'"deadline":{json.dumps(deadline, cls=DjangoJSONEncoder)}'.encode(), event.encoded)
+        self.assertEqual(await everything.get(1), [event])
+        # Rows from before the worker started are not replayed, and others' events not delivered
+        self.assertEqual(other_client.drain(), [])
+
+        # A stream reconnecting to yet another worker resumes from the rows it buffered
+        resumed_worker = DatabaseEventBroker(poll_interval=0)
+        await sync_to_async(resumed_worker.start)()
+        resumed_worker.seq = row.id - 1
+        await sync_to_async(resumed_worker.poll)()
+        resumed, backlog = resumed_worker.subscribe(('user', self.client_user.id), f'db-{row.id - 1}')
+        self.assertEqual([missed.id for missed in backlog], [event.id])
+        # Newer than this worker has polled: the poller brings them
+        ahead, backlog = resumed_worker.subscribe(ALL, f'db-{row.id + 5}')
+        self.assertEqual(backlog, [])
+        for subscription in (everything, client, other_client):
+            worker.unsubscribe(subscription)
+        for subscription in (resumed, ahead):
+            resumed_worker.unsubscribe(subscription)
+
+    def test_purge_drops_old_events(self):
+        events = DatabaseEventBroker(poll_interval=0)
+        events.publish('task.status', {'task_id': 1})
+        PublishedEvent.objects.update(created_at=timezone.now() - timedelta(hours=2))
+        events.publish('task.status', {'task_id': 2})
+        events.purge()
+        self.assertEqual([row.data for row in PublishedEvent.objects.all()], [{'task_id': 2}])
+
+
+class SocketConnection:
+    """One WebSocket connection to the ASGI application, with its ASGI messages in queues"""
+
+    def __init__(self, path='/ws/tasks/', query='', headers=()):
+        self.received = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.received.put_nowait({'type': 'websocket.connect'})
+        scope = {'type': 'websocket', 'path': path, 'query_string': query.encode(), 'headers': list(headers)}
+        self.task = asyncio.ensure_future(application(scope, self.received.get, self.sent.put))
+
+    async def next_message(self):
+        return await asyncio.wait_for(self.sent.get(), timeout=2)
+
+    async def next_events(self):
+        """The events of the next message that has any, skipping keep-alives"""
+        while True:
+            message = await self.next_message()
+            events = json.loads(message['text']).get('events')
+            if events:
+                return events
+
+    async def disconnect(self):
+        self.received.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.task, timeout=2)
+
+
+@override_settings(EVENTS_HEARTBEAT_SECONDS=0.05, WEBSOCKET_BATCH_DELAY=0.01)
+class TaskSocketTest(TaskFixturesMixin, TestCase):
+    """The task WebSocket pushes a client's assignments and report reviews"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.token = Token.objects.create(user=cls.client_user).key
+
+    async def connect(self, query=''):
+        socket = SocketConnection(query=f'token={self.token}&{query}')
+        self.assertEqual(await socket.next_message(), {'type': 'websocket.accept'})
+        return socket
+
+    async def write(self, func):
+        def run():
+            with self.captureOnCommitCallbacks(execute=True):
+                return func()
+        return await sync_to_async(run)()
+
+    async def test_assignments_and_reviews_are_pushed(self):
+        socket = SocketConnection(headers=[(b'authorization', f'Token {self.token}'.encode())])
+        self.assertEqual(await socket.next_message(), {'type': 'websocket.accept'})
+        task = await self.write(self.create_task)
+        [event] = await socket.next_events()
+        self.assertEqual((event['type'], event['data']['task_id']), ('task.assigned', task.id))
+
+        def complete_and_review():
+            task.status = Task.Status.COMPLETED
+            task.save()
+            report = TaskReport.objects.create(task=task, submitted_by=self.client_user, report_text='Done')
+            report.reviewed_by = self.admin
+            report.reviewed_at = timezone.now()
+            report.save()
+            return report
+        report = await self.write(complete_and_review)
+        # The status change and the submission are not pushed
+        [event] = await socket.next_events()
+        self.assertEqual((event['type'], event['data']['report_id']), ('report.reviewed', report.id))
+
+        await socket.disconnect()
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+    async def test_unauthenticated_and_unknown_paths_are_refused(self):
+        socket = SocketConnection(query='token=wrong')
+        self.assertEqual(await socket.next_message(), {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        socket = SocketConnection()
+        self.assertEqual(await socket.next_message(), {'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+        socket = SocketConnection(path='/ws/other/', query=f'token={self.token}')
+        self.assertEqual(await socket.next_message(), {'type': 'websocket.close'})
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+    @override_settings(WEBSOCKET_BATCH_SIZE=2, EVENTS_QUEUE_SIZE=4)
+    async def test_bursts_are_batched_and_slow_sockets_closed(self):
+        socket = await self.connect()
+        for index in range(3):
+            broker.publish('task.assigned', {'task_id': index}, user_ids={self.client_user.id})
+        self.assertEqual([event['data']['task_id'] for event in await socket.next_events()], [0, 1])
+        self.assertEqual([event['data']['task_id'] for event in await socket.next_events()], [2])
+
+        for index in range(5):
+            broker.publish('task.assigned', {'task_id': index}, user_ids={self.client_user.id})
+        message = await socket.next_message()
+        while message['type'] == 'websocket.send':
+            message = await socket.next_message()
+        self.assertEqual((message['type'], message['code']), ('websocket.close', CLOSE_TRY_AGAIN_LATER))
+        await socket.disconnect()
+        self.assertEqual(broker.stats()['subscribers'], 0)
+
+    async def test_resume_from_last_event_id(self):
+        socket = await self.connect()
+        await self.write(self.create_task)
+        [first] = await socket.next_events()
+        await socket.disconnect()
+        missed = await self.write(self.create_task)
+        # Not one of the socket's event types
+        broker.publish('task.status', {'task_id': missed.id}, user_ids={self.client_user.id})
+
+        socket = await self.connect(f'last_event_id={first["id"]}')
+        [event] = await socket.next_events()
+        self.assertEqual((event['type'], event['data']['task_id']), ('task.assigned', missed.id))
+        await socket.disconnect()
+
+        socket = await self.connect('last_event_id=unknown-1')
+        self.assertEqual(json.loads((await socket.next_message())['text']), {'reset': f'{broker.stream_id}-{broker.seq}'})
+        await socket.disconnect()
+
+
+class GenerateLoadDataTest(TestCase):
+    """generate_load_data writes consistent, reproducible synthetic data"""
+
+    def generate(self, **options):
+        out = StringIO()
+        call_command('generate_load_data', tasks=300, clients=20, workers=1, batch_size=100, stdout=out, **options)
+        return out.getvalue()
+
+    def test_generates_rows(self):
+        output = self.generate()
+        self.assertIn('300 tasks', output)
+        self.assertEqual(Task.objects.count(), 300)
+        self.assertEqual(User.objects.filter(role=User.Role.CLIENT).count(), 20)
+        self.assertEqual(AdminLocation.objects.count(), 4)
+        self.assertGreater(TaskReport.objects.count(), 0)
+        # One password hash for everyone, and it works
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        self.assertTrue(User.objects.get(username='load-client0').check_password('password'))
+
+        # Tasks belong to their location's admins and clients, with history in the past
+        self.assertFalse(Task.objects.exclude(assigned_to__home_location=F('location')).exists())
+        self.assertFalse(Task.objects.exclude(assigned_by__home_location=F('location')).exists())
+        self.assertFalse(Task.objects.filter(created_at__gt=timezone.now()).exists())
+        self.assertFalse(Task.objects.filter(status=Task.Status.APPROVED, completed_at__isnull=True).exists())
+        self.assertEqual(
+            set(Task.objects.filter(overdue=True).values_list('id', flat=True)),
+            {task.id for task in Task.objects.all() if task.is_overdue()},
+        )
+        self.assertFalse(TaskReport.objects.exclude(submitted_by=F('task__assigned_to')).exists())
+
+        out = StringIO()
+        call_command('rebuild_task_stats', dry_run=True, stdout=out)
+        self.assertIn('in sync', out.getvalue())
+
+    def test_seed_is_reproducible(self):
+        self.generate(seed=7)
+        first = list(Task.objects.order_by('id').values_list('status', 'location__name', 'cluster', 'service_type'))
+        self.generate(seed=7, prefix='again')
+        second = list(Task.objects.order_by('id').values_list('status', 'location__name', 'cluster', 'service_type'))
+        self.assertEqual(first, second[:300])
+        self.assertEqual(first, second[300:])
+
+    def test_prefix_in_use(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+recorded_calls = []
+
+
+@job(name='tests.record')
+def record_call(value):
+    recorded_calls.append(value)
+
+
+@job(name='tests.fail', max_attempts=2)
+def always_fail():
+    raise RuntimeError('Upstream unavailable')
+
+
+class JobQueueTest(TaskFixturesMixin, TestCase):
+    """Background jobs are queued after the commit, claimed by priority and retried with backoff"""
+
+    def setUp(self):
+        recorded_calls.clear()
+
+    def test_enqueue_waits_for_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue_on_commit(record_call, {'value': 1})
+            self.assertFalse(Job.objects.exists())
+        for callback in callbacks:
+            callback()
+        queued = Job.objects.get()
+        self.assertEqual((queued.name, queued.kwargs, queued.status), ('tests.record', {'value': 1}, Job.Status.QUEUED))
+
+        with self.assertRaises(ValueError):
+            enqueue(lambda: None)
+
+    def test_idempotency_key(self):
+        first = enqueue(record_call, {'value': 1}, idempotency_key='record:1')
+        second = enqueue(record_call, {'value': 2}, idempotency_key='record:1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(jobqueue.work(until_empty=True), (1, 0))
+        self.assertEqual(recorded_calls, [1])
+        # Still taken once the job has run
+        enqueue(record_call, {'value': 3}, idempotency_key='record:1')
+        self.assertEqual(Job.objects.count(), 1)
+
+    @override_settings(JOBS_BATCH_SIZE=2)
+    def test_highest_priority_runs_first(self):
+        enqueue(record_call, {'value': 'low'}, priority=LOW)
+        enqueue(record_call, {'value': 'normal'})
+        enqueue(record_call, {'value': 'later'}, priority=HIGH, delay=60)
+        enqueue(record_call, {'value': 'high'}, priority=HIGH)
+        enqueue(record_call, {'value': 'normal again'})
+
+        self.assertEqual(jobqueue.work(until_empty=True), (4, 0))
+        self.assertEqual(recorded_calls, ['high', 'normal', 'normal again', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.Status.DONE).count(), 4)
+        self.assertEqual(Job.objects.get(status=Job.Status.QUEUED).kwargs, {'value': 'later'})
+
+    @override_settings(JOBS_RETRY_BACKOFF=30)
+    def test_failures_retry_with_backoff_then_fail(self):
+        queued = enqueue(always_fail)
+        with self.assertLogs('tasks.jobqueue', 'WARNING'):
+            self.assertEqual(jobqueue.work(until_empty=True), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.Status.QUEUED, 1))
+        self.assertIn('Upstream unavailable', queued.last_error)
+        delay = (queued.run_at - timezone.now()).total_seconds()
+        self.assertTrue(10 < delay <= 30, delay)
+
+        # Not due yet
+        self.assertEqual(jobqueue.work(until_empty=True), (0, 0))
+        Job.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        with self.assertLogs('tasks.jobqueue', 'ERROR'):
+            self.assertEqual(jobqueue.work(until_empty=True), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.Status.FAILED, 2))
+        self.assertIsNotNone(queued.finished_at)
+
+    @override_settings(JOBS_LOCK_TIMEOUT=60)
+    def test_jobs_of_dead_workers_are_queued_again(self):
+        retried = enqueue(record_call, {'value': 1})
+        exhausted = enqueue(always_fail)
+        Job.objects.filter(pk=exhausted.pk).update(attempts=1)
+        self.assertEqual(len(jobqueue.claim('dead-worker', 10)), 2)
+        self.assertEqual(jobqueue.requeue_stale(), 0)
+
+        Job.objects.update(locked_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobqueue.requeue_stale(), 1)
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual((retried.status, retried.locked_by, retried.attempts), (Job.Status.QUEUED, '', 1))
+        self.assertEqual(exhausted.status, Job.Status.FAILED)
+        self.assertEqual(jobqueue.work(until_empty=True), (1, 0))
+
+    @override_settings(REPORT_ATTACHMENT_THUMBNAIL_SIZE=100)
+    def test_report_attachment_thumbnail_after_the_request(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        image = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(image, format='JPEG')
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        task = self.create_task()
+
+        with self.settings(MEDIA_ROOT=media_root):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api.post('/api/task-reports/', {
+                    'task': task.id, 'submitted_by': self.client_user.id, 'report_text': 'Done',
+                    'attachments': SimpleUploadedFile('site.jpg', image.getvalue(), content_type='image/jpeg'),
+                }, format='multipart')
+            self.assertEqual(response.status_code, 201)
+            report = TaskReport.objects.get()
+            original = report.attachments.name
+            self.assertEqual(Job.objects.get().kwargs, {'report_id': report.id, 'name': original})
+
+            self.assertEqual(jobqueue.work(until_empty=True), (1, 0))
+            report.refresh_from_db()
+            # The evidence is kept as uploaded
+            self.assertEqual(report.attachments.name, original)
+            with report.attachments.open('rb') as attachment:
+                self.assertEqual(attachment.read(), image.getvalue())
+            with report.attachment_thumbnail.open('rb'), Image.open(report.attachment_thumbnail) as thumbnail:
+                self.assertEqual(thumbnail.size, (100, 50))
+
+            # A file that is not an image gets no thumbnail, and the earlier one goes
+            thumbnail = report.attachment_thumbnail.name
+            api.force_authenticate(self.admin)
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api.patch(f'/api/task-reports/{report.id}/', {
+                    'attachments': SimpleUploadedFile('site.pdf', b'%PDF-1.4', content_type='application/pdf'),
+                }, format='multipart')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(jobqueue.work(until_empty=True), (1, 0))
+            report.refresh_from_db()
+            self.assertFalse(report.attachment_thumbnail)
+            self.assertFalse(report.attachments.storage.exists(thumbnail))
+
+
+class OverdueTest(TaskFixturesMixin, TestCase):
+    """Task.overdue is kept by save and the sweeper, and drives ?overdue= and the dashboards"""
+
+    def setUp(self):
+        # Writes in a test never commit, so they do not move the dashboard data version
+        dashboard_cache.get_cache().clear()
+        self.api = APIClient()
+        self.api.force_authenticate(self.admin)
+
+    def test_save_sets_and_clears_the_flag(self):
+        task = self.create_task(deadline=timezone.now() - timedelta(hours=1))
+        self.assertTrue(Task.objects.get(pk=task.pk).overdue)
+
+        task.status = Task.Status.COMPLETED
+        task.save(update_fields=['status'])
+        self.assertFalse(Task.objects.get(pk=task.pk).overdue)
+
+        self.assertFalse(self.create_task().overdue)
+
+    def test_bulk_transitions_recompute_the_flag(self):
+        late = self.create_task(status=Task.Status.COMPLETED, deadline=timezone.now() - timedelta(days=1))
+        on_time = self.create_task(status=Task.Status.COMPLETED)
+        self.assertFalse(Task.objects.filter(overdue=True).exists())
+
+        response = self.api.post(
+            '/api/tasks/bulk_transition/', {'action': 'reject_task', 'ids': [late.id, on_time.id]}, format='json',
+        )
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(list(Task.objects.filter(overdue=True).values_list('id', flat=True)), [late.id])
+
+        Task.objects.filter(id=late.id).update(status=Task.Status.COMPLETED)
+        self.api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': [late.id]}, format='json')
+        self.assertFalse(Task.objects.get(pk=late.pk).overdue)
+
+    def test_sweep_flags_tasks_whose_deadline_passed(self):
+        due = [self.create_task(title=f'Due {index}') for index in range(5)]
+        done = self.create_task(status=Task.Status.APPROVED)
+        later = self.create_task(deadline=timezone.now() + timedelta(days=30))
+        now = timezone.now() + timedelta(days=7)
+        version = dashboard_cache.get_data_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(sweep_overdue(now=now, batch_size=2), (5, 0))
+        flagged = Task.objects.filter(overdue=True)
+        self.assertEqual(set(flagged.values_list('id', flat=True)), {task.id for task in due})
+        # The sweep is not an edit: updated_at keeps the tasks' place in the recent activity lists
+        self.assertEqual(
+            dict(flagged.values_list('id', 'updated_at')), {task.id: task.updated_at for task in due},
+        )
+        self.assertGreater(dashboard_cache.get_data_version(), version)
+        self.assertFalse(Task.objects.get(pk=done.pk).overdue)
+        self.assertFalse(Task.objects.get(pk=later.pk).overdue)
+        # Nothing left to do
+        self.assertEqual(sweep_overdue(now=now), (0, 0))
+
+    def test_sweep_events_reach_other_processes_through_the_database_broker(self):
+        task = self.create_task()
+        with mock.patch('tasks.signals.broker', DatabaseEventBroker(poll_interval=0)):
+            with self.captureOnCommitCallbacks(execute=True):
+                sweep_overdue(now=timezone.now() + timedelta(days=7))
+        row = PublishedEvent.objects.get()
+        self.assertEqual((row.type, row.data['task_id'], row.data['overdue']), ('task.overdue', task.id, True))
+        self.assertEqual((row.location_ids, row.user_ids), ([self.location.id], [self.client_user.id]))
+
+    def test_sweep_clears_tasks_finished_in_bulk(self):
+        task = self.create_task(status=Task.Status.COMPLETED, deadline=timezone.now() - timedelta(days=1))
+        Task.objects.filter(pk=task.pk).update(status=Task.Status.APPROVED, overdue=True)
+        moved = self.create_task(deadline=timezone.now() - timedelta(days=1))
+        Task.objects.filter(pk=moved.pk).update(deadline=timezone.now() + timedelta(days=1))
+
+        self.assertEqual(sweep_overdue(), (0, 2))
+        self.assertFalse(Task.objects.filter(overdue=True).exists())
+
+    def test_sweep_command(self):
+        self.create_task(deadline=timezone.now() - timedelta(days=1))
+        Task.objects.update(overdue=False)
+        out = StringIO()
+        call_command('sweep_overdue_tasks', stdout=out)
+        self.assertTrue(Task.objects.get().overdue)
+        self.assertIn('Flagged 1 overdue tasks', out.getvalue())
+
+    def test_list_filters_on_overdue(self):
+        overdue = self.create_task(deadline=timezone.now() - timedelta(days=1))
+        on_time = self.create_task()
+
+        response = self.api.get('/api/tasks/?overdue=true')
+        self.assertEqual([task['id'] for task in response.data['results']], [overdue.id])
+        self.assertTrue(response.data['results'][0]['is_overdue'])
+        response = self.api.get('/api/tasks/?overdue=false')
+        self.assertEqual([task['id'] for task in response.data['results']], [on_time.id])
+        self.assertEqual(self.api.get('/api/tasks/?overdue=maybe').status_code, 400)
+
+    def test_dashboards_count_overdue_tasks(self):
+        self.create_task(deadline=timezone.now() - timedelta(days=1))
+        self.create_task(deadline=timezone.now() - timedelta(days=2))
+        self.create_task()
+
+        admin_dashboard = self.api.get('/api/dashboard/admin/').data
+        self.assertEqual(admin_dashboard['overdue_tasks'], 2)
+        self.assertEqual(admin_dashboard['overdue_by_client'], [
+            {'client_id': self.client_user.id, 'client': 'tnclient1', 'overdue_count': 2},
+        ])
+        self.api.force_authenticate(self.client_user)
+        self.assertEqual(self.api.get('/api/dashboard/client/').data['overdue_tasks'], 2)
+        self.api.force_authenticate(self.superadmin)
+        superadmin_dashboard = self.api.get('/api/dashboard/superadmin/').data
+        self.assertEqual(superadmin_dashboard['overdue_tasks'], 2)
+        by_location = {row['name']: row['overdue_count'] for row in superadmin_dashboard['locations']}
+        self.assertEqual(by_location[Location.StateName.TAMIL_NADU], 2)
+
+
+class DeadlineStatsTest(TaskFixturesMixin, TestCase):
+    """The daily task stats follow Task writes and back the completion rates and days left"""
+
+    def setUp(self):
+        # Writes in a test never commit, so they do not move the dashboard data version
+        dashboard_cache.get_cache().clear()
+
+    def due_on(self, day, **kwargs):
+        return self.create_task(deadline=timezone.make_aware(datetime.combine(day, datetime.min.time())), **kwargs)
+
+    def daily_stats(self, day):
+        return LocationDailyTaskStats.objects.get(location=self.location, day=day)
+
+    def test_writes_move_the_task_between_days(self):
+        task = self.due_on(date(2026, 11, 18))
+        self.assertEqual(self.daily_stats(date(2026, 11, 18)).pending, 1)
+
+        task.deadline += timedelta(days=2)
+        task.status = Task.Status.COMPLETED
+        task.save()
+        self.assertEqual(self.daily_stats(date(2026, 11, 18)).total, 0)
+        self.assertEqual(self.daily_stats(date(2026, 11, 20)).completed, 1)
+        # The status counters only saw the status change
+        self.assertEqual(LocationTaskStats.objects.get(location=self.location).total, 1)
+
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        api.post('/api/tasks/bulk_transition/', {'action': 'approve_task', 'ids': [task.id]}, format='json')
+        self.assertEqual(self.daily_stats(date(2026, 11, 20)).approved, 1)
+
+        task.refresh_from_db()
+        task.delete()
+        self.assertEqual(self.daily_stats(date(2026, 11, 20)).total, 0)
+
+    def test_rebuild_task_stats_fixes_daily_drift(self):
+        self.due_on(date(2026, 11, 18))
+        Task.objects.update(deadline=timezone.make_aware(datetime(2026, 11, 19, 9)))  # Bypasses Task.save
+
+        out = StringIO()
+        call_command('rebuild_task_stats', stdout=out)
+        self.assertIn(f'LocationDailyTaskStats location_id={self.location.id} day=2026-11-19: pending 0 -> 1', out.getvalue())
+        self.assertEqual(self.daily_stats(date(2026, 11, 18)).total, 0)
+        self.assertEqual(self.daily_stats(date(2026, 11, 19)).pending, 1)
+
+    def test_completion_windows(self):
+        windows = LocationDailyTaskStats.completion_windows(date(2026, 11, 18))
+        self.assertEqual(windows, {
+            'this_week': (date(2026, 11, 16), date(2026, 11, 22)),
+            'this_month': (date(2026, 11, 1), date(2026, 11, 30)),
+            'this_quarter': (date(2026, 10, 1), date(2026, 12, 31)),
+            'this_year': (date(2026, 1, 1), date(2026, 12, 31)),
+        })
+        windows = LocationDailyTaskStats.completion_windows(date(2026, 12, 31))
+        self.assertEqual(windows['this_week'], (date(2026, 12, 28), date(2027, 1, 3)))
+        self.assertEqual(windows['this_month'], (date(2026, 12, 1), date(2026, 12, 31)))
+
+    def test_completion_rates_in_one_query(self):
+        self.due_on(date(2026, 11, 17), status=Task.Status.APPROVED)
+        self.due_on(date(2026, 11, 19))
+        self.due_on(date(2026, 11, 3), status=Task.Status.COMPLETED)
+        self.due_on(date(2026, 10, 5), status=Task.Status.REJECTED)
+        self.due_on(date(2026, 3, 1), status=Task.Status.APPROVED)
+        self.due_on(date(2025, 12, 31), status=Task.Status.APPROVED)
+        self.due_on(date(2026, 11, 18), location=self.other_location)
+
+        with self.assertNumQueries(1):
+            rows = {row['location_id']: row for row in LocationDailyTaskStats.completion(date(2026, 11, 18))}
+        self.assertEqual(LocationDailyTaskStats.completion_rates(rows[self.location.id]), {
+            'this_week': 0.5, 'this_month': 0.67, 'this_quarter': 0.5, 'this_year': 0.6,
+        })
+        self.assertEqual(LocationDailyTaskStats.completion_rates(rows[self.other_location.id])['this_week'], 0.0)
+        self.assertEqual(set(LocationDailyTaskStats.completion_rates(None).values()), {0})
+
+    def test_dashboards_show_completion_rates(self):
+        today = timezone.localdate()
+        self.due_on(today, status=Task.Status.COMPLETED)
+        self.due_on(today)
+
+        api = APIClient()
+        api.force_authenticate(self.admin)
+        completion = api.get('/api/dashboard/admin/').data['task_completion']
+        self.assertEqual(completion, {'this_week': 0.5, 'this_month': 0.5, 'this_quarter': 0.5, 'this_year': 0.5})
+
+        api.force_authenticate(self.superadmin)
+        locations = {row['code']: row for row in api.get('/api/dashboard/superadmin/').data['locations']}
+        self.assertEqual(locations[Location.StateName.TAMIL_NADU]['task_completion']['this_week'], 0.5)
+        self.assertEqual(locations[Location.StateName.ODISHA]['task_completion']['this_week'], 0)
+
+    def test_client_dashboard_days_left(self):
+        now = timezone.now()
+        overdue = self.create_task(deadline=now - timedelta(days=2))
+        soon = self.create_task(deadline=now + timedelta(days=1))
+        later = self.create_task(deadline=now + timedelta(days=4))
+
+        api = APIClient()
+        api.force_authenticate(self.client_user)
+        deadlines = api.get('/api/dashboard/client/').data['upcoming_deadlines']
+        self.assertEqual(deadlines, [
+            {'task_id': overdue.id, 'days_left': -2, 'is_urgent': True},
+            {'task_id': soon.id, 'days_left': 1, 'is_urgent': True},
+            {'task_id': later.id, 'days_left': 4, 'is_urgent': False},
+        ])
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import TaskViewSet, TaskReportViewSet
+from .views import TaskViewSet, TaskReportViewSet, EventStreamView
 
 router = DefaultRouter()
 router.register(r'tasks', TaskViewSet)
@@ -8,4 +8,5 @@ router.register(r'task-reports', TaskReportViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('events/stream/', EventStreamView.as_view(), name='event_stream'),
 ] 
\ No newline at end of file
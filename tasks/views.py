@@ -1,17 +1,56 @@
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, permissions, status, serializers, views
 from rest_framework.decorators import action
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q
-from .models import Task, TaskReport
-from .serializers import TaskSerializer, TaskReportSerializer, TaskDetailSerializer
+from django.db.models import Q, Count, Max, Sum, Prefetch, Case, When
+from .models import Task, TaskReport, TaskStatusCounters
+from .conditional import ConditionalGetMixin
+from .exports import (
+    TASK_EXPORT_COLUMNS, REPORT_EXPORT_COLUMNS, export_response, filter_export_queryset, task_export_rows,
+)
+from .pagination import TaskPagination, TaskReportPagination
+from .serializers import TaskSerializer, TaskReportSerializer, TaskDetailSerializer, TaskBulkItemSerializer
+from .signals import tasks_bulk_changed
+from . import events, metrics
+from accounts.access import get_access
+from accounts.mixins import EagerLoadingMixin, AsyncDispatchMixin
 from accounts.views import IsAdminOrSuperAdmin
 
-class TaskViewSet(viewsets.ModelViewSet):
+# Status actions that bulk_transition can apply: action -> (target status, required current status)
+BULK_TRANSITIONS = {
+    'mark_in_progress': (Task.Status.IN_PROGRESS, None),
+    'mark_completed': (Task.Status.COMPLETED, None),
+    'approve_task': (Task.Status.APPROVED, Task.Status.COMPLETED),
+    'reject_task': (Task.Status.REJECTED, Task.Status.COMPLETED),
+}
+
+# Accepted values of ?overdue=
+OVERDUE_VALUES = {'true': True, '1': True, 'false': False, '0': False}
+
+
+class TaskViewSet(AsyncDispatchMixin, EagerLoadingMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """API viewset for managing tasks"""
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    pagination_class = TaskPagination
+    eager_loading = {
+        'default': {
+            'select_related': ('assigned_by', 'assigned_to', 'location'),
+        },
+        'retrieve': {
+            'select_related': ('assigned_by', 'assigned_to', 'location'),
+            # TaskDetailSerializer nests the reports together with their users
+            'prefetch_related': (
+                Prefetch('reports', queryset=TaskReport.objects.select_related('submitted_by', 'reviewed_by')),
+            ),
+        },
+    }
     
     def get_serializer_class(self):
         """Return detailed serializer for retrieve action"""
@@ -19,49 +58,65 @@ class TaskViewSet(viewsets.ModelViewSet):
             return TaskDetailSerializer
         return TaskSerializer
     
+    def get_conditional_aggregates(self):
+        """Task details embed the reports, so their changes must change the ETag too"""
+        aggregates = super().get_conditional_aggregates()
+        # The overdue sweep flips the flag without touching updated_at
+        aggregates['overdue_ids'] = Sum('pk', filter=Q(overdue=True), distinct=True)
+        if self.action == 'retrieve':
+            aggregates['reports_modified'] = Max('reports__updated_at')
+            aggregates['report_count'] = Count('reports', distinct=True)
+        return aggregates
+    
     def get_permissions(self):
         """
         SuperAdmin can perform any action.
         Admin can create, update, and view tasks.
         Client can only view assigned tasks and update their status.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'bulk']:
             permission_classes = [IsAdminOrSuperAdmin]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        """Filter queryset based on user role and assigned location"""
-        user = self.request.user
-        if user.is_superadmin():
-            return Task.objects.all()
-        elif user.is_admin():
-            # Admin can only see tasks within their assigned location
-            try:
-                admin_location = user.assigned_location
-                return Task.objects.filter(location=admin_location.location)
-            except:
-                # If admin has no assigned location, show nothing
-                return Task.objects.none()
-        else:
-            # Client can only see tasks assigned to them
-            return Task.objects.filter(assigned_to=user)
+        """
+        SuperAdmins see every task, admins the tasks in their assigned location
+        (none without one), and clients the tasks assigned to them.
+        """
+        return get_access(self.request).tasks()
+    
+    def filter_queryset(self, queryset):
+        """?overdue=true|false on the listing, read from the stored Task.overdue flag"""
+        queryset = super().filter_queryset(queryset)
+        overdue = self.request.query_params.get('overdue')
+        if self.action == 'list' and overdue:
+            if overdue.lower() not in OVERDUE_VALUES:
+                raise serializers.ValidationError({'overdue': ["Expected true or false."]})
+            queryset = queryset.filter(overdue=OVERDUE_VALUES[overdue.lower()])
+        return queryset
     
     def perform_create(self, serializer):
         """Set assigned_by to current user and validate location"""
-        user = self.request.user
-        if user.is_admin():
+        access = get_access(self.request)
+        if access.is_admin():
             # Make sure admin creates tasks only for their location
-            try:
-                admin_location = user.assigned_location
-                location = serializer.validated_data.get('location')
-                if location != admin_location.location:
-                    raise serializers.ValidationError("You can only create tasks for your assigned location.")
-            except:
+            if access.location_id is None:
                 raise serializers.ValidationError("You don't have an assigned location.")
+            location = serializer.validated_data.get('location')
+            if location is None or location.id != access.location_id:
+                raise serializers.ValidationError("You can only create tasks for your assigned location.")
                 
-        serializer.save(assigned_by=self.request.user)
+        task = serializer.save(assigned_by=self.request.user)
+        metrics.record_created([task])
+    
+    def perform_update(self, serializer):
+        """Save the task and count a status change made through the edit form"""
+        previous_status = serializer.instance.status
+        task = serializer.save()
+        if task.status != previous_status:
+            metrics.record_transition(task, task.status)
     
     @action(detail=True, methods=['post'])
     def mark_in_progress(self, request, pk=None):
@@ -72,6 +127,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         task.status = Task.Status.IN_PROGRESS
         task.save()
+        metrics.record_transition(task, task.status)
         serializer = self.get_serializer(task)
         return Response(serializer.data)
     
@@ -85,6 +141,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         task.status = Task.Status.COMPLETED
         task.completed_at = timezone.now()
         task.save()
+        metrics.record_transition(task, task.status)
         serializer = self.get_serializer(task)
         return Response(serializer.data)
     
@@ -100,6 +157,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         task.status = Task.Status.APPROVED
         task.save()
+        metrics.record_transition(task, task.status)
         serializer = self.get_serializer(task)
         return Response(serializer.data)
     
@@ -115,13 +173,168 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         task.status = Task.Status.REJECTED
         task.save()
+        metrics.record_transition(task, task.status)
         serializer = self.get_serializer(task)
         return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create many tasks in one request.
+        Accepts a list of tasks, or {"tasks": [...], "allow_partial": true} to create the
+        valid items even when others fail. Items are validated as a batch and written
+        with bulk_create in chunks inside one transaction.
+        """
+        data = request.data
+        items = data.get('tasks') if isinstance(data, dict) else data
+        allow_partial = isinstance(data, dict) and bool(data.get('allow_partial'))
+        if not isinstance(items, list) or not items:
+            return Response({"detail": "Expected a non-empty list of tasks."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_TASKS_MAX_ITEMS:
+            return Response({"detail": f"At most {settings.BULK_TASKS_MAX_ITEMS} tasks per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        user = request.user
+        access = get_access(request)
+        admin_location_id = None
+        if access.is_admin():
+            admin_location_id = access.location_id
+            if admin_location_id is None:
+                return Response({"detail": "You don't have an assigned location."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        context = self.get_serializer_context()
+        context['preloaded'] = TaskBulkItemSerializer.preload(items)
+        # One serializer validates every item, like ListSerializer does, so fields are built once
+        item_serializer = TaskBulkItemSerializer(context=context)
+        tasks = []
+        errors = []
+        for index, item in enumerate(items):
+            try:
+                validated_data = item_serializer.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+                continue
+            if admin_location_id is not None and validated_data['location'].id != admin_location_id:
+                errors.append({'index': index, 'errors': {
+                    'location': ["You can only create tasks for your assigned location."]
+                }})
+            else:
+                task = Task(assigned_by=user, **validated_data)
+                # bulk_create skips Task.save
+                task.overdue = task.is_overdue()
+                tasks.append(task)
+        
+        if errors and (not allow_partial or not tasks):
+            return Response({'created': 0, 'ids': [], 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            created = Task.objects.bulk_create(tasks, batch_size=settings.BULK_TASKS_BATCH_SIZE)
+            TaskStatusCounters.apply_changes([(task.stats_values(), 1) for task in created])
+            tasks_bulk_changed.send(sender=Task, action='bulk', ids=[task.pk for task in created])
+        metrics.record_created(created)
+        
+        return Response({
+            'created': len(created),
+            'ids': [task.pk for task in created],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_transition(self, request):
+        """
+        Apply a status action to many tasks: {"action": "approve_task", "ids": [...]}.
+        Each task is checked like the single-task action; the eligible ones are moved
+        with one UPDATE and the rest are reported per item.
+        """
+        transition = request.data.get('action')
+        ids = request.data.get('ids')
+        if transition not in BULK_TRANSITIONS:
+            return Response({"detail": f"action must be one of {', '.join(BULK_TRANSITIONS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(ids, list) or not ids:
+            return Response({"detail": "Expected a non-empty list of ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > settings.BULK_TASKS_MAX_ITEMS:
+            return Response({"detail": f"At most {settings.BULK_TASKS_MAX_ITEMS} ids per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        user = request.user
+        is_manager = get_access(request).is_manager()
+        target_status, required_status = BULK_TRANSITIONS[transition]
+        if required_status and not is_manager:
+            return Response({"detail": "Not authorized."}, status=status.HTTP_403_FORBIDDEN)
+        
+        errors = []
+        task_ids = []
+        for index, task_id in enumerate(ids):
+            try:
+                task_ids.append((index, int(task_id)))
+            except (TypeError, ValueError):
+                errors.append({'index': index, 'id': task_id, 'detail': "Invalid id."})
+        
+        with transaction.atomic():
+            rows = {
+                row['id']: row for row in self.get_queryset().select_for_update()
+                .filter(id__in=[task_id for _, task_id in task_ids])
+                .values('id', 'created_at', *Task.STATS_FIELDS)
+            }
+            eligible = {}
+            for index, task_id in task_ids:
+                row = rows.get(task_id)
+                if row is None:
+                    errors.append({'index': index, 'id': task_id, 'detail': "Not found."})
+                elif row['assigned_to_id'] != user.id and (transition == 'mark_completed' or not is_manager):
+                    errors.append({'index': index, 'id': task_id, 'detail': "Not authorized."})
+                elif required_status and row['status'] != required_status:
+                    errors.append({'index': index, 'id': task_id, 'detail': "Task is not completed yet."})
+                else:
+                    eligible[task_id] = row
+            
+            now = timezone.now()
+            updates = {'status': target_status, 'updated_at': now}
+            if target_status == Task.Status.COMPLETED:
+                updates['completed_at'] = now
+            # As Task.save does with is_overdue()
+            if target_status in Task.DONE_STATUSES:
+                updates['overdue'] = False
+            else:
+                updates['overdue'] = Case(When(deadline__lt=now, then=True), default=False)
+            Task.objects.filter(id__in=list(eligible)).update(**updates)
+            
+            TaskStatusCounters.apply_changes(
+                [(row, -1) for row in eligible.values()]
+                + [({**row, 'status': target_status}, 1) for row in eligible.values()]
+            )
+            tasks_bulk_changed.send(sender=Task, action=transition, ids=list(eligible))
+        metrics.record_transitions(
+            [{**row, 'completed_at': updates.get('completed_at')} for row in eligible.values()], target_status
+        )
+        
+        return Response({
+            'updated': len(eligible),
+            'ids': list(eligible),
+            'errors': errors,
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every task visible to the user as CSV or NDJSON (?output=ndjson).
+        Filters: status (comma separated), group_id, and date_from/date_to on created_at.
+        """
+        queryset = filter_export_queryset(self.get_queryset(), request.query_params, '', 'created_at')
+        queryset = task_export_rows(queryset).order_by('-created_at', '-id')
+        return export_response(request, queryset, TASK_EXPORT_COLUMNS, request.query_params.get('output', 'csv'), 'tasks')
 
-class TaskReportViewSet(viewsets.ModelViewSet):
+class TaskReportViewSet(EagerLoadingMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """API viewset for managing task reports"""
     queryset = TaskReport.objects.all()
     serializer_class = TaskReportSerializer
+    pagination_class = TaskReportPagination
+    eager_loading = {
+        'default': {
+            'select_related': ('task', 'submitted_by', 'reviewed_by'),
+        },
+    }
     
     def get_permissions(self):
         """
@@ -135,26 +348,28 @@ class TaskReportViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        """Filter queryset based on user role and assigned location"""
-        user = self.request.user
-        if user.is_superadmin():
-            return TaskReport.objects.all()
-        elif user.is_admin():
-            # Admin can only see reports for tasks within their assigned location
-            try:
-                admin_location = user.assigned_location
-                return TaskReport.objects.filter(task__location=admin_location.location)
-            except:
-                # If admin has no assigned location, show nothing
-                return TaskReport.objects.none()
-        else:
-            # Client can only see reports they submitted
-            return TaskReport.objects.filter(submitted_by=user)
+        """
+        SuperAdmins see every report, admins the reports on tasks in their assigned
+        location (none without one), and clients the reports they submitted.
+        """
+        return get_access(self.request).reports()
     
     def perform_create(self, serializer):
         """Set submitted_by to current user"""
         serializer.save(submitted_by=self.request.user)
     
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every report visible to the user, with its review state, as CSV or NDJSON.
+        Filters: status and group_id of the task, and date_from/date_to on submitted_at.
+        """
+        queryset = filter_export_queryset(self.get_queryset(), request.query_params, 'task__', 'submitted_at')
+        queryset = queryset.order_by('-submitted_at', '-id')
+        return export_response(
+            request, queryset, REPORT_EXPORT_COLUMNS, request.query_params.get('output', 'csv'), 'task-reports',
+        )
+    
     @action(detail=True, methods=['post'])
     def review_report(self, request, pk=None):
         """Review a task report"""
@@ -169,6 +384,7 @@ class TaskReportViewSet(viewsets.ModelViewSet):
         report.reviewed_at = timezone.now()
         report.feedback = feedback
         report.save()
+        metrics.record_review(report)
         
         # Update task status based on approval
         task = report.task
@@ -177,6 +393,37 @@ class TaskReportViewSet(viewsets.ModelViewSet):
         else:
             task.status = Task.Status.REJECTED
         task.save()
+        metrics.record_transition(task, task.status)
         
         serializer = self.get_serializer(report)
         return Response(serializer.data)
+
+class EventStreamRenderer(JSONRenderer):
+    """Lets EventSource clients (Accept: text/event-stream) through content negotiation; errors stay JSON"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+class EventStreamView(views.APIView):
+    """
+    Server-Sent Events stream of the task and report changes the user may see
+    (see tasks.events). Send the Last-Event-ID header, or ?last_event_id=, to resume.
+    Only the ASGI application (adminportal.asgi) serves it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+    
+    def get(self, request):
+        if not isinstance(request._request, ASGIRequest):
+            # A WSGI worker would be held for the whole connection
+            return Response({"detail": "The event stream is only served over ASGI."},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        key = events.scope_key(get_access(request))
+        if key is None:
+            return Response({"detail": "You don't have an assigned location."}, status=status.HTTP_403_FORBIDDEN)
+        
+        last_event_id = request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        response = StreamingHttpResponse(events.event_stream(key, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response